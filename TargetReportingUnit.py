@@ -1,17 +1,22 @@
 import math
-import random
 
 from mesa import Agent
 from sensor import Sensor
+from swarm_modes import EstimateSource
 from target_agent import TargetAgent
 
 
 class TargetReportingUnit(Agent):
     """
     A fixed agent that acts as a target reporting unit.
-    It periodically senses the target and updates its latest estimate.
+    It periodically senses the target, updates its latest estimate and publishes it to the
+    model's estimate store (see estimate_store.py).
+
+    With tracking, the sweeps feed Kalman filter tracks (see tracking.py) and the latest
+    estimate is the best track, a TrackEstimate with velocity, which is kept (coasting)
+    through missed detections until the track goes stale.
     """
-    def __init__(self, model, pos, direction, speed=0): # TRU is stationary, speed is 0
+    def __init__(self, model, pos, direction, speed=0, update_interval=5, tracking=False): # TRU is stationary, speed is 0
         super().__init__(model)
         self.direction = direction if direction is not None else (1, 0) # Direction might be used for FOV orientation
         self.speed = speed
@@ -19,10 +24,16 @@ class TargetReportingUnit(Agent):
 
         # The TRU's sensor capability
         self.sensor = Sensor(range=150, field_of_view_deg=180, noise_std=0.7) # Wider FOV, less noise
+        self.sensor_random = model.random_stream('TRU sensor', self.unique_id)
 
         # How often the TRU updates its estimate
-        self.update_interval = 5 # Update every 5 steps
-        self.last_update_step = -self.update_interval
+        self.update_interval = update_interval # In time units (steps at dt=1)
+        self.last_update_time = -self.update_interval
+
+        self.tracker = None
+        if tracking:
+            from tracking import TrackManager # Deferred: pulls in NumPy
+            self.tracker = TrackManager(measurement_std=self.sensor.noise_std)
 
         print(f"TRU {self.unique_id} initialized with sensor range {self.sensor.range}.")
 
@@ -46,10 +57,10 @@ class TargetReportingUnit(Agent):
             self.latest_estimate = None
             return
 
-        if self.model.steps - self.last_update_step >= self.update_interval:
+        if self.model.interval_elapsed(self.last_update_time, self.update_interval):
             # Run the sensor detection
             detected, noisy_relative_pos = self.sensor.run_detection(
-                self.pos, self.direction, target.pos
+                self.pos, self.direction, target.pos, rng=self.sensor_random
             )
 
             if detected:
@@ -61,6 +72,17 @@ class TargetReportingUnit(Agent):
             else:
                 self.latest_estimate = None # Lost sight of target
                 print(f"TRU {self.unique_id}: Target out of sensor range or FOV. No estimate.")
-            
-            self.last_update_step = self.model.steps
+
+            if self.tracker is not None:
+                measurements = [self.latest_estimate] if detected else []
+                self.tracker.update(self.model.sim_time, measurements)
+                tracks = self.tracker.estimates()
+                self.latest_estimate = tracks[0] if tracks else None
+                if tracks:
+                    print(f"TRU {self.unique_id}: Track at {tracks[0].position}, velocity {tracks[0].velocity}.")
+
+            if self.latest_estimate is not None:
+                self.model.estimate_store.publish(self.latest_estimate, EstimateSource.TRU, self.unique_id,
+                                                  self.model.sim_time)
+            self.last_update_time = self.model.sim_time
 
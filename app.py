@@ -1,16 +1,14 @@
+import math
 import threading
 import time
 import traceback
 
-import matplotlib.pyplot as plt
+import numpy as np
 import solara
+import solara.lab
 
-from missile_rl_agent import MissileRLAgent
-from base_agent import MissileAgent
-from target_agent import TargetAgent
-from model import NavalModel, SwarmMode
-from TargetReportingUnit import TargetReportingUnit
-from swarm_modes import MissileType # Import MissileType to check agent role
+from model import SwarmMode
+from session_pool import PoolFull, SessionClosed, SessionPool, thin_trail
 
 # --- Configuration ---
 WIDTH = 250
@@ -18,70 +16,233 @@ HEIGHT = 60
 NUM_MISSILES = 25 # Increased for better group visibility in Recce Mode
 LAUNCH_INTERVAL = 10
 
+# Every browser session runs its own model in a shared pool of worker processes (see session_pool.py)
+POOL_WORKERS = None # One per CPU
+MAX_SESSIONS = 8 # Further sessions are turned away until one closes or goes idle
+IDLE_TIMEOUT = 900 # Seconds after which an unused session's model is freed
+
+# Level of detail of the live view (see MissileGrid), so that a frame costs about the same however large the swarm
+TRAIL_BUDGET = 4000 # Most trail points drawn in a frame; beyond it every trail is thinned
+MIN_TRAIL_SPACING_PX = 3 # Trail points are thinned to about this far apart on screen
+DENSITY_THRESHOLD = 300 # Above this many missiles in view, a density raster replaces markers and trails
+DENSITY_BIN_PX = 8 # Side of a density raster bin, in pixels
+MAX_ZOOM = 8
+
 # --- Solara Reactive States ---
-step_count = solara.reactive(0)
-# This is where we define the model with the initial parameters
-# This is where the swarm mode is set
-# See seven lines below e.g. swarm_mode=SwarmMode.SPLIT_AXIS
-model = solara.reactive(
-    NavalModel(
-        width=WIDTH,
-        height=HEIGHT,
-        num_missiles=NUM_MISSILES,
-        launch_interval=LAUNCH_INTERVAL,
-        swarm_mode=SwarmMode.WAVE # Change to SwarmMode.RECCE for Recce Mode or any other mode you want to test
-    )
-)
+# These are kept per browser session (Solara kernel).
+# The model is opened on first render rather than at import, so importing this
+# module (or starting the server) does not pay for a full NavalModel.
+session = solara.reactive(None) # session_pool.Session holding this browser session's model
+view = solara.reactive(None) # Latest snapshot of the model (session_pool.snapshot)
+pool_message = solara.reactive("") # Why no model could be opened, if the pool is full
 running = solara.reactive(False)
 speed_slider = solara.reactive(0.5)
-selected_mode = solara.reactive(SwarmMode.WAVE.name)
+zoom = solara.reactive(1) # Magnification of the live view
+view_centre = solara.reactive(WIDTH // 2) # x at the middle of the live view when zoomed in
+show_trails = solara.reactive(True)
+selected_mode = solara.reactive(SwarmMode.WAVE.name) # Change to SwarmMode.RECCE.name for Recce Mode or any other mode you want to test
+
+# Heatmaps saved by heatmaps.py, shown below the live simulation
+heatmap_path = solara.reactive("")
+heatmap_layer = solara.reactive("hit")
+
+grid_width = WIDTH
+grid_height = HEIGHT
+
+_pool = None
+_pool_lock = threading.Lock()
+_kernel_sessions = {} # Solara kernel id -> its Session, closed when the kernel shuts down
+
+
+def session_pool():
+    """The server's SessionPool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionPool(
+                workers=POOL_WORKERS,
+                max_sessions=MAX_SESSIONS,
+                idle_timeout=IDLE_TIMEOUT,
+                width=WIDTH,
+                height=HEIGHT,
+                num_missiles=NUM_MISSILES,
+                launch_interval=LAUNCH_INTERVAL,
+                trail_budget=TRAIL_BUDGET, # What the workers send back each step is bounded too
+                culling=True # Missiles that can no longer hit are retired instead of flown until their fuel runs out
+            )
+        return _pool
+
+
+def open_model(swarm_mode):
+    """Replaces this browser session's model with a fresh one from the pool."""
+    if session.value is not None:
+        session.value.close()
+    try:
+        new_session, snapshot = session_pool().open_session(swarm_mode=swarm_mode)
+    except PoolFull as error:
+        print(f"Session turned away: {error}")
+        session.value = None
+        view.value = None
+        pool_message.value = str(error)
+        return
+    _kernel_sessions[solara.get_kernel_id()] = new_session
+    session.value = new_session
+    view.value = snapshot
+    pool_message.value = ""
+
+
+def advance():
+    """Steps this session's model once; if it was evicted while idle, starts a fresh run instead."""
+    try:
+        view.value = session.value.step()
+    except SessionClosed:
+        print("The idle session was evicted; starting a new run.")
+        running.value = False
+        open_model(SwarmMode[selected_mode.value])
+
+
+def _on_kernel_start():
+    kernel_id = solara.get_kernel_id()
+
+    def close_session():
+        """Frees the model of a browser session that has gone, without waiting for it to go idle."""
+        closing = _kernel_sessions.pop(kernel_id, None)
+        if closing is not None:
+            closing.close()
+
+    return close_session
+
+
+solara.lab.on_kernel_start(_on_kernel_start)
 
-grid_width = model.value.grid.width
-grid_height = model.value.grid.height
+
+def view_window():
+    """(x_min, x_max, y_min, y_max) of the live view, from the zoom and the centre."""
+    x_span, y_span = grid_width / zoom.value, grid_height / zoom.value
+    x_min = min(max(view_centre.value - x_span / 2, 0), grid_width - x_span)
+    y_min = (grid_height - y_span) / 2
+    return x_min, x_min + x_span, y_min, y_min + y_span
 
 
 @solara.component
 def MissileGrid():
-    _ = step_count.value
+    snapshot = view.value
+
+    # Deferred so that importing the app does not load matplotlib.
+    # A bare Figure (rather than pyplot) is also never registered with
+    # pyplot's global figure manager, so re-renders do not accumulate figures.
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
 
-    fig, ax = plt.subplots(figsize=(10, 2))
-    ax.set_xlim(0, grid_width)
-    ax.set_ylim(0, grid_height)
+    fig = Figure(figsize=(10, 2))
+    ax = fig.subplots()
+    x_min, x_max, y_min, y_max = view_window()
+    ax.set_xlim(x_min, x_max)
+    ax.set_ylim(y_min, y_max)
     ax.set_xticks([])
     ax.set_yticks([])
     ax.set_aspect("equal")
 
-    for agent in model.value.agents:
-        if isinstance(agent, (MissileAgent, MissileRLAgent)):
+    # Screen size of a cell, from the subplot box the equal-aspect axes is fitted into
+    box = ax.get_position()
+    px_per_cell = min(box.width * fig.bbox.width / (x_max - x_min), box.height * fig.bbox.height / (y_max - y_min))
+
+    visible = [
+        missile for missile in snapshot['missiles']
+        if missile[4] and x_min <= missile[0][0] + 0.5 <= x_max and y_min <= missile[0][1] + 0.5 <= y_max
+    ]
+
+    if len(visible) > DENSITY_THRESHOLD:
+        # One raster instead of a marker and a trail per missile
+        bin_cells = DENSITY_BIN_PX / px_per_cell
+        bins = (max(1, round((x_max - x_min) / bin_cells)), max(1, round((y_max - y_min) / bin_cells)))
+        positions = np.array([missile[0] for missile in visible], dtype=float) + 0.5
+        counts, _, _ = np.histogram2d(positions[:, 0], positions[:, 1], bins=bins, range=((x_min, x_max), (y_min, y_max)))
+        ax.imshow(np.ma.masked_equal(counts.T, 0), origin="lower", extent=(x_min, x_max, y_min, y_max),
+                  cmap="Blues", vmin=0, interpolation="nearest", aspect="equal")
+        ax.set_title(f"{len(visible)} missiles in view (density)", fontsize=8)
+    else:
+        colors = []
+        for pos, trail, is_scout, exploded, alive, trail_stride in visible:
             # Determine color based on missile state and type
-            if agent.exploded:
-                color = "red" # Exploded missiles are red
-            elif agent.missile_type == MissileType.SCOUT:
-                color = "lightblue" # Scouts are lighter blue
+            if exploded:
+                colors.append("red") # Exploded missiles are red
+            elif is_scout:
+                colors.append("lightblue") # Scouts are lighter blue
             else:
-                color = "blue" # Attackers are darker blue
-
-            if agent.alive and len(agent.trail) > 1:
-                xs, ys = zip(*agent.trail)
-                ax.plot([x + 0.5 for x in xs], [y + 0.5 for y in ys], color=color, linewidth=1, alpha=0.5)
-            if agent.alive:
-                ax.plot(agent.pos[0] + 0.5, agent.pos[1] + 0.5, "o", color=color, markersize=5)
-        elif isinstance(agent, TargetAgent):
-            ax.plot(agent.pos[0] + 0.5, agent.pos[1] + 0.5, "s", color="green", markersize=8)
-        elif isinstance(agent, TargetReportingUnit):
-            ax.plot(agent.pos[0] + 0.5, agent.pos[1] + 0.5, "^", color="purple", markersize=8)
+                colors.append("blue") # Attackers are darker blue
+
+        if show_trails.value:
+            # A missile moves about a cell per step, so the points sent are about trail_stride cells
+            # apart (the worker may have thinned them already): keep them a few pixels apart at
+            # this zoom, and within the frame's budget
+            spacing = MIN_TRAIL_SPACING_PX / px_per_cell
+            points = sum(len(missile[1]) for missile in visible)
+            budget_stride = max(1, math.ceil(points / TRAIL_BUDGET))
+            segments, segment_colors = [], []
+            for (pos, trail, is_scout, exploded, alive, trail_stride), color in zip(visible, colors):
+                if len(trail) > 1:
+                    stride = max(budget_stride, math.ceil(spacing / trail_stride))
+                    segments.append(np.asarray(thin_trail(trail, stride), dtype=float) + 0.5)
+                    segment_colors.append(color)
+            ax.add_collection(LineCollection(segments, colors=segment_colors, linewidths=1, alpha=0.5))
+        if visible:
+            positions = np.array([missile[0] for missile in visible], dtype=float) + 0.5
+            ax.scatter(positions[:, 0], positions[:, 1], c=colors, s=25, zorder=3)
+
+    for pos in snapshot['targets']:
+        ax.plot(pos[0] + 0.5, pos[1] + 0.5, "s", color="green", markersize=8)
+    for pos in snapshot['trus']:
+        ax.plot(pos[0] + 0.5, pos[1] + 0.5, "^", color="purple", markersize=8)
 
     return solara.FigureMatplotlib(fig)
 
 
+@solara.component
+def HeatmapView():
+    """Draws a saved sweep's heatmaps (see heatmaps.py); only the saved histograms are read."""
+    from heatmaps import HeatmapAccumulator # Deferred, like matplotlib
+
+    def load():
+        if not heatmap_path.value:
+            return None, None
+        try:
+            return HeatmapAccumulator.load(heatmap_path.value), None
+        except (OSError, KeyError, ValueError) as error:
+            return None, str(error)
+
+    accumulator, error = solara.use_memo(load, dependencies=[heatmap_path.value])
+
+    with solara.Column():
+        solara.InputText("Heatmap file (.npz)", value=heatmap_path, continuous_update=False)
+        if error:
+            solara.Error(f"Could not load {heatmap_path.value}: {error}")
+        if accumulator is None:
+            return
+        layers = sorted(accumulator.histograms)
+        layer = heatmap_layer.value if heatmap_layer.value in layers else (layers[0] if layers else "hit")
+        solara.Select(label="Layer", value=layer, values=layers, on_value=heatmap_layer.set)
+
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(10, 2.5))
+        ax = fig.subplots()
+        image = accumulator.draw(ax, layer)
+        fig.colorbar(image, ax=ax, label="log(1 + count)")
+        solara.FigureMatplotlib(fig)
+
+        lines = [
+            f"**{metric}:** {mean:.3f} ± {std:.3f} (sd, {count} runs)"
+            for metric, (count, mean, std) in accumulator.summary().items() if count > 1
+        ]
+        solara.Markdown(" &nbsp;&nbsp; ".join(lines))
+
+
 @solara.component
 def MissileDashboard():
     solara.Title("Naval Missile Simulation")
 
     def simulation_finished():
-        all_missiles_launched = model.value.missile_count >= model.value.num_missiles
-        no_active_missiles = not any(isinstance(agent, MissileAgent) and agent.alive for agent in model.value.agents)
-        return all_missiles_launched and no_active_missiles
+        return not view.value['running'] # Kept up to date by the model's step
 
     def auto_step():
         while running.value:
@@ -90,8 +251,7 @@ def MissileDashboard():
                     print("Simulation finished condition met. Stopping auto_step.")
                     running.value = False
                     break
-                model.value.step()
-                step_count.value += 1
+                advance() # Blocks only on the pool's worker, not on the other sessions
                 delay = 2.0 - speed_slider.value * 1.9
                 time.sleep(delay)
             except Exception as e:
@@ -112,29 +272,25 @@ def MissileDashboard():
     def step():
         if not simulation_finished():
             print("Performing single step.")
-            model.value.step()
-            step_count.value += 1
+            advance()
         else:
             print("Cannot step, simulation already finished.")
 
     def reset():
         print("Resetting simulation.")
         running.value = False
-        model.value = NavalModel(
-            width=WIDTH,
-            height=HEIGHT,
-            num_missiles=NUM_MISSILES,
-            launch_interval=LAUNCH_INTERVAL,
-            swarm_mode=SwarmMode[selected_mode.value]
-        )
-        step_count.value = 0
+        open_model(SwarmMode[selected_mode.value]) # Only this browser session's run is replaced
 
     def on_mode_change(name):
         selected_mode.value = name
         reset()
 
     with solara.Column():
-        solara.Markdown(f"**Step:** {step_count.value} &nbsp;&nbsp; **Mode:** {model.value.swarm_mode.name}")
+        if view.value is None:
+            solara.Error(pool_message.value or "No simulation is open.")
+            solara.Button("Retry", on_click=reset)
+            return
+        solara.Markdown(f"**Step:** {view.value['step']} &nbsp;&nbsp; **Mode:** {view.value['swarm_mode']}")
         MissileGrid()
 
         with solara.Row():
@@ -159,7 +315,19 @@ def MissileDashboard():
                 )
                 solara.Text(f"{(2.0 - speed_slider.value * 1.9):.2f} sec delay", style={"fontSize": "0.8em", "textAlign": "center"})
 
+        with solara.Row():
+            with solara.Column(style={"width": "200px"}):
+                solara.SliderInt(label="Zoom", value=zoom, min=1, max=MAX_ZOOM, thumb_label=True)
+            with solara.Column(style={"width": "300px"}):
+                solara.SliderInt(label="Centre", value=view_centre, min=0, max=WIDTH, disabled=zoom.value == 1)
+            solara.Checkbox(label="Trails", value=show_trails)
+
+        solara.Markdown("### Sweep heatmaps")
+        HeatmapView()
+
 
 @solara.component
 def Page():
+    if session.value is None and not pool_message.value:
+        open_model(SwarmMode[selected_mode.value])
     MissileDashboard()
@@ -1,16 +1,44 @@
 import math
-import random
+from collections import deque
+
 from mesa import Agent
 
-from sensor import Sensor
-from swarm_modes import SwarmMode # Import SwarmMode for dispatching
+from sensor import shared_sensor
+from swarm_modes import SwarmMode, MissileType, RecceState, EstimateSource # Import SwarmMode for dispatching
 from target_agent import TargetAgent
 
+# Shared stand-in for an empty inbox; a list is only allocated once a message arrives
+NO_MESSAGES = ()
+
+# A missile that ends a step in the target's cell is within this distance of the target's float position
+CELL_HIT_REACH = math.hypot(0.5, 1.0)
+
+
 class MissileAgent(Agent):
+    # Attributes live in slots, so a missile's __dict__ (which it still has, as
+    # mesa.Agent is not slotted) stays empty; large salvos are memory-bound.
+    # Subclasses must declare __slots__ for any new attributes: nothing stops
+    # one that forgets, its attributes just go back into the __dict__.
+    __slots__ = (
+        'model', 'unique_id', 'pos',
+        'base_speed', 'speed', 'min_speed', 'max_speed', 'fuel', 'exploded', 'alive',
+        'trail', 'sensor', 'float_pos', 'direction', 'mode', 'wave_id', 'comms_range',
+        'incoming_messages', 'missile_type', 'recce_state', 'estimated_target_pos',
+        'launch_index', 'sensor_rng', 'estimate_version', 'estimate_source',
+        'neighbour_table', 'last_broadcast', 'launch_time',
+    )
+
+    sensor_switch_distance = 20.0
+
     def __init__(self, model, pos, direction, speed, fuel, initial_target_estimate=None, mode=None, comms_range=50,
                  min_speed=0.1, max_speed=2.0, wave_id=0, missile_type=None,
-                 sensor_range=30, sensor_field_of_view_deg=90, sensor_noise_std=0.5):
-        super().__init__(model)
+                 sensor_range=30, sensor_field_of_view_deg=90, sensor_noise_std=0.5, trail_length=None):
+        """
+        :param trail_length: None keeps the full trail, 0 keeps none, n keeps the last n positions
+        """
+        self._register(model)
+        self.launch_index = model.missile_count # Launch order within the run
+        self.launch_time = model.sim_time
 
         self.base_speed = speed
         self.speed = speed
@@ -19,31 +47,177 @@ class MissileAgent(Agent):
         self.fuel = fuel
         self.exploded = False
         self.alive = True
-        self.trail = [pos]
-        self.sensor = Sensor(range=sensor_range, field_of_view_deg=sensor_field_of_view_deg, noise_std=sensor_noise_std)
-        self.pos = pos
+        if trail_length is None:
+            self.trail = [pos]
+        elif trail_length > 0:
+            self.trail = deque([pos], maxlen=trail_length)
+        else:
+            self.trail = None
+        # Sensors are stateless, so missiles with the same parameters share one instance
+        self.sensor = shared_sensor(sensor_range, sensor_field_of_view_deg, sensor_noise_std)
+        self.sensor_rng = None # Created on first use by sensor_random()
+        # pos is set by grid.place_agent when the missile is launched
         self.float_pos = list(pos)
         self.direction = direction if direction is not None else (1, 0)
         self.mode = mode
         self.wave_id = wave_id
         self.comms_range = comms_range
-        self.incoming_messages = []
+        self.incoming_messages = NO_MESSAGES
+        # Delta broadcasting only (see communication.DeltaBroadcastPolicy): the last message heard
+        # from each neighbour, and what this missile said in its own last transmission
+        self.neighbour_table = None
+        self.last_broadcast = None
 
         self.missile_type = missile_type
-        self.recce_state = None
+        # Recce attackers start out loitering until a scout confirms the target
+        self.recce_state = RecceState.INITIAL_LOITER if missile_type == MissileType.ATTACKER else None
+
+        # Estimates are only ever replaced, never modified in place, so they can be shared
+        self.estimated_target_pos = initial_target_estimate
+        self.estimate_version = 0 # Version of the last published estimate taken (see estimate_store.py)
+        self.estimate_source = EstimateSource.LAUNCH
+
+    # Attributes that are tied to the hosting model rather than part of the missile's own state
+    _UNSAVED_ATTRIBUTES = ('model', 'pos', 'sensor', 'trail', 'incoming_messages', '_swarm_state', '_row')
+
+    def get_state(self):
+        """
+        Returns the missile's state as a picklable dict, for moving it to another model
+        (e.g. between strip workers) with from_state. The inbox is not included.
+        """
+        state = {}
+        for klass in type(self).__mro__:
+            for name in getattr(klass, '__slots__', ()):
+                if name not in self._UNSAVED_ATTRIBUTES:
+                    value = getattr(self, name)
+                    state[name] = list(value) if name == 'float_pos' else value
+        state['pos'] = self.pos
+        state['trail'] = list(self.trail) if self.trail is not None else None
+        state['sensor'] = (self.sensor.range, self.sensor.field_of_view_deg, self.sensor.noise_std, self.sensor.is_active)
+        return state
 
-        if initial_target_estimate is not None:
-            self.estimated_target_pos = list(initial_target_estimate)
+    @classmethod
+    def from_state(cls, model, state):
+        """Recreates a missile from get_state() output, registers it with `model` and places it on its grid."""
+        missile = cls.__new__(cls)
+        missile._register(model)
+        for name, value in state.items():
+            if name not in MissileAgent._UNSAVED_ATTRIBUTES:
+                setattr(missile, name, value)
+        missile.sensor = shared_sensor(*state['sensor'])
+        missile.incoming_messages = NO_MESSAGES
+        if state['trail'] is None or model.trail_length == 0:
+            missile.trail = None
+        elif model.trail_length is None:
+            missile.trail = list(state['trail'])
         else:
-            self.estimated_target_pos = None
+            missile.trail = deque(state['trail'], maxlen=model.trail_length)
+        model.grid.place_agent(missile, state['pos'])
+        return missile
+
+    def _register(self, model):
+        """Registers the missile with the model; the first thing done by __init__ and from_state."""
+        super().__init__(model)
+
+    def sensor_random(self):
+        """
+        The random stream for this missile's sensor noise. Keyed on launch order rather than
+        drawn from the model's shared stream, so the nth missile sees the same noise in every
+        swarm mode (see NavalModel.random_stream).
+        """
+        if self.sensor_rng is None:
+            self.sensor_rng = self.model.random_stream('missile sensor', self.launch_index)
+        return self.sensor_rng
+
+    def hopeless(self, rules):
+        """
+        Checks the culling rules (see NavalModel culling) in order.
+
+        - 'fuel': even flying flat out for all its remaining fuel, the missile cannot get within
+          hitting distance of anywhere the target can be by then. This one is a proof.
+        - 'past_target': the missile is beyond the target's column and still flying away from it.
+        - 'edge': the missile has left the arena (its grid cell is clamped to the edge) and is
+          still flying outwards.
+        The last two are heuristics: guidance could in principle still turn the missile round.
+
+        :returns: The first rule that condemns the missile, or None
+        """
+        target = self.model.target
+        reach = max(self.model.target_radius, CELL_HIT_REACH)
+        x, y = self.float_pos
+        direction_x, direction_y = self.direction if self.direction is not None else (0, 0)
+        for rule in rules:
+            if rule == 'fuel':
+                # Where the target can be while the fuel lasts: a stretch of its column
+                flight_time = max(self.fuel, 0)
+                y_min = max(0, target.float_y - target.speed * flight_time)
+                y_max = min(self.model.grid.height - 1, target.float_y + target.speed * flight_time)
+                gap = math.hypot(x - target.pos[0], y - min(max(y, y_min), y_max))
+                if gap - reach > flight_time * self.max_speed:
+                    return rule
+            elif rule == 'past_target':
+                if x > target.pos[0] + reach and direction_x >= 0:
+                    return rule
+            elif rule == 'edge':
+                width, height = self.model.grid.width, self.model.grid.height
+                if ((x < -reach and direction_x <= 0) or (x > width - 1 + reach and direction_x >= 0)
+                        or (y < -reach and direction_y <= 0) or (y > height - 1 + reach and direction_y >= 0)):
+                    return rule
+        return None
+
+    def make_broadcast(self):
+        """The message this missile broadcasts to its neighbours each step."""
+        return {
+            'sender_id': self.unique_id,
+            'sender_pos': self.pos,
+            'sender_target_estimate': self.estimated_target_pos,
+            'sender_speed': self.speed,
+            'sender_fuel': self.fuel,
+            'sender_wave_id': self.wave_id,
+            'sender_type': self.missile_type.value
+        }
 
-        self.sensor_switch_distance = 20.0
+    def update_target_estimate(self, new_estimate, source=EstimateSource.TRU):
+        self.estimated_target_pos = new_estimate
+        self.estimate_source = source
 
-    def update_target_estimate(self, new_estimate):
-        self.estimated_target_pos = list(new_estimate)
+    def pull_estimate(self):
+        """Takes the model's published target estimate if it is newer than the one last taken."""
+        published = self.model.estimate_store.current
+        if published is not None and published.version != self.estimate_version:
+            self.estimate_version = published.version
+            if not hasattr(published.position, 'velocity'): # Tracks are handed out by distribute_estimates
+                self.estimated_target_pos = published.position
+                self.estimate_source = published.source
 
     def _receive_message(self, message):
-        self.incoming_messages.append(message)
+        table = self.neighbour_table
+        if table is not None:
+            table[message['sender_id']] = message # The inbox is a view of the table
+            return
+        if self.incoming_messages:
+            self.incoming_messages.append(message)
+        else:
+            self.incoming_messages = [message]
+
+    def retire(self, outcome, exploded=False):
+        """
+        Takes the missile out of the simulation and records why.
+        Deregistering (rather than only dropping it from model.agents) lets the agent be garbage collected.
+        """
+        self.exploded = exploded
+        self.alive = False
+        self.model.record_outcome(self, outcome)
+        if self.model.defer_removals:
+            # Synchronous update: the missile stays in place until the end of the step
+            self.model.pending_removals.append(self)
+        else:
+            self.detach()
+
+    def detach(self):
+        """Removes the missile from the grid and deregisters it from the model, without recording an outcome."""
+        self.model.grid.remove_agent(self)
+        self.remove()
 
     def _get_direction_vector(self, target_coord):
         if target_coord is None:
@@ -55,8 +229,8 @@ class MissileAgent(Agent):
         distance = math.hypot(dx, dy)
 
         if distance < 1e-6:
-            perturb_x = random.uniform(-0.1, 0.1)
-            perturb_y = random.uniform(-0.1, 0.1)
+            perturb_x = self.random.uniform(-0.1, 0.1)
+            perturb_y = self.random.uniform(-0.1, 0.1)
             
             new_dir_x = self.direction[0] + perturb_x
             new_dir_y = self.direction[1] + perturb_y
@@ -112,22 +286,39 @@ class MissileAgent(Agent):
         """
         if self.direction is None:
             print(f"[Missile {self.unique_id}] ERROR: No direction set. Stopping missile.")
-            self.alive = False
-            self.model.agents.remove(self)
-            self.model.grid.remove_agent(self)
+            self.retire('no_direction')
             return
 
-        self.fuel -= 1
+        self.fuel -= self.model.dt
         if self.fuel <= 0:
-            self.alive = False
-            self.model.agents.remove(self)
-            self.model.grid.remove_agent(self)
+            self.retire('fuel_out')
             print(f"[Missile {self.unique_id}] Ran out of fuel and is now inactive.")
             return
 
-        self.float_pos[0] += self.direction[0] * self.speed
-        self.float_pos[1] += self.direction[1] * self.speed
+        if self.model.batched_moves:
+            self.model.pending_moves.append(self) # Moved with the rest of the swarm (see NavalModel.move_batch)
+            return
+
+        self.float_pos[0] += self.direction[0] * self.speed * self.model.dt
+        self.float_pos[1] += self.direction[1] * self.speed * self.model.dt
+
+        if self.model.synchronous:
+            return # Committed in advance(), once every agent has computed its step
+
+        self._commit_move()
+        self._check_hit()
+
+    def advance(self):
+        """
+        Synchronous update mode: commits the move computed in step() and checks for a hit.
+        The model advances the target first, so this sees where the target ends the step.
+        """
+        if self.alive:
+            self._commit_move()
+            self._check_hit()
 
+    def _commit_move(self):
+        """Moves the missile to the grid cell of its float position and extends its trail."""
         new_x = int(round(self.float_pos[0]))
         new_y = int(round(self.float_pos[1]))
 
@@ -135,7 +326,7 @@ class MissileAgent(Agent):
         new_y = max(0, min(new_y, self.model.grid.height - 1))
         new_pos = (new_x, new_y)
 
-        if self.alive:
+        if self.alive and self.trail is not None:
             self.trail.append(self.pos)
 
         if new_pos != self.pos:
@@ -144,16 +335,54 @@ class MissileAgent(Agent):
 
         print(f"[Missile {self.unique_id}] Moved to {new_pos} | Direction: {self.direction} | Fuel left: {self.fuel} | Current Speed: {self.speed}")
 
-        cellmates = self.model.grid.get_cell_list_contents([new_pos])
+    def _check_hit(self):
+        """
+        Checks the move just made: the missile hits if it ends the step in the target's cell,
+        or if its path passed within model.target_radius of the target. The swept test keeps
+        fast missiles and large dt from tunnelling through the target.
+        """
+        cellmates = self.model.grid.get_cell_list_contents([self.pos])
         for other in cellmates:
             if isinstance(other, TargetAgent):
-                self.exploded = True
-                self.alive = False
-                self.model.agents.remove(self)
-                self.model.grid.remove_agent(self)
-                print(f"[Missile {self.unique_id}] HIT! Target destroyed at {new_pos}.")
+                self.retire('hit', exploded=True)
+                print(f"[Missile {self.unique_id}] HIT! Target destroyed at {self.pos}.")
                 return
 
+        if self.model.target_radius > 0:
+            miss_distance = self._closest_approach(self.model.target)
+            if miss_distance <= self.model.target_radius:
+                self.retire('hit', exploded=True)
+                print(f"[Missile {self.unique_id}] HIT! Passed within {miss_distance:.2f} of the target.")
+
+    def _closest_approach(self, target):
+        """
+        Smallest distance between the missile and the target during the move just made.
+        Both are taken to move in a straight line over the step, so the test is done on
+        the missile's path relative to the target.
+        """
+        miss_distances = self.model.miss_distances
+        if miss_distances is not None:
+            return miss_distances[self._row] # Computed for the whole swarm (see NavalModel.move_batch)
+        step_x = self.direction[0] * self.speed * self.model.dt
+        step_y = self.direction[1] * self.speed * self.model.dt
+        end_x, end_y = self.float_pos
+        (target_start_x, target_start_y), (target_end_x, target_end_y) = target.motion_this_step()
+
+        # Relative position at the start of the step, and relative displacement over it
+        rel_x = end_x - step_x - target_start_x
+        rel_y = end_y - step_y - target_start_y
+        move_x = step_x - (target_end_x - target_start_x)
+        move_y = step_y - (target_end_y - target_start_y)
+
+        length_sq = move_x * move_x + move_y * move_y
+        # sqrt of the sum of squares rather than hypot, as in kernels.closest_approach, so both agree to the bit
+        if length_sq == 0:
+            return math.sqrt(rel_x * rel_x + rel_y * rel_y)
+        t = max(0.0, min(1.0, -(rel_x * move_x + rel_y * move_y) / length_sq))
+        x = rel_x + t * move_x
+        y = rel_y + t * move_y
+        return math.sqrt(x * x + y * y)
+
     def step(self):
         """
         Advances the missile's state by one step.
@@ -164,8 +393,10 @@ class MissileAgent(Agent):
         if not self.alive:
             print(f"[Missile {self.unique_id}] Inactive. Skipping step.")
             return
-        
+
+        self.pull_estimate()
         self.perform_guidance()
-        self.move_and_check_hit()
+        if self.alive: # Guidance may have removed the missile (e.g. decoy self-destruct)
+            self.move_and_check_hit()
 
         print(f"[Step {self.model.steps}] Missile {self.unique_id} - End step. Pos: {self.pos}, Dir: {self.direction}, Estimate: {self.estimated_target_pos}, Exploded: {self.exploded}")
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""
+Batch runner with adaptive (sequential) stopping.
+
+Instead of a fixed number of seeds per configuration, runs are launched until
+the confidence interval on the mean hit rate (and, optionally, on the mean
+time to impact) is narrower than a target width, or a per-configuration budget
+is used up. Workers are kept busy with whichever configuration is currently the
+most uncertain, so clearly separated configurations stop early and the compute
+goes to the close ones.
+
+    python batch_runner.py --modes OVERWHELM WAVE SPLIT_AXIS --ci-width 0.05 --workers 4
+"""
+import argparse
+import math
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from headless import run_headless
+from run_budget import StepLatencyHistogram
+from swarm_modes import SwarmMode
+
+# Allowance on top of a run's wall-time budget and grace for a fresh worker process to start
+_WORKER_START_TIME = 5.0
+
+
+class RunningStat:
+    """Running mean and variance (Welford's algorithm) with a Student-t confidence interval."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """
+        Folds in the values of another RunningStat (Chan et al.'s pairwise update), so that
+        statistics kept in separate workers combine exactly. Returns self.
+        """
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else math.inf
+
+    def half_width(self, confidence=0.95):
+        """Half-width of the confidence interval on the mean (inf with fewer than two values)."""
+        if self.count < 2:
+            return math.inf
+        from scipy.stats import t # Deferred: only needed once results come in
+        return t.ppf(0.5 + confidence / 2, self.count - 1) * math.sqrt(self.variance / self.count)
+
+
+class _Configuration:
+    """Bookkeeping for one configuration under adaptive stopping."""
+
+    def __init__(self, name, run_kwargs):
+        self.name = name
+        self.run_kwargs = run_kwargs
+        self.hit_rate = RunningStat()
+        self.time_to_impact = RunningStat() # Over runs with at least one hit
+        self.stop_reasons = {} # 'finished' / 'max_steps' / 'wall_time' / 'hung' -> runs
+        self.step_latency = StepLatencyHistogram()
+        self.hung_seeds = []
+        self.runs_started = 0
+        self.in_flight = 0
+
+    def uncertainty(self, ci_width, time_ci_width, confidence):
+        """
+        How far the widest interval is from its target (<= 1 means done), projected to the
+        number of runs once those in flight return, so that one configuration is not flooded.
+        """
+        projection = math.sqrt(self.hit_rate.count / (self.hit_rate.count + self.in_flight)) if self.hit_rate.count else 1.0
+        ratio = 2 * self.hit_rate.half_width(confidence) / ci_width
+        if time_ci_width is not None and not self.time_ci_skipped(ci_width, confidence):
+            ratio = max(ratio, 2 * self.time_to_impact.half_width(confidence) / time_ci_width)
+        return ratio * projection
+
+    def time_ci_skipped(self, ci_width, confidence):
+        """
+        True when the time to impact cannot be estimated and is not worth running on for: fewer
+        than two runs have hit (so its interval is infinite) while the hit rate has already
+        converged, e.g. on a configuration that (almost) never hits.
+        """
+        return self.time_to_impact.count < 2 and 2 * self.hit_rate.half_width(confidence) <= ci_width
+
+    def summary(self, confidence, converged, time_ci_skipped=False):
+        return {
+            'runs': self.hit_rate.count,
+            'hit_rate': self.hit_rate.mean,
+            'hit_rate_ci': self.hit_rate.half_width(confidence),
+            'mean_time_to_impact': self.time_to_impact.mean if self.time_to_impact.count else None,
+            'time_to_impact_ci': self.time_to_impact.half_width(confidence),
+            'converged': converged,
+            'time_ci_skipped': time_ci_skipped,
+            'stop_reasons': dict(self.stop_reasons),
+            'hung_seeds': list(self.hung_seeds),
+            'step_latency': self.step_latency.summary(),
+        }
+
+
+def _worker_pool(workers):
+    # Spawned like the other worker pools, so workers start clean on every platform
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _terminate_pool(executor):
+    """Kills the pool's worker processes, whatever they are running, and shuts the pool down."""
+    # ProcessPoolExecutor has no public way to stop a running task (Python 3.14 adds terminate_workers)
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _hang_deadline(run_kwargs, hang_grace):
+    """time.monotonic() after which a run just submitted counts as hung, or None without a wall-time budget."""
+    budget = run_kwargs.get('wall_time_budget')
+    if budget is None:
+        return None
+    grace = hang_grace if hang_grace is not None else max(budget, 1.0) + _WORKER_START_TIME
+    return time.monotonic() + budget + grace
+
+
+def run_adaptive(configurations, ci_width=0.05, time_ci_width=None, confidence=0.95,
+                 min_runs=5, max_runs=200, workers=None, base_seed=0, hang_grace=None):
+    """
+    Runs every configuration until its confidence intervals are narrow enough.
+
+    :param configurations: Dict of name -> run_headless keyword arguments (swarm_mode, max_steps, model args)
+    :param ci_width: Target full width of the confidence interval on the mean hit rate
+    :param time_ci_width: Target full width for the mean time to impact, or None to ignore it
+    :param confidence: Confidence level of the intervals
+    :param min_runs: Runs per configuration before its interval is trusted
+    :param max_runs: Budget of runs per configuration
+    :param workers: Worker processes (default: one per CPU)
+    :param base_seed: Run i of every configuration uses seed base_seed + i, so configurations share seeds
+    :param hang_grace: Seconds past a run's wall_time_budget after which it counts as hung (default: the
+        budget, at least one second, plus 5 s for a worker to start). run_headless cannot interrupt a
+        step, so the worker pool is then replaced and the other runs in flight start again on the new one.
+        Runs without a wall_time_budget are waited for however long they take.
+    :returns: Dict of name -> summary (runs, hit_rate, hit_rate_ci, mean_time_to_impact,
+        time_to_impact_ci, converged, time_ci_skipped, stop_reasons, hung_seeds, step_latency), the *_ci values
+        being half-widths. time_ci_skipped is True for configurations that converged on the hit rate
+        alone because too few of their runs hit to time them (see _Configuration.time_ci_skipped).
+        Runs cut short by max_steps or a wall_time_budget in the run arguments count like finished ones.
+        Hung runs return nothing; they count as runs without hits (in hit_rate, not in the time to
+        impact), as 'hung' in stop_reasons, and their seeds are listed in hung_seeds. So seed i is
+        still run i in every configuration, at the cost of biasing the hit rate down by hung runs.
+    """
+    states = {name: _Configuration(name, kwargs) for name, kwargs in configurations.items()}
+
+    def done(state):
+        if state.hit_rate.count < min_runs:
+            return False
+        return state.uncertainty(ci_width, time_ci_width, confidence) <= 1 or state.runs_started >= max_runs
+
+    def next_configuration():
+        candidates = [s for s in states.values() if s.runs_started < max_runs and not done(s)]
+        # Warm-up runs first, then the most uncertain configuration
+        warming = [s for s in candidates if s.runs_started < min_runs]
+        if warming:
+            return min(warming, key=lambda s: s.runs_started)
+        candidates = [s for s in candidates if s.uncertainty(ci_width, time_ci_width, confidence) > 1]
+        return max(candidates, key=lambda s: s.uncertainty(ci_width, time_ci_width, confidence), default=None)
+
+    def record(state, summary):
+        state.hit_rate.add(summary['hit_rate'])
+        if summary['mean_time_to_impact'] is not None:
+            state.time_to_impact.add(summary['mean_time_to_impact'])
+        state.stop_reasons[summary['stop_reason']] = state.stop_reasons.get(summary['stop_reason'], 0) + 1
+        state.step_latency.merge(StepLatencyHistogram.from_summary(summary['step_latency']))
+
+    workers = workers or multiprocessing.cpu_count()
+    futures = {} # Future -> (configuration state, run arguments, hang deadline)
+    executor = _worker_pool(workers)
+    try:
+        while True:
+            while len(futures) < workers:
+                state = next_configuration()
+                if state is None:
+                    break
+                kwargs = dict(state.run_kwargs, seed=base_seed + state.runs_started)
+                futures[executor.submit(run_headless, **kwargs)] = (state, kwargs, _hang_deadline(kwargs, hang_grace))
+                state.runs_started += 1
+                state.in_flight += 1
+            if not futures:
+                break
+
+            deadlines = [deadline for _, _, deadline in futures.values() if deadline is not None]
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in [future for future in futures if future.done()]:
+                state, _, _ = futures.pop(future)
+                state.in_flight -= 1
+                record(state, future.result())
+
+            now = time.monotonic()
+            hung = [future for future, (_, _, deadline) in futures.items() if deadline is not None and now >= deadline]
+            if hung:
+                for future in hung:
+                    state, kwargs, _ = futures.pop(future)
+                    state.in_flight -= 1
+                    state.hit_rate.add(0.0)
+                    state.stop_reasons['hung'] = state.stop_reasons.get('hung', 0) + 1
+                    state.hung_seeds.append(kwargs['seed'])
+                # A step cannot be interrupted, so the hung worker is killed with its pool and the
+                # runs that were still going start again, on the same seeds, in a fresh one
+                _terminate_pool(executor)
+                executor = _worker_pool(workers)
+                futures = {
+                    executor.submit(run_headless, **kwargs): (state, kwargs, _hang_deadline(kwargs, hang_grace))
+                    for state, kwargs, _ in futures.values()
+                }
+    finally:
+        executor.shutdown(wait=not futures, cancel_futures=True)
+
+    return {
+        name: state.summary(confidence, state.uncertainty(ci_width, time_ci_width, confidence) <= 1,
+                            time_ci_width is not None and state.time_ci_skipped(ci_width, confidence))
+        for name, state in states.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['OVERWHELM', 'WAVE', 'SPLIT_AXIS'],
+                        choices=[m.name for m in SwarmMode])
+    parser.add_argument('--ci-width', type=float, default=0.05, help="Target CI width on the hit rate")
+    parser.add_argument('--time-ci-width', type=float, default=None, help="Target CI width on the mean time to impact")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--min-runs', type=int, default=5)
+    parser.add_argument('--max-runs', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--wall-time-budget', type=float, default=None, help="Seconds each run may take")
+    parser.add_argument('--diagnostics-dir', default=None, help="Write the diagnostics of runs that exceed their budget here")
+    parser.add_argument('--seed', type=int, default=0, help="Base seed")
+    args = parser.parse_args(argv)
+
+    configurations = {
+        mode: {'swarm_mode': SwarmMode[mode], 'max_steps': args.max_steps, 'wall_time_budget': args.wall_time_budget,
+               'diagnostics_dir': args.diagnostics_dir}
+        for mode in args.modes
+    }
+    results = run_adaptive(
+        configurations, ci_width=args.ci_width, time_ci_width=args.time_ci_width, confidence=args.confidence,
+        min_runs=args.min_runs, max_runs=args.max_runs, workers=args.workers, base_seed=args.seed,
+    )
+
+    print(f"{'configuration':<14} {'runs':>5} {'hit rate':>16} {'time to impact':>20}  converged  step p99   cut short")
+    for name, result in results.items():
+        time_to_impact = result['mean_time_to_impact']
+        if result['time_ci_skipped']:
+            time_text = 'too few hits'
+        else:
+            time_text = f"{time_to_impact:.1f} ± {result['time_to_impact_ci']:.1f}" if time_to_impact is not None else '-'
+        print(f"{name:<14} {result['runs']:>5} {result['hit_rate']:>8.3f} ± {result['hit_rate_ci']:.3f} "
+              f"{time_text:>20}  {'yes' if result['converged'] else 'no':>9}  "
+              f"{result['step_latency']['p99'] * 1000:6.1f} ms  {sum(result['stop_reasons'].values()) - result['stop_reasons'].get('finished', 0):>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Cold-start benchmark for the simulation entry points.
+
+Each measurement imports a module in a fresh interpreter (as a batch worker
+would) and is compared against a budget. It also checks that the headless
+entry points do not drag in the GUI stack.
+
+    python bench_coldstart.py            # report
+    python bench_coldstart.py --strict   # exit non-zero if a budget is exceeded
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Budgets in seconds on top of the cost of `import mesa`, which is measured
+# alongside as the floor: Mesa pulls in pandas, scipy.spatial and networkx and
+# dominates the headless figure (roughly 0.8-0.9s on a warm file cache), so
+# budgeting relative to it keeps the check meaningful across machines.
+# The app additionally loads solara.
+BUDGETS = {
+    'model': 0.15,
+    'headless': 0.15,
+    'app': 1.5,
+}
+
+# Modules that must not be imported by the headless entry points
+GUI_MODULES = ('solara', 'matplotlib')
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {gui!r} if m in sys.modules))
+"""
+
+
+def measure(module, repeats=5):
+    """
+    Imports `module` in `repeats` fresh interpreters.
+
+    :returns: Tuple (median import seconds, GUI modules that got imported)
+    """
+    timings = []
+    loaded = ''
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module, gui=GUI_MODULES)],
+            capture_output=True, text=True, check=True
+        )
+        elapsed, _, loaded = result.stdout.strip().splitlines()[-1].partition(' ')
+        timings.append(float(elapsed))
+    return statistics.median(timings), [m for m in loaded.split(',') if m]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--strict', action='store_true', help="Exit with status 1 if any budget is exceeded")
+    args = parser.parse_args(argv)
+
+    floor, _ = measure('mesa', args.repeats)
+    print(f"{'mesa':<10} {floor:6.3f}s  (floor)")
+
+    failed = False
+    for module, budget in BUDGETS.items():
+        elapsed, gui_loaded = measure(module, args.repeats)
+        overhead = elapsed - floor
+        over_budget = overhead > budget
+        leaks_gui = module != 'app' and gui_loaded
+        status = 'FAIL' if over_budget or leaks_gui else 'ok'
+        failed = failed or status == 'FAIL'
+        note = f" (imported {', '.join(gui_loaded)})" if leaks_gui else ''
+        print(f"{module:<10} {elapsed:6.3f}s  {overhead:+.3f}s over floor, budget +{budget:.2f}s  {status}{note}")
+
+    if args.strict and failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Memory benchmark: bytes per missile for the different storage options.
+
+Launches a salvo, measures the heap allocated for it with tracemalloc, then
+flies every missile for a number of steps (movement only, no comms) to show
+how much each configuration grows in flight.
+
+    python bench_memory.py --missiles 1000 --steps 100
+"""
+import argparse
+import gc
+import tracemalloc
+
+from headless import quiet_output
+from model import NavalModel
+from swarm_modes import SwarmMode
+
+CONFIGURATIONS = {
+    'full trail': dict(),
+    'no trail': dict(trail_length=0),
+    'no trail, compact_state': dict(trail_length=0, compact_state=True),
+}
+
+
+def measure(num_missiles, steps, **model_kwargs):
+    """
+    :returns: Tuple (bytes per missile at launch, bytes per missile after `steps` steps of flight)
+    """
+    with quiet_output():
+        model = NavalModel(swarm_mode=SwarmMode.SIMPLE, num_missiles=num_missiles, **model_kwargs)
+        model.launch_missile() # Warm up lazily created classes and caches outside the measurement
+        gc.collect()
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for i in range(num_missiles - 1):
+            # Spread launches over the platform column so that missiles do not
+            # all share one grid cell (which makes every move a long list scan)
+            model.launch_platform_pos = (0, i % model.height)
+            model.launch_missile()
+        launched = tracemalloc.get_traced_memory()[0] - baseline
+
+        missiles = [a for a in model.agents if hasattr(a, 'fuel')]
+        for _ in range(steps):
+            for missile in missiles:
+                if missile.alive:
+                    missile.move_and_check_hit()
+        gc.collect()
+        flown = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+
+    per_missile = num_missiles - 1
+    return launched / per_missile, flown / per_missile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--missiles', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    print(f"{'configuration':<26} {'at launch':>12} {f'after {args.steps} steps':>18}")
+    for name, kwargs in CONFIGURATIONS.items():
+        at_launch, in_flight = measure(args.missiles, args.steps, **kwargs)
+        print(f"{name:<26} {at_launch:>10.0f} B {in_flight:>16.0f} B")
+
+
+if __name__ == '__main__':
+    main()
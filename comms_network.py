@@ -0,0 +1,301 @@
+"""
+Comms topologies other than direct broadcast.
+
+With NavalModel(comms_hops=N), N > 1, missiles relay what they hear: a
+broadcast reaches every missile within N hops of the sender in the swarm's
+comms graph, so e.g. a scout's estimate can pass back along a stream of
+attackers that are individually out of its range.
+
+With NavalModel(hierarchical_comms=True), each wave (and, in RECCE, the
+scouts and the attackers of each wave) elects leaders: members report to
+their leader, which broadcasts one summary for its part of the group (see
+LeaderHierarchy).
+
+The comms graph (a networkx Graph of missile ids) is kept up to date
+incrementally rather than rebuilt each step. Missiles are filed in a
+NeighbourIndex of buckets one comms range wide. Each step only the missiles
+that moved (or were launched) have their links re-tested, against the missiles
+in their own and neighbouring buckets; links between missiles that both stayed
+put are left alone.
+"""
+import itertools
+import math
+
+
+class NeighbourIndex:
+    """
+    Uniform grid of buckets over the plane. Items are only refiled when they
+    cross into a different bucket, which for missiles moving a few cells per
+    step against buckets tens of cells wide is rare.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.positions = {}
+        self._bucket_of = {}
+        self._buckets = {}
+
+    def _bucket(self, pos):
+        return int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)
+
+    def update(self, item, pos):
+        """Adds an item or moves it to pos."""
+        self.positions[item] = pos
+        bucket = self._bucket(pos)
+        old_bucket = self._bucket_of.get(item)
+        if bucket == old_bucket:
+            return
+        if old_bucket is not None:
+            self._buckets[old_bucket].discard(item)
+        self._buckets.setdefault(bucket, set()).add(item)
+        self._bucket_of[item] = bucket
+
+    def remove(self, item):
+        bucket = self._bucket_of.pop(item, None)
+        if bucket is not None:
+            self._buckets[bucket].discard(item)
+            del self.positions[item]
+
+    def near(self, pos):
+        """Items in the bucket of pos and the 8 around it: a superset of those within cell_size of pos."""
+        bucket_x, bucket_y = self._bucket(pos)
+        buckets = self._buckets
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                items = buckets.get((bucket_x + dx, bucket_y + dy))
+                if items:
+                    yield from items
+
+    def candidate_pairs(self):
+        """
+        Yields every pair of items in the same or adjacent buckets, once each: a superset of
+        the pairs within cell_size of one another.
+        """
+        buckets = self._buckets
+        for (bucket_x, bucket_y), items in buckets.items():
+            if not items:
+                continue
+            yield from itertools.combinations(items, 2)
+            # Half of the 8 neighbouring buckets, so that each pair of buckets is visited once
+            for dx, dy in ((1, -1), (1, 0), (1, 1), (0, 1)):
+                others = buckets.get((bucket_x + dx, bucket_y + dy))
+                if others:
+                    yield from itertools.product(items, others)
+
+
+class RelayNetwork:
+    """
+    The swarm's comms graph and hop-limited delivery over it. Two missiles are
+    linked when each is within the other's comms range, since a relay needs the
+    link to work both ways.
+    """
+
+    def __init__(self, max_hops, comms_range):
+        """
+        :param max_hops: How many links a broadcast may cross
+        :param comms_range: The largest comms range in the swarm (sets the index bucket size)
+        """
+        import networkx as nx # Deferred: only relay runs need the graph library
+        self._nx = nx
+        self.max_hops = max_hops
+        self.graph = nx.Graph()
+        self.index = NeighbourIndex(comms_range)
+
+    def update(self, missiles):
+        """
+        Brings the index and graph in line with the current positions of the live missiles,
+        re-testing only the links of those that moved since the last update.
+        """
+        live = {missile.unique_id: missile for missile in missiles if missile.alive}
+        graph, index = self.graph, self.index
+
+        departed = [node for node in graph if node not in live]
+        if departed:
+            graph.remove_nodes_from(departed) # Also drops their edges
+            for node in departed:
+                index.remove(node)
+
+        positions = index.positions
+        moved = [node for node, missile in live.items() if positions.get(node) != missile.pos] # New ones too
+        for node in moved:
+            index.update(node, live[node].pos)
+        graph.add_nodes_from(moved)
+
+        # Every index entry is up to date by now, so a pair of movers is tested once, at their new positions
+        retested = set()
+        for node in moved:
+            retested.add(node)
+            x, y = positions[node]
+            node_range = live[node].comms_range
+            linked = set()
+            for other in index.near((x, y)):
+                if other in retested:
+                    continue
+                other_x, other_y = positions[other]
+                other_range = live[other].comms_range
+                link_range = node_range if node_range < other_range else other_range
+                if (x - other_x) ** 2 + (y - other_y) ** 2 <= link_range * link_range:
+                    linked.add(other)
+            current = {other for other in graph.adj[node] if other not in retested}
+            graph.remove_edges_from([(node, other) for other in current - linked])
+            graph.add_edges_from([(node, other) for other in linked - current])
+
+    def deliver(self, missiles):
+        """Delivers every live missile's broadcast to each missile within max_hops of it."""
+        live = {missile.unique_id: missile for missile in missiles if missile.alive}
+
+        for component in self._nx.connected_components(self.graph):
+            if len(component) == 1:
+                continue
+            members = list(component)
+            broadcasts = [live[node].make_broadcast() for node in members]
+            full = (1 << len(members)) - 1
+            reach = self._reach(members) if len(members) > self.max_hops + 1 else [full] * len(members)
+
+            for i, node in enumerate(members):
+                if reach[i] == full:
+                    inbox = broadcasts[:i] + broadcasts[i + 1:]
+                else:
+                    inbox = [broadcasts[j] for j in range(len(members)) if j != i and reach[i] >> j & 1]
+                live[node].incoming_messages = inbox
+
+    def _reach(self, members):
+        """
+        For each member of a connected component, a bitmask (bit j = members[j]) of the members
+        within max_hops of it. Reach grows one hop at a time by OR-ing in the neighbours' masks,
+        which is much cheaper than a breadth-first search per member on a dense swarm.
+        """
+        position = {node: i for i, node in enumerate(members)}
+        neighbours = [[position[other] for other in self.graph.adj[node]] for node in members]
+
+        reach = [1 << i for i in range(len(members))] # Within 0 hops: itself
+        for _ in range(self.max_hops):
+            grown = []
+            for i, mask in enumerate(reach):
+                for j in neighbours[i]:
+                    mask |= reach[j]
+                grown.append(mask)
+            if grown == reach:
+                break # Every member already reaches its whole component
+            reach = grown
+        return reach
+
+
+class LeaderHierarchy:
+    """
+    Two-level comms: the missiles of a group (same wave and type) report their state to a
+    leader, which broadcasts a single summary for them, so the number of messages grows with
+    the number of missiles rather than with its square.
+
+    Leaders are elected in launch order: the group's earliest-launched live missile leads, each
+    further member joins the first leader within its comms range, and a member in range of none
+    becomes a leader itself. A group spread along a stream thus gets one leader per stretch of
+    about a comms range, and when a leader is lost the next election fills its place.
+
+    A summary is a broadcast from the leader whose 'sender_target_estimate' is the mean of
+    the members' estimates, with 'summary_count' (members reported), 'summary_distance_sum'
+    (their total distance to the target) and 'summary_estimate_count' added; guidance weights
+    it by the number of missiles it speaks for. Members hear their own leader's summary with
+    their own report taken out.
+    """
+
+    def __init__(self, comms_range):
+        """:param comms_range: The largest comms range in the swarm (sets the index bucket size)"""
+        self.index = NeighbourIndex(comms_range)
+        self.leaders = set() # unique_ids of the current leaders
+        self.counts = {'reports': 0, 'summaries': 0, 'delivered': 0, 'elections': 0}
+        self._live = {}
+
+    @staticmethod
+    def group_of(missile):
+        return missile.wave_id, missile.missile_type
+
+    def deliver(self, missiles, target_pos):
+        """Runs one round of reports and summaries and fills the live missiles' inboxes."""
+        live = self._live = {missile.unique_id: missile for missile in missiles if missile.alive}
+        for node in [node for node in self.index.positions if node not in live]:
+            self.index.remove(node)
+        groups = {}
+        for node, missile in live.items():
+            self.index.update(node, missile.pos)
+            groups.setdefault(self.group_of(missile), []).append(missile)
+
+        leaders = set()
+        for members in groups.values():
+            for leader, followers in self._elect(members):
+                leaders.add(leader.unique_id)
+                self._summarize(leader, followers, target_pos)
+        self.counts['elections'] += len(leaders - self.leaders)
+        self.leaders = leaders
+
+    @staticmethod
+    def _elect(members):
+        """Splits a group into (leader, members) clusters, the leader being the cluster's first member."""
+        clusters = []
+        for member in sorted(members, key=lambda member: member.launch_index):
+            x, y = member.pos
+            range_sq = member.comms_range ** 2
+            for leader, followers in clusters:
+                if (x - leader.pos[0]) ** 2 + (y - leader.pos[1]) ** 2 <= range_sq:
+                    followers.append(member)
+                    break
+            else:
+                clusters.append((member, [member]))
+        return clusters
+
+    def _summarize(self, leader, members, target_pos):
+        reports = {} # unique_id -> (distance to target, estimate)
+        distance_sum = estimate_x = estimate_y = 0.0
+        estimate_count = 0
+        for member in members:
+            x, y = member.pos
+            distance = math.hypot(target_pos[0] - x, target_pos[1] - y)
+            estimate = member.estimated_target_pos
+            reports[member.unique_id] = (distance, estimate)
+            distance_sum += distance
+            if estimate:
+                estimate_x += estimate[0]
+                estimate_y += estimate[1]
+                estimate_count += 1
+        self.counts['reports'] += len(reports) - 1 # The leader does not report to itself
+        self.counts['summaries'] += 1
+
+        summary = leader.make_broadcast()
+        summary.update(summary_count=len(reports), summary_distance_sum=distance_sum,
+                       summary_estimate_count=estimate_count)
+        if estimate_count:
+            summary['sender_target_estimate'] = (estimate_x / estimate_count, estimate_y / estimate_count)
+
+        for receiver in self._receivers(leader):
+            report = reports.get(receiver.unique_id)
+            if report is None:
+                self._deliver(receiver, summary)
+                continue
+            # A member of the group: its own report taken out
+            if len(reports) == 1:
+                continue # The leader alone: nothing to tell it
+            distance, estimate = report
+            own = dict(summary, summary_count=len(reports) - 1, summary_distance_sum=distance_sum - distance)
+            if estimate:
+                remaining = estimate_count - 1
+                own['summary_estimate_count'] = remaining
+                own['sender_target_estimate'] = (
+                    ((estimate_x - estimate[0]) / remaining, (estimate_y - estimate[1]) / remaining)
+                    if remaining else None
+                )
+            self._deliver(receiver, own)
+
+    def _receivers(self, sender):
+        """The live missiles within the sender's comms range, the sender included."""
+        x, y = sender.pos
+        range_sq = sender.comms_range ** 2
+        positions = self.index.positions
+        missiles = self._live
+        for node in self.index.near(sender.pos):
+            other_x, other_y = positions[node]
+            if (other_x - x) ** 2 + (other_y - y) ** 2 <= range_sq:
+                yield missiles[node]
+
+    def _deliver(self, receiver, message):
+        receiver._receive_message(message)
+        self.counts['delivered'] += 1
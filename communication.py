@@ -1,6 +1,260 @@
+"""
+Degraded missile-to-missile communications.
+
+By default NavalModel delivers every broadcast instantly and intact to every
+missile in range. CommsEngine models an imperfect link instead: each copy of
+a broadcast is delayed (a fixed latency plus random jitter), may be lost, may
+arrive corrupted (its positions perturbed), and a missile can take in only so
+many messages per step. Delivered messages carry the time they were sent
+('sender_timestamp') and whether they were corrupted on the way ('corrupted'),
+so receivers can tell stale or damaged reports from fresh ones.
+
+Copies in flight wait in delivery queues bucketed by the step they are due
+in, so each step only touches the bucket that falls due. Missiles in range of
+each other are found through a NeighbourIndex (see comms_network.py), so the
+cost of a step grows with the number of links and messages, not with the
+square of the swarm size.
+
+DeltaBroadcastPolicy cuts the traffic itself: a missile only transmits when
+what it would say has changed enough since its last transmission, or a
+heartbeat is due, and receivers remember the last message from each
+neighbour instead of starting every step with an empty inbox.
+"""
+import math
+
+from comms_network import NeighbourIndex
+
+# Fields of a broadcast that a corrupted message gets wrong
+_POSITION_FIELDS = ('sender_pos', 'sender_target_estimate')
+
+
 class Message:
+    __slots__ = ('sender_id', 'data', 'timestamp', 'corruption')
+
     def __init__(self, sender_id, data, timestamp, corruption=False):
         self.sender_id = sender_id
         self.data = data
         self.timestamp = timestamp
         self.corruption = corruption
+
+
+class CommsEngine:
+    """
+    Delivers the swarm's broadcasts over lossy, delayed, bandwidth-limited links.
+    Running totals of what happened to the messages are kept in `counts`.
+    """
+
+    def __init__(self, model, comms_range, latency=0.0, jitter=0.0, bandwidth=None, loss=0.0,
+                 corruption=0.0, corruption_std=5.0):
+        """
+        :param comms_range: The largest comms range in the swarm (sets the index bucket size)
+        :param latency: Time a message takes to arrive; it is delivered at the first step at or after then
+        :param jitter: Extra delay drawn uniformly from [0, jitter] per message
+        :param bandwidth: Most messages a missile can receive per step (None: no limit); the
+            excess is dropped, earliest sent kept
+        :param loss: Probability that a message is lost
+        :param corruption: Probability that a delivered message is corrupted
+        :param corruption_std: Standard deviation of the error added to each coordinate of a
+            corrupted message's positions
+        """
+        self.model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.loss = loss
+        self.corruption = corruption
+        self.corruption_std = corruption_std
+        # Own stream, so that comms faults do not shift the randomness the tactics draw
+        self.random = model.random_stream('comms')
+
+        self.index = NeighbourIndex(comms_range)
+        self.queues = {} # Due step -> [(receiver, Message), ...] in sending order
+        self.counts = {'sent': 0, 'delivered': 0, 'lost': 0, 'corrupted': 0, 'over_bandwidth': 0, 'undeliverable': 0}
+
+    def exchange(self, missiles):
+        """Sends this step's broadcasts of the live missiles, then delivers everything due now."""
+        live = {missile.unique_id: missile for missile in missiles if missile.alive}
+        for node in [node for node in self.index.positions if node not in live]:
+            self.index.remove(node)
+        for node, missile in live.items():
+            self.index.update(node, missile.pos)
+
+        self._send(live)
+        self._deliver()
+
+    def _send(self, live):
+        model = self.model
+        messages = {}
+        for missile, data in model.outgoing_broadcasts(live.values()):
+            # The broadcast dict is what receivers get, so the envelope's fields go into it too
+            data['sender_timestamp'] = model.sim_time
+            data['corrupted'] = False
+            messages[missile.unique_id] = Message(missile.unique_id, data, model.sim_time)
+        ranges_sq = {node: missile.comms_range * missile.comms_range for node, missile in live.items()}
+
+        # Every (receiver, message) link in range, each direction tested against its sender's range
+        links = []
+        positions = self.index.positions
+        for a, b in self.index.candidate_pairs():
+            message_a, message_b = messages.get(a), messages.get(b)
+            if message_a is None and message_b is None:
+                continue # Neither transmits this step (see DeltaBroadcastPolicy)
+            (a_x, a_y), (b_x, b_y) = positions[a], positions[b]
+            distance_sq = (a_x - b_x) ** 2 + (a_y - b_y) ** 2
+            if message_a is not None and distance_sq <= ranges_sq[a]:
+                links.append((live[b], message_a))
+            if message_b is not None and distance_sq <= ranges_sq[b]:
+                links.append((live[a], message_b))
+        self.counts['sent'] += len(links)
+
+        if self.loss:
+            lost = self._fault_indices(len(links), self.loss)
+            if lost:
+                self.counts['lost'] += len(lost)
+                bounds = [-1] + lost + [len(links)]
+                links = [link for start, stop in zip(bounds, bounds[1:]) for link in links[start + 1:stop]]
+        if self.corruption:
+            for index in self._fault_indices(len(links), self.corruption):
+                receiver, message = links[index]
+                links[index] = (receiver, self._corrupt(message))
+
+        if not self.jitter:
+            self._queue(self._due_step(self.latency), links)
+            return
+        steps, dt, latency, jitter, uniform = model.steps, model.dt, self.latency, self.jitter, self.random.random
+        queues = self.queues
+        for link in links:
+            due = steps + max(0, math.ceil((latency + uniform() * jitter) / dt - 1e-9))
+            queue = queues.get(due)
+            if queue is None:
+                queues[due] = [link]
+            else:
+                queue.append(link)
+
+    def _fault_indices(self, count, probability):
+        """
+        Sorted indices out of range(count) that suffer a fault of the given probability each.
+        The gaps between faults are drawn (geometrically distributed) rather than one draw per
+        link, so the cost is in proportion to the number of faults.
+        """
+        if probability >= 1:
+            return list(range(count))
+        uniform = self.random.random
+        log_survival = math.log(1.0 - probability)
+        indices = []
+        index = -1
+        while True:
+            index += 1 + int(math.log(1.0 - uniform()) / log_survival)
+            if index >= count:
+                return indices
+            indices.append(index)
+
+    def _due_step(self, delay):
+        """The first step at or after `delay` time units from now."""
+        return self.model.steps + max(0, math.ceil(delay / self.model.dt - 1e-9))
+
+    def _queue(self, due, links):
+        queue = self.queues.get(due)
+        if queue is None:
+            self.queues[due] = list(links)
+        else:
+            queue.extend(links)
+
+    def _corrupt(self, message):
+        """A copy of the message whose position fields are off by random errors."""
+        self.counts['corrupted'] += 1
+        data = dict(message.data, corrupted=True)
+        for field in _POSITION_FIELDS:
+            value = data.get(field)
+            if value is not None:
+                data[field] = tuple(v + self.random.gauss(0, self.corruption_std) for v in value)
+        return Message(message.sender_id, data, message.timestamp, corruption=True)
+
+    def _deliver(self):
+        queue = self.queues.pop(self.model.steps, None)
+        if not queue:
+            return
+        bandwidth = self.bandwidth
+        received = {} # unique_id -> messages taken this step; with delta broadcasting the inbox is the neighbour table
+        undeliverable = over_bandwidth = 0
+        for receiver, message in queue:
+            if not receiver.alive:
+                undeliverable += 1
+                continue
+            if bandwidth is not None:
+                taken = received.get(receiver.unique_id, 0)
+                if taken >= bandwidth:
+                    over_bandwidth += 1
+                    continue
+                received[receiver.unique_id] = taken + 1
+            receiver._receive_message(message.data)
+        self.counts['delivered'] += len(queue) - undeliverable - over_bandwidth
+        self.counts['undeliverable'] += undeliverable
+        self.counts['over_bandwidth'] += over_bandwidth
+
+
+class DeltaBroadcastPolicy:
+    """
+    Missiles transmit only when their broadcast position, target estimate or fuel has moved
+    beyond a threshold since their last transmission, or when a heartbeat is due. Each
+    missile keeps the latest message from every neighbour in its neighbour_table, and its
+    inbox is a live view of that table. An entry is dropped when it is older than `expiry`,
+    so neighbours that died or went out of range are forgotten.
+    """
+
+    def __init__(self, position=2.0, estimate=2.0, fuel=25.0, heartbeat=10.0, expiry=None):
+        """
+        :param position: Distance (cells) the sender must have moved since its last transmission
+        :param estimate: Distance its target estimate must have shifted
+        :param fuel: Fuel it must have burnt (None: fuel never triggers a transmission)
+        :param heartbeat: Time after which it transmits anyway
+        :param expiry: Age at which a remembered message is dropped (default: two heartbeats)
+        """
+        self.position = position
+        self.estimate = estimate
+        self.fuel = fuel
+        self.heartbeat = heartbeat
+        self.expiry = expiry if expiry is not None else 2 * heartbeat
+
+    def prepare_inboxes(self, missiles, time):
+        """Forgets expired messages and points each missile's inbox at its neighbour table."""
+        expiry = self.expiry
+        for missile in missiles:
+            table = missile.neighbour_table
+            if table is None:
+                table = missile.neighbour_table = {}
+            elif table:
+                stale = [sender for sender, message in table.items() if time - message['sent_time'] > expiry]
+                for sender in stale:
+                    del table[sender]
+            missile.incoming_messages = table.values()
+
+    def outgoing(self, missiles, time):
+        """(missile, message) for each of the missiles that transmits this step."""
+        outgoing = []
+        for missile in missiles:
+            if self._due(missile, time):
+                message = missile.make_broadcast()
+                message['sent_time'] = time
+                missile.last_broadcast = (missile.pos, missile.estimated_target_pos, missile.fuel, time)
+                outgoing.append((missile, message))
+        return outgoing
+
+    def _due(self, missile, time):
+        last = missile.last_broadcast
+        if last is None:
+            return True
+        pos, estimate, fuel, sent_time = last
+        if time - sent_time >= self.heartbeat - 1e-9:
+            return True
+        if math.hypot(missile.pos[0] - pos[0], missile.pos[1] - pos[1]) >= self.position:
+            return True
+        if self.fuel is not None and fuel - missile.fuel >= self.fuel:
+            return True
+        current = missile.estimated_target_pos
+        if current is not estimate:
+            if current is None or estimate is None:
+                return True
+            if math.hypot(current[0] - estimate[0], current[1] - estimate[1]) >= self.estimate:
+                return True
+        return False
@@ -0,0 +1,118 @@
+"""
+Paired comparison of swarm modes using common random numbers.
+
+Replicate r runs every mode with the same seed. Target manoeuvres and sensor
+noise come from streams keyed on the seed (NavalModel.random_stream) rather
+than from the stream the tactics consume, and runs use the synchronous update
+mode so that what the TRU sees does not depend on activation order. Within a
+replicate every mode therefore faces the identical target track and the same
+sensor measurements, and the per-replicate differences between modes are much
+less noisy than differences between independent runs.
+
+    python crn_compare.py --modes OVERWHELM WAVE SPLIT_AXIS --replicates 30
+"""
+import argparse
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_runner import RunningStat
+from headless import run_headless
+from swarm_modes import SwarmMode
+
+METRICS = ('hit_rate', 'mean_time_to_impact')
+
+
+def _independent_half_width(a, b, confidence):
+    """CI half-width of mean(a) - mean(b) had a and b been sampled independently (Welch)."""
+    from scipy.stats import t
+    va, vb = a.variance / a.count, b.variance / b.count
+    if va + vb == 0:
+        return 0.0
+    dof = (va + vb) ** 2 / (va ** 2 / (a.count - 1) + vb ** 2 / (b.count - 1))
+    return t.ppf(0.5 + confidence / 2, dof) * math.sqrt(va + vb)
+
+
+def compare_modes(modes, replicates=30, baseline=None, confidence=0.95, workers=None, base_seed=0,
+                  update_mode='synchronous', **run_kwargs):
+    """
+    Runs every mode on the same replicates and compares each against a baseline mode.
+
+    :param modes: SwarmModes to compare
+    :param replicates: Number of seeds; every mode runs on each of them
+    :param baseline: Mode the others are compared with (default: the first)
+    :param workers: Worker processes (default: one per CPU)
+    :param update_mode: Passed to the model; 'synchronous' keeps the target track identical across modes
+    :param run_kwargs: Further run_headless / NavalModel arguments
+    :returns: Dict mode -> metric -> {'mean', 'ci', 'diff', 'diff_ci', 'independent_ci', 'pairs'}, where
+        diff is the mean paired difference from the baseline, diff_ci its CI half-width, and
+        independent_ci the half-width the same comparison would have from unpaired runs
+    """
+    baseline = baseline or modes[0]
+    jobs = [(mode, base_seed + replicate) for replicate in range(replicates) for mode in modes]
+
+    workers = workers or multiprocessing.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [
+            executor.submit(run_headless, swarm_mode=mode, seed=seed, update_mode=update_mode, **run_kwargs)
+            for mode, seed in jobs
+        ]
+        results = {}
+        for (mode, seed), future in zip(jobs, futures):
+            results[mode, seed] = future.result()
+
+    report = {}
+    for mode in modes:
+        report[mode] = {}
+        for metric in METRICS:
+            values, baseline_values, differences = RunningStat(), RunningStat(), RunningStat()
+            for replicate in range(replicates):
+                seed = base_seed + replicate
+                value, baseline_value = results[mode, seed][metric], results[baseline, seed][metric]
+                if value is None or baseline_value is None:
+                    continue # No hits in one of the pair: no time to impact to compare
+                values.add(value)
+                baseline_values.add(baseline_value)
+                differences.add(value - baseline_value)
+            report[mode][metric] = {
+                'mean': values.mean if values.count else None,
+                'ci': values.half_width(confidence),
+                'diff': differences.mean if differences.count else None,
+                'diff_ci': differences.half_width(confidence),
+                'independent_ci': _independent_half_width(values, baseline_values, confidence)
+                if values.count > 1 else math.inf,
+                'pairs': differences.count,
+            }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['OVERWHELM', 'WAVE', 'SPLIT_AXIS'],
+                        choices=[m.name for m in SwarmMode])
+    parser.add_argument('--replicates', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0, help="Base seed")
+    args = parser.parse_args(argv)
+
+    modes = [SwarmMode[name] for name in args.modes]
+    report = compare_modes(modes, args.replicates, workers=args.workers, base_seed=args.seed, max_steps=args.max_steps)
+
+    baseline = modes[0].name
+    for metric in METRICS:
+        print(f"\n{metric} (differences from {baseline}; CI half-widths paired vs. independent runs)")
+        for mode, metrics in report.items():
+            result = metrics[metric]
+            if result['mean'] is None:
+                print(f"  {mode.name:<12} no data")
+                continue
+            line = f"  {mode.name:<12} {result['mean']:9.3f} ± {result['ci']:.3f}"
+            if mode.name != baseline:
+                line += (f"   diff {result['diff']:+9.3f} ± {result['diff_ci']:.3f}"
+                         f"   (independent ± {result['independent_ci']:.3f}, {result['pairs']} pairs)")
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
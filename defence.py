@@ -0,0 +1,133 @@
+"""
+Point defence for the target.
+
+TargetDefence gives the target a number of engagement channels, each of which
+fires one interceptor and is then busy reloading. Whenever a channel is free
+it engages the threat that will arrive soonest, provided it arrives within the
+engagement window, and kills it with some probability.
+
+Threats are kept in a heap keyed on their predicted arrival time (now plus
+distance over closing speed) rather than on time-to-go. A missile holding its
+course and speed keeps the same arrival time while its time-to-go shrinks, so
+its entry stays valid: only missiles whose predicted arrival has drifted by
+more than a tolerance (they sped up, slowed down or turned) are pushed again.
+Superseded entries and those of missiles that have gone are left in the heap
+and skipped when they come to the top, so each engagement costs O(log N)
+however many missiles are in flight, and nothing is ever re-sorted.
+"""
+import heapq
+import itertools
+import math
+
+
+class TargetDefence:
+    """
+    Engagement channels that intercept the missiles about to arrive first.
+    Running totals are kept in `counts`.
+    """
+
+    def __init__(self, model, channels=2, reload_time=10.0, engagement_time=20.0, kill_probability=0.7,
+                 tolerance=1.0):
+        """
+        :param channels: Number of interceptors that can be in the air at once
+        :param reload_time: Time a channel is busy after each shot
+        :param engagement_time: Threats are engaged once they are predicted to arrive within this time;
+            decoys break away before they are about 20 out, so a much shorter window never engages them
+        :param kill_probability: Probability that an interceptor kills its threat
+        :param tolerance: Drift in a threat's predicted arrival time that makes it re-queued
+        """
+        if channels < 1:
+            raise ValueError("A defence needs at least one channel")
+        self.reload_time = reload_time
+        self.engagement_time = engagement_time
+        self.kill_probability = kill_probability
+        self.tolerance = tolerance
+        # Own stream, so that interceptor shots do not shift the randomness the tactics draw
+        self.random = model.random_stream('defence')
+
+        self.channels_ready = [0.0] * channels # Time each channel can fire again
+        self.threats = [] # Heap of (arrival time, sequence, missile); may hold superseded entries
+        self.keys = {} # unique_id -> (arrival time, sequence) of a missile's current entry
+        self._sequence = itertools.count()
+        self.counts = {'engagements': 0, 'kills': 0, 'misses': 0, 'requeued': 0}
+
+    def update(self, missiles, target_pos, time):
+        """Re-keys the missiles whose predicted arrival has drifted; the others keep their entries."""
+        keys, tolerance = self.keys, self.tolerance
+        target_x, target_y = target_pos
+        for missile in missiles:
+            if not missile.alive:
+                continue
+            x, y = missile.float_pos
+            dx, dy = target_x - x, target_y - y
+            distance = math.hypot(dx, dy)
+            direction_x, direction_y = missile.direction if missile.direction is not None else (0, 0)
+            closing_speed = missile.speed * (direction_x * dx + direction_y * dy) / distance if distance else missile.speed
+            key = keys.get(missile.unique_id)
+            if closing_speed <= 0:
+                if key is not None:
+                    del keys[missile.unique_id] # Heading away: no longer a threat
+                continue
+            arrival = time + distance / closing_speed
+            if key is None or abs(arrival - key[0]) > tolerance:
+                if key is not None:
+                    self.counts['requeued'] += 1
+                self._push(missile, arrival)
+
+        if len(self.threats) > 2 * len(keys) + 64:
+            self._compact()
+
+    def engage(self, time):
+        """Fires every free channel at the threat arriving soonest within the engagement window."""
+        horizon = time + self.engagement_time
+        for channel, ready in enumerate(self.channels_ready):
+            if ready > time + 1e-9:
+                continue
+            threat = self._pop(horizon)
+            if threat is None:
+                break # Nothing in the window: the other free channels would find nothing either
+            missile, arrival = threat
+            self.channels_ready[channel] = time + self.reload_time
+            self.counts['engagements'] += 1
+            if self.random.random() < self.kill_probability:
+                self.counts['kills'] += 1
+                missile.retire('intercepted', exploded=True)
+                print(f"[Missile {missile.unique_id}] Intercepted by the target's defence.")
+            else:
+                self.counts['misses'] += 1
+                self._push(missile, arrival) # Still coming: another free channel may take it on
+
+    def _push(self, missile, arrival):
+        sequence = next(self._sequence)
+        self.keys[missile.unique_id] = (arrival, sequence)
+        heapq.heappush(self.threats, (arrival, sequence, missile))
+
+    def _pop(self, horizon):
+        """(missile, arrival) of the soonest live threat arriving by `horizon`, taken off the heap, or None."""
+        threats, keys = self.threats, self.keys
+        while threats:
+            arrival, sequence, missile = threats[0]
+            key = keys.get(missile.unique_id)
+            if key is None or key[1] != sequence or not missile.alive:
+                heapq.heappop(threats) # Superseded, or the missile has gone
+                if key is not None and not missile.alive:
+                    del keys[missile.unique_id]
+                continue
+            if arrival > horizon:
+                return None
+            heapq.heappop(threats)
+            del keys[missile.unique_id]
+            return missile, arrival
+        return None
+
+    def _compact(self):
+        """Drops superseded entries and missiles that have gone, once they outnumber the live ones."""
+        keys = self.keys
+        self.threats = [
+            entry for entry in self.threats
+            if entry[2].alive and keys.get(entry[2].unique_id, (None, None))[1] == entry[1]
+        ]
+        heapq.heapify(self.threats)
+        live = {entry[2].unique_id for entry in self.threats}
+        for unique_id in [unique_id for unique_id in keys if unique_id not in live]:
+            del keys[unique_id]
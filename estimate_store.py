@@ -0,0 +1,46 @@
+"""
+Versioned, published target estimates.
+
+TRUs publish into the model's EstimateStore only when they have a new
+estimate (once per sweep), instead of the model copying the estimate into
+every missile every step. A publication becomes visible when the model
+commits the store at its estimate phase, so every missile sees the same
+estimate for the whole step whatever the stepping order. Missiles compare
+the visible version with the one they last took (MissileAgent.pull_estimate)
+and only then take the new one, by reference: published positions are
+tuples and are never modified.
+
+Each publication records where it came from (an EstimateSource and the
+publishing agent), and missiles keep the source of whatever estimate they
+are currently steering by.
+"""
+from collections import namedtuple
+
+# position: (x, y) tuple, or a TrackEstimate from a tracking TRU
+PublishedEstimate = namedtuple('PublishedEstimate', ['position', 'version', 'source', 'publisher', 'time'])
+
+
+class EstimateStore:
+    """The latest published target estimate, double-buffered per step."""
+
+    def __init__(self):
+        self.current = None # Visible to missiles this step
+        self.pending = None # Published this step; visible after the next commit()
+        self.version = 0
+
+    def publish(self, position, source, publisher, time):
+        """Publishes a new estimate; with several publishers in one step the last one wins."""
+        self.version += 1
+        if not hasattr(position, 'velocity'):
+            position = tuple(position)
+        self.pending = PublishedEstimate(position, self.version, source, publisher, time)
+
+    def commit(self):
+        """Makes the latest publication visible. Called by the model once per step."""
+        if self.pending is not None:
+            self.current, self.pending = self.pending, None
+        return self.current
+
+    def adopt(self, published):
+        """Mirrors another store's visible estimate (a strip worker following the main model)."""
+        self.current = published
@@ -0,0 +1,369 @@
+"""
+Headless export of an engagement to an animation.
+
+A RunRecording captures what the Solara app draws (missile positions, the
+target, where missiles exploded) once per step, in a few compact arrays; it
+can be saved and exported later, or recorded and exported in one go.
+
+Frames are drawn with matplotlib's Agg backend. The axes, the TRU and the
+background are drawn once, and each frame only updates the data of a few
+persistent artists (missiles, trails, explosions, target, step counter) and
+blits them over the saved background. The frame range is split into
+contiguous segments, one per worker process, and the segments are joined at
+the end:
+
+- a directory: PNG frames, written straight to it by the workers;
+- .gif: the workers write palette frames, which are assembled with Pillow,
+  reading one frame file at a time;
+- .mp4: each worker pipes its frames into its own ffmpeg encode, and the
+  segments are concatenated without re-encoding (needs ffmpeg on the PATH).
+
+    python export_animation.py --mode OVERWHELM --missiles 250 --max-steps 400 --out overwhelm.mp4
+    python export_animation.py --recording run.npz --out frames/
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from swarm_modes import MissileType, SwarmMode
+
+# Outcomes drawn as explosions; the colours follow the Solara app (app.MissileGrid)
+EXPLODED_OUTCOMES = ('hit', 'intercepted', 'self_destruct')
+ATTACKER_COLOUR = 'blue'
+SCOUT_COLOUR = 'lightblue'
+EXPLODED_COLOUR = 'red'
+TARGET_COLOUR = 'green'
+TRU_COLOUR = 'purple'
+
+
+class RunRecording:
+    """Per-step positions of a run's missiles and target, for rendering."""
+
+    def __init__(self, width, height, tru_pos=None, title=''):
+        self.width = width
+        self.height = height
+        self.tru_pos = tru_pos
+        self.title = title
+        self.steps = [] # Model step of each frame
+        self.missiles = [] # Per frame: (ids int32 (n,), positions float32 (n, 2), scout flags bool (n,))
+        self.targets = [] # Per frame: target position
+        self.explosions = [] # (frame, x, y) of every missile that exploded, in order
+        self._outcomes_seen = 0
+
+    def __len__(self):
+        return len(self.steps)
+
+    @classmethod
+    def for_model(cls, model):
+        from TargetReportingUnit import TargetReportingUnit
+        tru = next((agent for agent in model.agents if isinstance(agent, TargetReportingUnit)), None)
+        return cls(model.grid.width, model.grid.height, tru.pos if tru is not None else None,
+                   title=model.swarm_mode.name)
+
+    def capture(self, model):
+        """Records the current state of `model` as the next frame."""
+        from base_agent import MissileAgent
+
+        if model.strip_engine is not None:
+            raise ValueError("The missiles of a parallel model live in its workers; record without parallel_strips")
+        missiles = [agent for agent in model.agents if isinstance(agent, MissileAgent) and agent.alive]
+        ids = np.fromiter((missile.unique_id for missile in missiles), dtype=np.int32, count=len(missiles))
+        positions = np.array([missile.float_pos for missile in missiles], dtype=np.float32).reshape(-1, 2)
+        scouts = np.fromiter((missile.missile_type == MissileType.SCOUT for missile in missiles), dtype=bool,
+                             count=len(missiles))
+        frame = len(self.steps)
+        self.steps.append(model.steps)
+        self.missiles.append((ids, positions, scouts))
+        self.targets.append((model.target.pos[0], model.target.float_y))
+        for outcome in model.outcomes[self._outcomes_seen:]:
+            if outcome['outcome'] in EXPLODED_OUTCOMES:
+                self.explosions.append((frame, outcome['pos'][0], outcome['pos'][1]))
+        self._outcomes_seen = len(model.outcomes)
+
+    def save(self, path):
+        """Writes the recording to a .npz file."""
+        counts = np.array([len(ids) for ids, _, _ in self.missiles], dtype=np.int64)
+        np.savez_compressed(
+            path,
+            arena=np.array([self.width, self.height]),
+            tru=np.array(self.tru_pos if self.tru_pos is not None else (np.nan, np.nan), dtype=float),
+            title=np.array(self.title),
+            steps=np.array(self.steps, dtype=np.int64),
+            counts=counts,
+            ids=np.concatenate([ids for ids, _, _ in self.missiles]) if self.missiles else np.zeros(0, np.int32),
+            positions=np.concatenate([p for _, p, _ in self.missiles]) if self.missiles else np.zeros((0, 2), np.float32),
+            scouts=np.concatenate([s for _, _, s in self.missiles]) if self.missiles else np.zeros(0, bool),
+            targets=np.array(self.targets, dtype=float).reshape(-1, 2),
+            explosions=np.array(self.explosions, dtype=float).reshape(-1, 3),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Reads a recording written by save()."""
+        with np.load(path) as data:
+            width, height = data['arena'].tolist()
+            tru = data['tru'].tolist()
+            recording = cls(int(width), int(height), None if math.isnan(tru[0]) else tuple(tru), str(data['title']))
+            recording.steps = data['steps'].tolist()
+            bounds = np.concatenate([[0], np.cumsum(data['counts'])])
+            ids, positions, scouts = data['ids'], data['positions'], data['scouts']
+            recording.missiles = [
+                (ids[start:stop], positions[start:stop], scouts[start:stop]) for start, stop in zip(bounds, bounds[1:])
+            ]
+            recording.targets = [tuple(target) for target in data['targets'].tolist()]
+            recording.explosions = [(int(frame), x, y) for frame, x, y in data['explosions'].tolist()]
+        return recording
+
+
+def record_run(max_steps=1000, seed=None, quiet=True, **model_kwargs):
+    """
+    Runs an engagement like headless.run_headless and records every step.
+
+    :returns: RunRecording, with the initial state as frame 0
+    """
+    from headless import quiet_output, simulation_finished
+    from model import NavalModel
+
+    with quiet_output(quiet):
+        model = NavalModel(seed=seed, **model_kwargs)
+        try:
+            recording = RunRecording.for_model(model)
+            recording.capture(model)
+            while model.steps < max_steps and not simulation_finished(model):
+                model.step()
+                recording.capture(model)
+        finally:
+            model.close()
+    return recording
+
+
+class _FrameRenderer:
+    """One figure whose animated artists are updated and blitted frame by frame."""
+
+    def __init__(self, recording, width_inches=10.0, dpi=100, trail=20):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+        from matplotlib.figure import Figure
+
+        self.recording = recording
+        self.trail = trail
+        self.trails = {} # Missile id -> deque of its last positions, as of the last frame rendered
+        self.last_frame = None
+
+        # Height to the arena's aspect plus room for the step counter; whole even pixels for video encoders
+        width_px = 2 * round(width_inches * dpi / 2)
+        height_px = 2 * math.ceil((width_px * recording.height / recording.width + 0.25 * dpi) / 2)
+        self.figure = Figure(figsize=(width_px / dpi, height_px / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.axes = self.figure.add_axes((0.01, 0.01, 0.98, 0.98 * width_px * recording.height / recording.width / height_px))
+        ax.set_xlim(0, recording.width)
+        ax.set_ylim(0, recording.height)
+        ax.set_xticks([])
+        ax.set_yticks([])
+        if recording.tru_pos is not None:
+            ax.plot(recording.tru_pos[0] + 0.5, recording.tru_pos[1] + 0.5, "^", color=TRU_COLOUR, markersize=8)
+
+        self.trail_lines = LineCollection([], linewidths=1, alpha=0.5, animated=True)
+        ax.add_collection(self.trail_lines)
+        self.explosion_marks = ax.scatter([], [], marker='x', color=EXPLODED_COLOUR, s=20, animated=True)
+        self.missile_marks = ax.scatter([], [], s=12, animated=True)
+        self.target_mark, = ax.plot([], [], "s", color=TARGET_COLOUR, markersize=8, animated=True)
+        self.label = self.figure.text(0.01, 0.99, '', va='top', ha='left', fontsize=9, animated=True)
+        self.animated = (self.trail_lines, self.explosion_marks, self.missile_marks, self.target_mark)
+
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.explosions = np.array(recording.explosions, dtype=float).reshape(-1, 3)
+        self.size = (width_px, height_px)
+
+    def render(self, frame):
+        """The RGBA pixels of a frame, as an (height, width, 4) uint8 array (a view, valid until the next call)."""
+        self._advance_trails(frame)
+        ids, positions, scouts = self.recording.missiles[frame]
+        colours = np.where(scouts, SCOUT_COLOUR, ATTACKER_COLOUR)
+        centres = positions.astype(float) + 0.5
+
+        self.missile_marks.set_offsets(centres)
+        self.missile_marks.set_color(colours)
+        segments, segment_colours = [], []
+        for missile_id, colour in zip(ids.tolist(), colours.tolist()):
+            points = self.trails[missile_id]
+            if len(points) > 1:
+                segments.append(np.asarray(points) + 0.5)
+                segment_colours.append(colour)
+        self.trail_lines.set_segments(segments)
+        self.trail_lines.set_color(segment_colours)
+        exploded = self.explosions[self.explosions[:, 0] <= frame]
+        self.explosion_marks.set_offsets(exploded[:, 1:] + 0.5 if len(exploded) else np.zeros((0, 2)))
+        target_x, target_y = self.recording.targets[frame]
+        self.target_mark.set_data([target_x + 0.5], [target_y + 0.5])
+        self.label.set_text(f"{self.recording.title}  step {self.recording.steps[frame]}  "
+                            f"missiles {len(ids)}  exploded {len(exploded)}")
+
+        self.canvas.restore_region(self.background)
+        for artist in self.animated:
+            self.axes.draw_artist(artist)
+        self.figure.draw_artist(self.label)
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def _advance_trails(self, frame):
+        """Brings the trails up to `frame`, replaying the frames before it when starting mid-run."""
+        if self.last_frame is None or frame != self.last_frame + 1:
+            self.trails = {}
+            first = max(0, frame - self.trail + 1)
+        else:
+            first = frame
+        for replayed in range(first, frame + 1):
+            ids, positions, _ = self.recording.missiles[replayed]
+            trails = {}
+            for missile_id, position in zip(ids.tolist(), positions.tolist()):
+                points = self.trails.get(missile_id)
+                if points is None:
+                    points = deque(maxlen=self.trail)
+                points.append(position)
+                trails[missile_id] = points
+            self.trails = trails # Missiles gone from the frame lose their trails
+        self.last_frame = frame
+
+
+def _render_segment(recording, start, stop, kind, path, fps, options):
+    """
+    Worker: renders frames [start, stop) as PNG files, or as palette GIF frames (quantized here, in
+    parallel, rather than when the GIF is assembled), into directory `path`; or as one video segment
+    at `path`.
+    """
+    renderer = _FrameRenderer(recording, **options)
+    if kind in ('png', 'gif'):
+        from PIL import Image
+        for frame in range(start, stop):
+            image = Image.fromarray(renderer.render(frame)[:, :, :3])
+            if kind == 'gif':
+                image.quantize(colors=64, method=Image.Quantize.FASTOCTREE).save(os.path.join(path, f'frame_{frame:05d}.gif'))
+            else:
+                image.save(os.path.join(path, f'frame_{frame:05d}.png'), compress_level=1)
+        return stop - start
+
+    width, height = renderer.size
+    encoder = subprocess.Popen(
+        ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
+         '-r', str(fps), '-i', '-', '-c:v', 'libx264', '-pix_fmt', 'yuv420p', path],
+        stdin=subprocess.PIPE,
+    )
+    try:
+        for frame in range(start, stop):
+            encoder.stdin.write(renderer.render(frame).tobytes())
+    finally:
+        encoder.stdin.close()
+    if encoder.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed encoding frames {start}-{stop}")
+    return stop - start
+
+
+def _gif_frames(paths):
+    """The frames in `paths`, each read into memory and its file closed before the next is opened."""
+    from PIL import Image
+
+    for path in paths:
+        with Image.open(path) as image:
+            frame = image.copy()
+        yield frame
+
+
+def export(recording, out, fps=20, workers=None, frames=None, trail=20, width_inches=10.0, dpi=100):
+    """
+    Renders a recording to a PNG directory, a GIF or an MP4, over a pool of worker processes.
+
+    :param out: Output path: ending in .gif or .mp4, otherwise (with no extension) a directory for PNG frames
+    :param fps: Frames per second of the GIF or MP4
+    :param workers: Worker processes (default: one per CPU); each renders one contiguous segment
+    :param frames: Optional range of frames to export (default: all)
+    :param trail: Frames of trail drawn behind each missile (0 or 1: none)
+    :param width_inches: Figure width; with dpi, sets the image size
+    :returns: Number of frames exported
+    """
+    frames = range(len(recording)) if frames is None else frames
+    if not len(frames):
+        return 0
+    extension = os.path.splitext(out)[1].lower()
+    if extension not in ('', '.gif', '.mp4'):
+        raise ValueError(f"Cannot export to {extension} files; export a .gif, an .mp4 or a directory of PNG frames")
+    if extension == '.mp4' and shutil.which('ffmpeg') is None:
+        raise RuntimeError("MP4 export needs ffmpeg on the PATH; install it, or export a .gif or PNG frames instead")
+
+    workers = min(workers or multiprocessing.cpu_count(), len(frames))
+    bounds = [frames[0] + len(frames) * k // workers for k in range(workers + 1)]
+    segments = list(zip(bounds, bounds[1:]))
+    options = {'trail': max(1, trail), 'width_inches': width_inches, 'dpi': dpi}
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if extension == '.mp4':
+            paths = [os.path.join(scratch, f'segment_{k:03d}.mp4') for k in range(len(segments))]
+            kind = 'mp4'
+        else:
+            directory = scratch if extension == '.gif' else out
+            os.makedirs(directory, exist_ok=True)
+            paths = [directory] * len(segments)
+            kind = 'gif' if extension == '.gif' else 'png'
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(_render_segment, recording, start, stop, kind, path, fps, options)
+                for (start, stop), path in zip(segments, paths)
+            ]
+            exported = sum(future.result() for future in futures)
+
+        if extension == '.mp4':
+            listing = os.path.join(scratch, 'segments.txt')
+            with open(listing, 'w') as file:
+                file.writelines(f"file '{path}'\n" for path in paths)
+            subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', listing,
+                            '-c', 'copy', out], check=True)
+        elif extension == '.gif':
+            # Frames are opened one at a time: holding every file open runs into the open-file limit on long runs
+            images = _gif_frames([os.path.join(scratch, f'frame_{frame:05d}.gif') for frame in frames])
+            first = next(images)
+            first.save(out, save_all=True, append_images=images, duration=round(1000 / fps), loop=0, optimize=False)
+    return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recording', default=None, help="Export this saved recording instead of running a new engagement")
+    parser.add_argument('--save-recording', default=None, help="Also save the new engagement's recording here (.npz)")
+    parser.add_argument('--mode', default='OVERWHELM', choices=[mode.name for mode in SwarmMode])
+    parser.add_argument('--missiles', type=int, default=25)
+    parser.add_argument('--launch-interval', type=float, default=30)
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', required=True, help="Output: .mp4, .gif, or a directory for PNG frames")
+    parser.add_argument('--fps', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--trail', type=int, default=20, help="Frames of trail behind each missile")
+    parser.add_argument('--dpi', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.recording:
+        recording = RunRecording.load(args.recording)
+    else:
+        recording = record_run(max_steps=args.max_steps, seed=args.seed, swarm_mode=SwarmMode[args.mode],
+                               num_missiles=args.missiles, launch_interval=args.launch_interval)
+        if args.save_recording:
+            recording.save(args.save_recording)
+    recorded = time.perf_counter()
+    exported = export(recording, args.out, fps=args.fps, workers=args.workers, trail=args.trail, dpi=args.dpi)
+    print(f"{exported} frames -> {args.out} (recording {recorded - start:.1f} s, export {time.perf_counter() - recorded:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,62 @@
 import math
-import random
-from swarm_modes import SwarmMode, MissileType, RecceState
+from swarm_modes import SwarmMode, MissileType, RecceState, EstimateSource
 from target_agent import TargetAgent # Import TargetAgent as it's used in some strategies
 
 
-def _fuse_estimates(estimates_list):
-    """Helper to average a list of estimated target positions."""
+def _fuse_estimates(estimates_list, weights=None):
+    """Helper to average a list of estimated target positions, optionally weighted."""
     if not estimates_list:
         return None
-    
-    avg_x = sum(e[0] for e in estimates_list) / len(estimates_list)
-    avg_y = sum(e[1] for e in estimates_list) / len(estimates_list)
+
+    if weights is None or all(w == 1 for w in weights): # Unweighted: the plain average, bit for bit
+        avg_x = sum(e[0] for e in estimates_list) / len(estimates_list)
+        avg_y = sum(e[1] for e in estimates_list) / len(estimates_list)
+    else:
+        total = sum(weights)
+        avg_x = sum(e[0] * w for e, w in zip(estimates_list, weights)) / total
+        avg_y = sum(e[1] * w for e, w in zip(estimates_list, weights)) / total
     return [avg_x, avg_y]
 
 
+def _message_estimates(messages, estimates, weights):
+    """
+    Appends the target estimate of each message to estimates, and to weights how many missiles
+    it speaks for: one, or the members of a leader's summary (see comms_network.LeaderHierarchy).
+    """
+    for message in messages:
+        estimate = message.get('sender_target_estimate')
+        if estimate:
+            estimates.append(estimate)
+            weights.append(message.get('summary_estimate_count', 1))
+
+
+def _sum_distances(messages, target_pos, total=0.0, count=0):
+    """
+    Adds up the distances to the target of the missiles the messages speak for, and counts them.
+    A leader's summary brings its members' total; other messages the sender's own distance.
+    """
+    for message in messages:
+        summary_count = message.get('summary_count')
+        if summary_count is not None:
+            total += message['summary_distance_sum']
+            count += summary_count
+            continue
+        sender_pos = message.get('sender_pos')
+        if sender_pos:
+            total += math.hypot(target_pos[0] - sender_pos[0], target_pos[1] - sender_pos[1])
+            count += 1
+    return total, count
+
+
+def _steer_by_fused(missile, estimates_list, weights=None):
+    """Sets the missile's estimate to the fusion of estimates_list, its own estimate first."""
+    if len(estimates_list) == 1:
+        missile.estimated_target_pos = estimates_list[0] # Only its own: nothing to fuse
+        return
+    missile.estimated_target_pos = _fuse_estimates(estimates_list, weights)
+    missile.estimate_source = EstimateSource.FUSED
+
+
 def simple_guidance(missile):
     """
     Guidance logic for the SIMPLE swarm mode.
@@ -35,48 +78,34 @@ def overwhelm_guidance(missile):
     
     # 1. Fuse Target Estimates (including own and received from others)
     all_target_estimates = []
+    weights = []
     if missile.estimated_target_pos:
         all_target_estimates.append(missile.estimated_target_pos)
-
-    for message in missile.incoming_messages:
-        sender_target_estimate = message.get('sender_target_estimate')
-        if sender_target_estimate:
-            all_target_estimates.append(sender_target_estimate)
+        weights.append(1)
+    _message_estimates(missile.incoming_messages, all_target_estimates, weights)
 
     if all_target_estimates:
-        missile.estimated_target_pos = _fuse_estimates(all_target_estimates)
+        _steer_by_fused(missile, all_target_estimates, weights)
     else:
         missile.estimated_target_pos = [missile.pos[0] + 1, missile.pos[1]] # Fallback forward guess
+        missile.estimate_source = EstimateSource.GUESS
 
 
     # 2. Synchronize Movement (Adjust speed based on swarm's average distance to target)
-    all_missile_distances_to_target = []
-    
     own_dx_to_target = target.pos[0] - missile.float_pos[0]
     own_dy_to_target = target.pos[1] - missile.float_pos[1]
     own_dist_to_target = math.hypot(own_dx_to_target, own_dy_to_target)
-    all_missile_distances_to_target.append(own_dist_to_target)
 
-    for message in missile.incoming_messages:
-        sender_pos = message.get('sender_pos')
-        if sender_pos:
-            sender_dx_to_target = target.pos[0] - sender_pos[0]
-            sender_dy_to_target = target.pos[1] - sender_pos[1]
-            sender_dist_to_target = math.hypot(sender_dx_to_target, sender_dy_to_target)
-            all_missile_distances_to_target.append(sender_dist_to_target)
-
-    average_swarm_dist_to_target = own_dist_to_target
-    if all_missile_distances_to_target:
-        average_swarm_dist_to_target = sum(all_missile_distances_to_target) / len(all_missile_distances_to_target)
+    total_distance, missile_count = _sum_distances(missile.incoming_messages, target.pos, own_dist_to_target, 1)
+    average_swarm_dist_to_target = total_distance / missile_count
 
-    LOITER_BUFFER = 5
-    FINAL_ASSAULT_DISTANCE = 10
+    params = missile.model.tactic_params
 
-    if own_dist_to_target <= FINAL_ASSAULT_DISTANCE:
+    if own_dist_to_target <= params['final_assault_distance']:
         missile.speed = missile.base_speed
         print(f"  [Missile {missile.unique_id}] Overwhelm: Final Assault! Full speed.")
-    elif own_dist_to_target < average_swarm_dist_to_target - LOITER_BUFFER:
-        missile.speed = missile.base_speed * 0.2
+    elif own_dist_to_target < average_swarm_dist_to_target - params['loiter_buffer']:
+        missile.speed = missile.base_speed * params['loiter_speed_factor']
         print(f"  [Missile {missile.unique_id}] Overwhelm: Loitering. Calculated speed: {missile.speed:.2f}")
     else:
         missile.speed = missile.base_speed
@@ -95,18 +124,17 @@ def wave_attack(missile):
     
     # 1. Fuse Target Estimates
     all_target_estimates = []
+    weights = []
     if missile.estimated_target_pos:
         all_target_estimates.append(missile.estimated_target_pos)
-
-    for message in missile.incoming_messages:
-        sender_target_estimate = message.get('sender_target_estimate')
-        if sender_target_estimate:
-            all_target_estimates.append(sender_target_estimate)
+        weights.append(1)
+    _message_estimates(missile.incoming_messages, all_target_estimates, weights)
 
     if all_target_estimates:
-        missile.estimated_target_pos = _fuse_estimates(all_target_estimates)
+        _steer_by_fused(missile, all_target_estimates, weights)
     else:
         missile.estimated_target_pos = [missile.pos[0] + 1, missile.pos[1]] # Fallback forward guess
+        missile.estimate_source = EstimateSource.GUESS
 
 
     # 2. Wave Synchronization (Adjust speed based on wave's average distance and staggering)
@@ -115,38 +143,24 @@ def wave_attack(missile):
         if msg.get('sender_wave_id') == missile.wave_id
     ]
 
-    all_missile_distances_in_wave = []
-    
     own_dx_to_target = target.pos[0] - missile.float_pos[0]
     own_dy_to_target = target.pos[1] - missile.float_pos[1]
     own_dist_to_target = math.hypot(own_dx_to_target, own_dy_to_target)
-    all_missile_distances_in_wave.append(own_dist_to_target)
-
-    for message in relevant_messages:
-        sender_pos = message.get('sender_pos')
-        if sender_pos:
-            sender_dx_to_target = target.pos[0] - sender_pos[0]
-            sender_dy_to_target = target.pos[1] - sender_pos[1]
-            sender_dist_to_target = math.hypot(sender_dx_to_target, sender_dy_to_target)
-            all_missile_distances_in_wave.append(sender_dist_to_target)
 
-    average_wave_dist_to_target = own_dist_to_target
-    if all_missile_distances_in_wave:
-        average_wave_dist_to_target = sum(all_missile_distances_in_wave) / len(all_missile_distances_in_wave)
+    total_distance, missile_count = _sum_distances(relevant_messages, target.pos, own_dist_to_target, 1)
+    average_wave_dist_to_target = total_distance / missile_count
 
-    BASE_LOITER_BUFFER = 5
-    BASE_FINAL_ASSAULT_DISTANCE = 10
-    WAVE_STAGGER_INCREMENT = 15
+    params = missile.model.tactic_params
 
-    staggered_final_assault_distance = BASE_FINAL_ASSAULT_DISTANCE + (missile.wave_id * WAVE_STAGGER_INCREMENT)
-    staggered_loiter_buffer_target_dist = average_wave_dist_to_target - BASE_LOITER_BUFFER
+    staggered_final_assault_distance = params['final_assault_distance'] + (missile.wave_id * params['wave_stagger_increment'])
+    staggered_loiter_buffer_target_dist = average_wave_dist_to_target - params['loiter_buffer']
 
 
     if own_dist_to_target <= staggered_final_assault_distance:
         missile.speed = missile.base_speed
         print(f"  [Missile {missile.unique_id}] Wave {missile.wave_id}: Final Assault! Full speed. Target dist: {own_dist_to_target:.2f}")
     elif own_dist_to_target < staggered_loiter_buffer_target_dist:
-        missile.speed = missile.base_speed * 0.2
+        missile.speed = missile.base_speed * params['loiter_speed_factor']
         print(f"  [Missile {missile.unique_id}] Wave {missile.wave_id}: Loitering. Calculated speed: {missile.speed:.2f}")
     else:
         missile.speed = missile.base_speed
@@ -160,18 +174,17 @@ def recce_logic(missile):
     """
     print(f"[Missile {missile.unique_id}] RECCE | Type: {missile.missile_type.name} | State: {missile.recce_state.name if missile.recce_state else 'N/A'} | Messages: {len(missile.incoming_messages)}")
 
-    # TRU updates missile.estimated_target_pos *before* this method runs in model.step.
-    # So, missile.estimated_target_pos at this point contains the latest TRU data.
+    # The missile pulls the latest published TRU estimate (if it is new) *before* this method runs,
+    # so missile.estimated_target_pos at this point holds the latest TRU data or a previous scout fusion.
 
     fresh_scout_estimates_from_comms = []
+    scout_weights = []
     # Collect NEW estimates from incoming scout messages only
-    for message in missile.incoming_messages:
-        sender_type_val = message.get('sender_type')
-        sender_type = MissileType(sender_type_val) if sender_type_val is not None else None
-        if sender_type == MissileType.SCOUT:
-            est = message.get('sender_target_estimate')
-            if est:
-                fresh_scout_estimates_from_comms.append(est)
+    scout_messages = [
+        message for message in missile.incoming_messages
+        if message.get('sender_type') == MissileType.SCOUT.value
+    ]
+    _message_estimates(scout_messages, fresh_scout_estimates_from_comms, scout_weights)
     
     # Priority for setting THIS STEP's estimated_target_pos:
     # 1. Fresh Scout Data (from comms this step)
@@ -180,11 +193,13 @@ def recce_logic(missile):
     
     if fresh_scout_estimates_from_comms:
         # If fresh scout estimates are available this step, fuse and use them.
-        missile.estimated_target_pos = _fuse_estimates(fresh_scout_estimates_from_comms)
+        missile.estimated_target_pos = _fuse_estimates(fresh_scout_estimates_from_comms, scout_weights)
+        missile.estimate_source = EstimateSource.SCOUT
         print(f"  [Missile {missile.unique_id}] Recce: Target estimate updated from FRESH scouts.")
     elif missile.estimated_target_pos is None:
         # If no fresh scouts AND missile currently has no estimate (e.g., very early in sim or TRU fails)
         missile.estimated_target_pos = [missile.float_pos[0] + 1, missile.float_pos[1]]
+        missile.estimate_source = EstimateSource.GUESS
         print(f"  [Missile {missile.unique_id}] Recce: No estimates available. Guessing forward.")
     else:
         # Otherwise, retain the missile's current missile.estimated_target_pos (from TRU or previous scout fusion).
@@ -206,7 +221,8 @@ def _recce_scout_behavior(missile):
     base_dir = missile._get_direction_vector(missile.estimated_target_pos)
 
     # Apply wider lateral offset
-    lateral_offset = random.uniform(-0.3, 0.3)
+    max_offset = missile.model.tactic_params['scout_lateral_offset']
+    lateral_offset = missile.random.uniform(-max_offset, max_offset)
     offset_x = -base_dir[1] * lateral_offset
     offset_y = base_dir[0] * lateral_offset
 
@@ -236,13 +252,15 @@ def _recce_attacker_behavior(missile, fresh_scout_estimates_from_comms):
         
         # In CONFIRMED_ATTACK, the missile's own sensor is the highest priority for terminal guidance.
         target = next(agent for agent in missile.model.agents if isinstance(agent, TargetAgent))
-        detected, rel_pos = missile.sensor.run_detection(missile.float_pos, missile.direction, target.pos)
+        detected, rel_pos = missile.sensor.run_detection(missile.float_pos, missile.direction, target.pos, rng=missile.sensor_random())
 
         if detected and rel_pos:
             # Use missile's own sensor for direct terminal guidance
             sensed_x = missile.float_pos[0] + rel_pos[0]
             sensed_y = missile.float_pos[1] + rel_pos[1]
             missile.estimated_target_pos = [sensed_x, sensed_y] # OVERRIDE with direct sensor data
+            missile.estimate_source = EstimateSource.SEEKER
+            missile.model.record_detection(missile.float_pos)
             print(f"  [Missile {missile.unique_id}] Recce: Using OWN SENSOR estimate for terminal phase.")
         else:
             # If own sensor doesn't detect, rely on missile.estimated_target_pos (updated by TRU/scouts in recce_logic)
@@ -265,16 +283,16 @@ def split_axis_approach(missile):
     # Get current target position estimate (using a simplified fusion for this mode)
     current_target_estimate = list(missile.estimated_target_pos) if missile.estimated_target_pos else None
     all_estimates = []
+    weights = []
     if current_target_estimate:
         all_estimates.append(current_target_estimate)
-    for msg in missile.incoming_messages:
-        est = msg.get('sender_target_estimate')
-        if est:
-            all_estimates.append(est)
+        weights.append(1)
+    _message_estimates(missile.incoming_messages, all_estimates, weights)
     if all_estimates:
-        missile.estimated_target_pos = _fuse_estimates(all_estimates)
+        _steer_by_fused(missile, all_estimates, weights)
     else:
         missile.estimated_target_pos = [missile.float_pos[0] + 1, missile.float_pos[1]] # Fallback if no estimates
+        missile.estimate_source = EstimateSource.GUESS
 
 
     target = next(agent for agent in missile.model.agents if isinstance(agent, TargetAgent))
@@ -283,10 +301,10 @@ def split_axis_approach(missile):
     dx_to_true_target = target.pos[0] - missile.float_pos[0]
     dy_to_true_target = target.pos[1] - missile.float_pos[1]
     dist_to_true_target = math.hypot(dx_to_true_target, dy_to_true_target)
-    TERMINAL_DISTANCE = 40
+    params = missile.model.tactic_params
 
     # === Terminal Attack Phase ===
-    if dist_to_true_target < TERMINAL_DISTANCE:
+    if dist_to_true_target < params['terminal_distance']:
         print(f"  [Missile {missile.unique_id}] SPLIT_AXIS: Switching to direct attack (terminal phase).")
         # In terminal phase, prioritize direct targeting to actual target
         missile.direction = missile._get_direction_vector(target.pos) # Direct to true target for final attack
@@ -294,7 +312,7 @@ def split_axis_approach(missile):
         return
 
     # === Approach Phase ===
-    offset_distance = 50
+    offset_distance = params['approach_offset']
     if approach_direction == 0:   # EAST (from right side)
         aim_point = [target.pos[0] + offset_distance, target.pos[1]]
     elif approach_direction == 1: # WEST (from left side)
@@ -308,17 +326,10 @@ def split_axis_approach(missile):
 
     # === Speed Coordination (similar to Overwhelm/Wave for group cohesion) ===
     # Use relative distance to target for speed adjustments
-    distances_to_target = [dist_to_true_target] # Start with own true distance
-    for msg in missile.incoming_messages:
-        sender_pos = msg.get("sender_pos")
-        if sender_pos:
-            # Calculate sender's distance to target (true target for this coordination)
-            dx2 = target.pos[0] - sender_pos[0]
-            dy2 = target.pos[1] - sender_pos[1]
-            distances_to_target.append(math.hypot(dx2, dy2))
-
-    avg_dist_swarm = sum(distances_to_target) / len(distances_to_target)
-    cohesion_buffer = 10 # How much buffer around the average to allow
+    # Starting with own true distance; senders' distances are to the true target too
+    total_distance, missile_count = _sum_distances(missile.incoming_messages, target.pos, dist_to_true_target, 1)
+    avg_dist_swarm = total_distance / missile_count
+    cohesion_buffer = params['cohesion_buffer'] # How much buffer around the average to allow
 
     if dist_to_true_target < avg_dist_swarm - cohesion_buffer:
         missile.speed = missile.min_speed # Slow down if too far ahead of average
@@ -345,24 +356,20 @@ def decoy_behaviour(missile):
     dy_to_true_target = target.pos[1] - missile.float_pos[1]
     dist_to_true_target = math.hypot(dx_to_true_target, dy_to_true_target)
 
-    DECOY_DIVERGE_DISTANCE = 80 # Distance from target at which decoys start to diverge
-    DECOY_SELF_DESTRUCT_DISTANCE = 10 # Distance at which decoy self-destructs if it somehow gets too close
+    params = missile.model.tactic_params
 
-    if dist_to_true_target <= DECOY_SELF_DESTRUCT_DISTANCE:
-        missile.exploded = True
-        missile.alive = False
-        missile.model.agents.remove(missile)
-        missile.model.grid.remove_agent(missile)
+    if dist_to_true_target <= params['self_destruct_distance']:
+        missile.retire('self_destruct', exploded=True)
         print(f"  [Missile {missile.unique_id}] DECOY: Too close to target ({dist_to_true_target:.2f} units). Self-destructed!")
         return
 
-    elif dist_to_true_target <= DECOY_DIVERGE_DISTANCE:
+    elif dist_to_true_target <= params['diverge_distance']:
         print(f"  [Missile {missile.unique_id}] DECOY: Diverging at {dist_to_true_target:.2f} units.")
         missile.speed = missile.base_speed
 
         divert_x = missile.estimated_target_pos[0]
-        divert_y = missile.estimated_target_pos[1] + random.uniform(50, 100) * random.choice([-1, 1])
-        divert_x += random.uniform(20, 50) * random.choice([-1, 1])
+        divert_y = missile.estimated_target_pos[1] + missile.random.uniform(50, 100) * missile.random.choice([-1, 1])
+        divert_x += missile.random.uniform(20, 50) * missile.random.choice([-1, 1])
 
         missile.direction = missile._get_direction_vector([divert_x, divert_y])
         print(f"  [Missile {missile.unique_id}] DECOY: New divert direction towards {divert_x:.2f},{divert_y:.2f}.")
@@ -0,0 +1,222 @@
+"""
+Headless entry point: runs a NavalModel without the Solara app.
+
+Only the simulation modules are imported (no solara, no matplotlib), so fresh
+batch worker processes start quickly. Example:
+
+    python headless.py --mode WAVE --missiles 25 --max-steps 1000 --seed 1
+"""
+import argparse
+import contextlib
+import os
+import time
+
+from model import NavalModel
+from run_budget import RunWatchdog, StepLatencyHistogram, write_diagnostics
+from swarm_modes import SwarmMode
+
+
+@contextlib.contextmanager
+def quiet_output(enabled=True):
+    """Discards stdout (the agents' per-step logging) while enabled."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w') as sink, contextlib.redirect_stdout(sink):
+        yield
+
+
+def simulation_finished(model):
+    """True once every missile has been launched and none is still flying (see NavalModel.finished)."""
+    return model.finished()
+
+
+def summarize_run(model):
+    """Builds a plain dict of results from a (finished or stopped) model."""
+    # Flight time from launch to impact, in simulated time rather than steps so that runs with different dt compare
+    hit_times = [o['time'] - o['launch_time'] for o in model.outcomes if o['outcome'] == 'hit']
+    counts = {}
+    for o in model.outcomes:
+        counts[o['outcome']] = counts.get(o['outcome'], 0) + 1
+
+    summary = {
+        'swarm_mode': model.swarm_mode.name,
+        'steps': model.steps,
+        'launched': model.missile_count,
+        'hits': len(hit_times),
+        'outcome_counts': counts,
+        'hit_rate': len(hit_times) / model.missile_count if model.missile_count else 0.0,
+        'mean_time_to_impact': sum(hit_times) / len(hit_times) if hit_times else None,
+        'finished': simulation_finished(model),
+    }
+    if model.comms_engine is not None:
+        summary['comms_counts'] = dict(model.comms_engine.counts)
+    if model.target.defence is not None:
+        summary['defence_counts'] = dict(model.target.defence.counts)
+    return summary
+
+
+def run_headless(swarm_mode=SwarmMode.SIMPLE, max_steps=1000, seed=None, quiet=True, heatmaps=None,
+                 wall_time_budget=None, diagnostics_dir=None, **model_kwargs):
+    """
+    Runs one engagement until it finishes or a budget is used up.
+
+    :param swarm_mode: SwarmMode to run
+    :param max_steps: Hard cap on model steps
+    :param seed: Seed passed to the model
+    :param quiet: Discard the per-step console output of the agents
+    :param heatmaps: Optional HeatmapAccumulator the run is added to (see heatmaps.py)
+    :param wall_time_budget: Seconds the run may take; it stops at the end of the step in which the
+        budget runs out (see run_budget.py). A step that never returns is not pre-empted, so this call
+        then never returns either; batch_runner.run_adaptive bounds such runs by replacing the worker
+    :param diagnostics_dir: Directory for the diagnostics of runs that exceed wall_time_budget
+    :param model_kwargs: Any further NavalModel arguments (num_missiles, launch_interval, ...)
+    :returns: Summary dict (see summarize_run) with the seed, wall time, 'stop_reason' ('finished',
+        'max_steps' or 'wall_time'), 'step_latency' (StepLatencyHistogram.summary) and, for runs
+        stopped by the watchdog, 'diagnostics' (the file written, if any)
+    """
+    start = time.perf_counter()
+    latencies = StepLatencyHistogram()
+    watchdog = None
+    diagnostics = None
+    with quiet_output(quiet):
+        model = NavalModel(swarm_mode=swarm_mode, seed=seed, **model_kwargs)
+        if heatmaps is not None:
+            heatmaps.attach(model)
+        run_name = f"{swarm_mode.name.lower()}_seed{seed}_{os.getpid()}"
+        diagnostics_extra = {'seed': seed, 'max_steps': max_steps, 'wall_time_budget': wall_time_budget}
+        if wall_time_budget is not None:
+            on_hang = None
+            if diagnostics_dir is not None:
+                def on_hang(hung_watchdog):
+                    write_diagnostics(diagnostics_dir, run_name + '_hung', hung_watchdog, model,
+                                      dict(diagnostics_extra, step_latency=latencies.summary()))
+            watchdog = RunWatchdog(wall_time_budget, on_hang=on_hang).start()
+        try:
+            while model.steps < max_steps and not simulation_finished(model):
+                if watchdog is not None and watchdog.expired:
+                    break
+                step_start = time.perf_counter()
+                model.step()
+                latencies.add(time.perf_counter() - step_start)
+        finally:
+            if watchdog is not None:
+                watchdog.stop()
+            model.close()
+        if watchdog is not None and watchdog.expired and diagnostics_dir is not None:
+            diagnostics = write_diagnostics(diagnostics_dir, run_name, watchdog, model,
+                                            dict(diagnostics_extra, step_latency=latencies.summary()))
+
+    summary = summarize_run(model)
+    if heatmaps is not None:
+        heatmaps.add_run(model, summary)
+    summary['seed'] = seed
+    summary['wall_time'] = time.perf_counter() - start
+    if summary['finished']:
+        summary['stop_reason'] = 'finished'
+    elif watchdog is not None and watchdog.expired:
+        summary['stop_reason'] = 'wall_time'
+        summary['diagnostics'] = diagnostics
+    else:
+        summary['stop_reason'] = 'max_steps'
+    summary['step_latency'] = latencies.summary()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the naval missile simulation without the GUI.")
+    parser.add_argument('--mode', default='SIMPLE', choices=[m.name for m in SwarmMode])
+    parser.add_argument('--missiles', type=int, default=25)
+    parser.add_argument('--launch-interval', type=int, default=30)
+    parser.add_argument('--width', type=int, default=250)
+    parser.add_argument('--height', type=int, default=60)
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--wall-time-budget', type=float, default=None, help="Stop the run after this many seconds")
+    parser.add_argument('--diagnostics-dir', default=None, help="Write the diagnostics of a run that exceeds its wall-time budget here")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--strips', type=int, default=1, help="Worker processes for strip-parallel stepping")
+    parser.add_argument('--update-mode', default='sequential', choices=['sequential', 'synchronous'],
+                        help="Agents see earlier agents' moves (sequential) or the start-of-step state (synchronous)")
+    parser.add_argument('--dt', type=float, default=1.0, help="Simulated time per step")
+    parser.add_argument('--target-radius', type=float, default=0.5, help="Swept hit radius around the target (0 = cell hits only)")
+    parser.add_argument('--comms-hops', type=int, default=1, help="Relay broadcasts over up to this many missile links")
+    parser.add_argument('--cull', nargs='*', default=None, metavar='RULE',
+                        help="Retire missiles that can no longer hit (no rules given: the proven ones)")
+    parser.add_argument('--tracking', action='store_true', help="Kalman-track the target and aim at the predicted track")
+    parser.add_argument('--tru-interval', type=float, default=5, help="Time between TRU sensor sweeps")
+    parser.add_argument('--track-lead', type=float, default=0.0,
+                        help="With --tracking, the most time ahead missiles lead the target (negative: no cap)")
+    parser.add_argument('--comms-latency', type=float, default=None, help="Delay of missile-to-missile messages")
+    parser.add_argument('--comms-jitter', type=float, default=None, help="Extra random delay, up to this much")
+    parser.add_argument('--comms-bandwidth', type=int, default=None, help="Messages a missile can receive per step")
+    parser.add_argument('--comms-loss', type=float, default=None, help="Probability a message is lost")
+    parser.add_argument('--comms-corruption', type=float, default=None, help="Probability a message is corrupted")
+    parser.add_argument('--delta-broadcast', nargs='*', default=None, metavar='SETTING=VALUE',
+                        help="Transmit only on change, e.g. position=2 heartbeat=10 (no settings: the defaults)")
+    parser.add_argument('--leader-comms', action='store_true', help="Wave leaders broadcast group summaries")
+    parser.add_argument('--defence-channels', type=int, default=None, help="Defend the target with this many interceptor channels")
+    parser.add_argument('--defence-reload', type=float, default=None, help="Time a channel takes to reload")
+    parser.add_argument('--defence-window', type=float, default=None, help="Engage threats arriving within this time")
+    parser.add_argument('--defence-pk', type=float, default=None, help="Kill probability of an interceptor")
+    parser.add_argument('--accelerated', action='store_true', help="Run the comms and movement loops as array kernels")
+    parser.add_argument('--tactic', nargs='+', default=None, metavar='NAME=VALUE',
+                        help="Override tactic constants, e.g. loiter_buffer=8 (see swarm_modes.TACTIC_PARAMS)")
+    parser.add_argument('--verbose', action='store_true', help="Show the per-step agent logging")
+    args = parser.parse_args(argv)
+
+    comms_degradation = {
+        name: value for name, value in (
+            ('latency', args.comms_latency), ('jitter', args.comms_jitter), ('bandwidth', args.comms_bandwidth),
+            ('loss', args.comms_loss), ('corruption', args.comms_corruption),
+        ) if value is not None
+    }
+    broadcast_deltas = None
+    if args.delta_broadcast is not None:
+        broadcast_deltas = {}
+        for setting in args.delta_broadcast:
+            name, _, value = setting.partition('=')
+            broadcast_deltas[name] = None if value == 'none' else float(value)
+
+    target_defence = {
+        name: value for name, value in (
+            ('channels', args.defence_channels), ('reload_time', args.defence_reload),
+            ('engagement_time', args.defence_window), ('kill_probability', args.defence_pk),
+        ) if value is not None
+    }
+    tactic_overrides = None
+    if args.tactic:
+        tactic_overrides = {name: float(value) for name, _, value in (s.partition('=') for s in args.tactic)}
+
+    summary = run_headless(
+        swarm_mode=SwarmMode[args.mode],
+        max_steps=args.max_steps,
+        wall_time_budget=args.wall_time_budget,
+        diagnostics_dir=args.diagnostics_dir,
+        seed=args.seed,
+        quiet=not args.verbose,
+        num_missiles=args.missiles,
+        launch_interval=args.launch_interval,
+        width=args.width,
+        height=args.height,
+        parallel_strips=args.strips,
+        update_mode=args.update_mode,
+        dt=args.dt,
+        target_radius=args.target_radius,
+        comms_hops=args.comms_hops,
+        culling=(args.cull or True) if args.cull is not None else False,
+        target_tracking=args.tracking,
+        tru_update_interval=args.tru_interval,
+        track_max_lead=args.track_lead if args.track_lead >= 0 else None,
+        comms_degradation=comms_degradation or None,
+        broadcast_deltas=broadcast_deltas,
+        hierarchical_comms=args.leader_comms,
+        tactic_params=tactic_overrides,
+        target_defence=target_defence or None,
+        accelerated=args.accelerated,
+    )
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
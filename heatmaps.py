@@ -0,0 +1,213 @@
+"""
+Streaming heatmaps of where missiles end up, aggregated over many runs.
+
+A HeatmapAccumulator holds one 2D histogram over the arena per kind of event:
+each outcome ('hit', 'fuel_out', 'intercepted', ...) binned at the position the
+missile's flight ended, and 'detection' for where a missile's own sensor
+picked up the target. It also keeps running mean and variance of each run's
+scalar results. Runs are folded in as they finish, so nothing about a run is
+kept once it has been added, and accumulators built in separate worker
+processes merge exactly: histograms add, and the running statistics combine
+with RunningStat.merge.
+
+    python heatmaps.py --mode OVERWHELM --runs 1000 --workers 4 --out overwhelm.npz
+
+The saved file is all the Solara app needs to draw the heatmaps (see
+app.HeatmapView).
+"""
+import argparse
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_runner import RunningStat
+from swarm_modes import SwarmMode
+
+# Scalar results of a run (see headless.summarize_run) that are averaged
+SCALAR_METRICS = ('hit_rate', 'mean_time_to_impact', 'steps')
+
+
+class HeatmapAccumulator:
+    """Histograms of event positions and running statistics of run results, over any number of runs."""
+
+    def __init__(self, width, height, cell_size=1.0):
+        """
+        :param width: Arena width (cells), as the model's
+        :param height: Arena height (cells)
+        :param cell_size: Side of a histogram bin, in cells
+        """
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.shape = (math.ceil(height / cell_size), math.ceil(width / cell_size)) # Rows are y, columns x
+        self.histograms = {} # Layer name -> int64 array of self.shape
+        self.stats = {metric: RunningStat() for metric in SCALAR_METRICS}
+        self.runs = 0
+
+    def attach(self, model):
+        """Makes `model` report its missiles' sensor detections here. Call add_run when it has finished."""
+        if (model.grid.width, model.grid.height) != (self.width, self.height):
+            raise ValueError(f"Model arena {model.grid.width}x{model.grid.height} does not match "
+                             f"the heatmaps' {self.width}x{self.height}")
+        if model.strip_engine is not None:
+            raise ValueError("Detections made in strip workers are not reported; run without parallel_strips")
+        model.heatmaps = self
+
+    def add_point(self, layer, pos):
+        """Counts one event of kind `layer` at pos (clipped to the arena)."""
+        histogram = self.histograms.get(layer)
+        if histogram is None:
+            histogram = self.histograms[layer] = np.zeros(self.shape, dtype=np.int64)
+        rows, columns = self.shape
+        column = min(max(int(pos[0] // self.cell_size), 0), columns - 1)
+        row = min(max(int(pos[1] // self.cell_size), 0), rows - 1)
+        histogram[row, column] += 1
+
+    def add_run(self, model, summary=None):
+        """
+        Bins where every missile of a finished run ended, by outcome, and adds its results to the
+        running statistics.
+
+        :param summary: The run's headless.summarize_run dict, if already built
+        """
+        if summary is None:
+            from headless import summarize_run
+            summary = summarize_run(model)
+        for outcome in model.outcomes:
+            self.add_point(outcome['outcome'], outcome['pos'])
+        for metric in SCALAR_METRICS:
+            if summary.get(metric) is not None: # No time to impact without hits
+                self.stats[metric].add(summary[metric])
+        self.runs += 1
+
+    def merge(self, other):
+        """Adds another accumulator's runs to this one. Returns self."""
+        if (other.width, other.height, other.cell_size) != (self.width, self.height, self.cell_size):
+            raise ValueError("Only heatmaps over the same arena and bins can be merged")
+        for layer, histogram in other.histograms.items():
+            if layer in self.histograms:
+                self.histograms[layer] += histogram
+            else:
+                self.histograms[layer] = histogram.copy()
+        for metric, stat in other.stats.items():
+            self.stats.setdefault(metric, RunningStat()).merge(stat)
+        self.runs += other.runs
+        return self
+
+    def summary(self):
+        """Dict of metric -> (runs with a value, mean, standard deviation)."""
+        return {
+            metric: (stat.count, stat.mean if stat.count else None, math.sqrt(stat.variance) if stat.count > 1 else None)
+            for metric, stat in self.stats.items()
+        }
+
+    def save(self, path):
+        """Writes the accumulator to a .npz file."""
+        arrays = {f'layer_{layer}': histogram for layer, histogram in self.histograms.items()}
+        for metric, stat in self.stats.items():
+            arrays[f'stat_{metric}'] = np.array([stat.count, stat.mean, stat._m2])
+        np.savez_compressed(path, arena=np.array([self.width, self.height, self.cell_size], dtype=float),
+                            runs=np.array(self.runs), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Reads an accumulator written by save()."""
+        with np.load(path) as data:
+            width, height, cell_size = data['arena'].tolist()
+            accumulator = cls(int(width), int(height), cell_size)
+            accumulator.runs = int(data['runs'])
+            for name in data.files:
+                if name.startswith('layer_'):
+                    accumulator.histograms[name[len('layer_'):]] = data[name]
+                elif name.startswith('stat_'):
+                    stat = RunningStat()
+                    count, stat.mean, stat._m2 = data[name].tolist()
+                    stat.count = int(count)
+                    accumulator.stats[name[len('stat_'):]] = stat
+        return accumulator
+
+    def draw(self, ax, layer, log=True):
+        """
+        Draws one layer on a matplotlib Axes, in arena coordinates.
+
+        :param log: Colour by log(1 + count), so that sparse cells still show next to hot spots
+        """
+        histogram = self.histograms.get(layer, np.zeros(self.shape, dtype=np.int64))
+        values = np.log1p(histogram) if log else histogram
+        image = ax.imshow(values, origin='lower', extent=(0, self.shape[1] * self.cell_size, 0, self.shape[0] * self.cell_size),
+                          cmap='inferno', interpolation='nearest', aspect='equal')
+        ax.set_xlim(0, self.width)
+        ax.set_ylim(0, self.height)
+        ax.set_title(f"{layer}: {int(histogram.sum())} events over {self.runs} runs")
+        return image
+
+
+def accumulate_runs(seeds, width=250, height=60, cell_size=1.0, **run_kwargs):
+    """
+    Runs one engagement per seed, folding each into a fresh accumulator as it finishes.
+    The worker side of sweep().
+
+    :param run_kwargs: Further run_headless / NavalModel arguments (swarm_mode, max_steps, ...)
+    """
+    from headless import run_headless # Deferred: the model is only needed where runs happen
+
+    accumulator = HeatmapAccumulator(width, height, cell_size)
+    for seed in seeds:
+        run_headless(seed=seed, width=width, height=height, heatmaps=accumulator, **run_kwargs)
+    return accumulator
+
+
+def sweep(runs, workers=None, base_seed=0, chunk_size=25, width=250, height=60, cell_size=1.0, **run_kwargs):
+    """
+    Runs `runs` seeded engagements over worker processes and merges their heatmaps.
+    Each worker accumulates a chunk of seeds in place and sends back only its accumulator.
+
+    :param chunk_size: Seeds per worker task
+    :param run_kwargs: Further run_headless / NavalModel arguments
+    :returns: HeatmapAccumulator of all the runs
+    """
+    seeds = list(range(base_seed, base_seed + runs))
+    chunks = [seeds[start:start + chunk_size] for start in range(0, len(seeds), chunk_size)]
+    merged = HeatmapAccumulator(width, height, cell_size)
+    workers = workers or multiprocessing.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [
+            executor.submit(accumulate_runs, chunk, width=width, height=height, cell_size=cell_size, **run_kwargs)
+            for chunk in chunks
+        ]
+        for future in futures:
+            merged.merge(future.result())
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', default='OVERWHELM', choices=[mode.name for mode in SwarmMode])
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=25, help="Runs per worker task")
+    parser.add_argument('--cell-size', type=float, default=1.0, help="Side of a histogram bin, in cells")
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0, help="Base seed")
+    parser.add_argument('--merge', nargs='*', default=(), metavar='FILE', help="Saved heatmaps to add to this sweep's")
+    parser.add_argument('--out', default='heatmaps.npz')
+    args = parser.parse_args(argv)
+
+    accumulator = sweep(args.runs, workers=args.workers, base_seed=args.seed, chunk_size=args.chunk_size,
+                        cell_size=args.cell_size, swarm_mode=SwarmMode[args.mode], max_steps=args.max_steps)
+    for path in args.merge:
+        accumulator.merge(HeatmapAccumulator.load(path))
+    accumulator.save(args.out)
+
+    print(f"{accumulator.runs} runs -> {args.out}")
+    for layer, histogram in sorted(accumulator.histograms.items()):
+        print(f"  {layer:<14} {int(histogram.sum()):>8} events")
+    for metric, (count, mean, std) in accumulator.summary().items():
+        if count:
+            print(f"  {metric:<20} mean {mean:10.3f}  std {std if std is not None else float('nan'):8.3f}  ({count} runs)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Array kernels for the per-missile arithmetic of a step.
+
+With NavalModel(accelerated=True) the model runs these over whole arrays
+instead of looping over missiles in Python:
+
+- in_range: which missiles hear which broadcast, in the direct comms exchange.
+- advance_positions and closest_approach: the moves and swept hit checks of a
+  synchronous step with compact_state, over the SwarmState columns.
+
+Numba compiles them to machine code when it is installed (detected at import,
+see BACKEND); otherwise the same computations run as NumPy array expressions.
+Both do the arithmetic of the Python path operation for operation and in the
+same order, so results are the same as without acceleration for a given seed.
+Distances are square roots of sums of squares on every path rather than
+hypot: math.hypot and np.hypot use different algorithms and can differ in
+the last bit, which would matter at exact range and radius boundaries.
+"""
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError: # Optional: the NumPy versions below are used instead
+    numba = None
+
+BACKEND = 'numba' if numba is not None else 'numpy'
+
+
+def _in_range_numpy(sender_x, sender_y, ranges, receiver_x, receiver_y):
+    dx = sender_x[:, None] - receiver_x[None, :]
+    dy = sender_y[:, None] - receiver_y[None, :]
+    return np.sqrt(dx * dx + dy * dy) <= ranges[:, None]
+
+
+def _advance_positions_numpy(float_pos, direction, speed, rows, dt):
+    float_pos[rows, 0] += direction[rows, 0] * speed[rows] * dt
+    float_pos[rows, 1] += direction[rows, 1] * speed[rows] * dt
+
+
+def _closest_approach_numpy(float_pos, direction, speed, rows, dt, target_start, target_end):
+    step_x = direction[rows, 0] * speed[rows] * dt
+    step_y = direction[rows, 1] * speed[rows] * dt
+    rel_x = float_pos[rows, 0] - step_x - target_start[0]
+    rel_y = float_pos[rows, 1] - step_y - target_start[1]
+    move_x = step_x - (target_end[0] - target_start[0])
+    move_y = step_y - (target_end[1] - target_start[1])
+
+    length_sq = move_x * move_x + move_y * move_y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(-(rel_x * move_x + rel_y * move_y) / length_sq, 0.0, 1.0)
+    t = np.where(length_sq == 0, 0.0, t) # Not moving relative to the target: distance at the start
+    x = rel_x + t * move_x
+    y = rel_y + t * move_y
+    return np.sqrt(x * x + y * y)
+
+
+def _in_range_loops(sender_x, sender_y, ranges, receiver_x, receiver_y):
+    result = np.empty((len(sender_x), len(receiver_x)), dtype=np.bool_)
+    for s in range(len(sender_x)):
+        for r in range(len(receiver_x)):
+            dx = sender_x[s] - receiver_x[r]
+            dy = sender_y[s] - receiver_y[r]
+            result[s, r] = math.sqrt(dx * dx + dy * dy) <= ranges[s]
+    return result
+
+
+def _advance_positions_loops(float_pos, direction, speed, rows, dt):
+    for row in rows:
+        float_pos[row, 0] += direction[row, 0] * speed[row] * dt
+        float_pos[row, 1] += direction[row, 1] * speed[row] * dt
+
+
+def _closest_approach_loops(float_pos, direction, speed, rows, dt, target_start, target_end):
+    result = np.empty(len(rows))
+    for i in range(len(rows)):
+        row = rows[i]
+        step_x = direction[row, 0] * speed[row] * dt
+        step_y = direction[row, 1] * speed[row] * dt
+        rel_x = float_pos[row, 0] - step_x - target_start[0]
+        rel_y = float_pos[row, 1] - step_y - target_start[1]
+        move_x = step_x - (target_end[0] - target_start[0])
+        move_y = step_y - (target_end[1] - target_start[1])
+        length_sq = move_x * move_x + move_y * move_y
+        if length_sq == 0:
+            result[i] = math.sqrt(rel_x * rel_x + rel_y * rel_y)
+            continue
+        t = max(0.0, min(1.0, -(rel_x * move_x + rel_y * move_y) / length_sq))
+        x = rel_x + t * move_x
+        y = rel_y + t * move_y
+        result[i] = math.sqrt(x * x + y * y)
+    return result
+
+
+if numba is not None:
+    # No fastmath: it would let the compiler reorder and fuse the arithmetic
+    _in_range = numba.njit(cache=True)(_in_range_loops)
+    _advance_positions = numba.njit(cache=True)(_advance_positions_loops)
+    _closest_approach = numba.njit(cache=True)(_closest_approach_loops)
+else:
+    _in_range = _in_range_numpy
+    _advance_positions = _advance_positions_numpy
+    _closest_approach = _closest_approach_numpy
+
+
+def in_range(sender_positions, ranges, receiver_positions):
+    """
+    Which receivers are within each sender's range.
+
+    :param sender_positions: (S, 2) array-like of positions
+    :param ranges: (S,) array-like of comms ranges
+    :param receiver_positions: (R, 2) array-like of positions
+    :returns: (S, R) boolean array
+    """
+    senders = np.asarray(sender_positions, dtype=float).reshape(-1, 2)
+    receivers = np.asarray(receiver_positions, dtype=float).reshape(-1, 2)
+    return _in_range(senders[:, 0].copy(), senders[:, 1].copy(), np.asarray(ranges, dtype=float),
+                     receivers[:, 0].copy(), receivers[:, 1].copy())
+
+
+def advance_positions(state, rows, dt):
+    """Moves the missiles in the given SwarmState rows along their direction at their speed, in place."""
+    _advance_positions(state.float_pos, state.direction, state.speed, np.asarray(rows, dtype=np.intp), float(dt))
+
+
+def closest_approach(state, rows, dt, target_motion):
+    """
+    Smallest distance to the target of each of the given rows' missiles during the move just
+    made (see MissileAgent._closest_approach).
+
+    :param target_motion: (start, end) position of the target over the step
+    :returns: Array of distances, in the order of rows
+    """
+    start, end = target_motion
+    return _closest_approach(state.float_pos, state.direction, state.speed, np.asarray(rows, dtype=np.intp),
+                             float(dt), np.asarray(start, dtype=float), np.asarray(end, dtype=float))
@@ -1,26 +1,35 @@
-import numpy as np
 import math
-import random
 from base_agent import MissileAgent
 
+OBSERVATION_SIZE = 6 # Length of get_observation()
+NUM_ACTIONS = 5 # See apply_action
+
 class MissileRLAgent(MissileAgent):
+    __slots__ = ('last_distance_to_target', 'reward', 'action', 'observation', 'transition_pending')
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.last_distance_to_target = self._distance_to(self.estimated_target_pos)
         self.reward = 0
         self.action = None  # Store current action
+        self.observation = None # Observation the current action was chosen from
+        self.transition_pending = False # An action has been taken this step and not yet recorded
 
     def step(self):
         if not self.alive:
             return
-        
+
+        self.pull_estimate()
+
         # Observation space
         obs = self.get_observation()
+        self.observation = obs
         
         # Policy selects action
         # This is where your RL model integration would go.
         # For now, it uses the placeholder random action.
         self.action = self.select_action(obs)
+        self.transition_pending = True
         
         # ACTION SPACE: Apply the selected action
         self.apply_action(self.action)
@@ -30,14 +39,43 @@ class MissileRLAgent(MissileAgent):
         # because the RL agent's apply_action already sets speed and direction.
         super().move_and_check_hit()
 
+        if not self.model.synchronous: # Otherwise the hit is only known in advance()
+            self._score_step()
+
+    def advance(self):
+        super().advance()
+        self._score_step()
+
+    def _score_step(self):
+        self.transition_pending = False
+
         # Reward signal
         self.reward = self.get_reward()
         
         # Save distance to use in the next reward calculation
         self.last_distance_to_target = self._distance_to(self.estimated_target_pos)
 
+        # Experience recording (see replay_buffer.py)
+        buffer = self.model.replay_buffer
+        if buffer is not None:
+            buffer.add(self.observation, self.action, self.reward, self.get_observation(), not self.alive,
+                       self.unique_id, self.model.replay_episode_id)
+
+    def retire(self, outcome, exploded=False):
+        super().retire(outcome, exploded)
+        buffer = self.model.replay_buffer
+        if buffer is not None and self.observation is not None and not self.transition_pending:
+            # Retired by the model after this step's transition was recorded (intercepted by the
+            # target's defence, culled): end the trajectory with a terminal transition of its own.
+            # Hits are only found in the missile's own step, so this is always a loss.
+            observation = self.get_observation()
+            buffer.add(observation, self.action, -50.0, observation, True, self.unique_id,
+                       self.model.replay_episode_id)
+
     # Observation space: encodes the current state of the agent
     def get_observation(self):
+        import numpy as np # Deferred so that importing this module stays cheap
+
         dx = self.estimated_target_pos[0] - self.float_pos[0]
         dy = self.estimated_target_pos[1] - self.float_pos[1]
         norm_dx = dx / self.model.width
@@ -101,5 +139,11 @@ class MissileRLAgent(MissileAgent):
 
     # Policy stub: replace with actual RL agent during training
     def select_action(self, observation):
+        # Actions chosen outside the model, e.g. by a policy driving a rollout pool (see rl_rollout.py)
+        if self.model.rl_actions is not None:
+            action = int(self.model.rl_actions[self.launch_index])
+            if self.model.action_log is not None:
+                self.model.action_log.record(self.model.steps, self.launch_index, action)
+            return action
         # Placeholder: random for now
-        return random.choice([0, 1, 2, 3, 4])
\ No newline at end of file
+        return self.random.choice([0, 1, 2, 3, 4])
\ No newline at end of file
@@ -1,29 +1,164 @@
 from mesa.model import Model
 from mesa.space import MultiGrid
 
-from base_agent import MissileAgent
+from base_agent import MissileAgent, NO_MESSAGES
 from target_agent import TargetAgent
 from TargetReportingUnit import TargetReportingUnit
-from swarm_modes import SwarmMode, MissileType
-from missile_rl_agent import MissileRLAgent
+from estimate_store import EstimateStore
+from swarm_modes import SwarmMode, MissileType, TACTIC_PARAMS, resolve_tactic_params
 import math
+import random
+
+
+# Every missile is launched with the same initial guess; a tuple so it can be shared
+INITIAL_TARGET_ESTIMATE = (90, 15)
+MISSILE_COMMS_RANGE = 50
+# Culling rules (see MissileAgent.hopeless); culling=True applies the ones that are proofs
+CULLING_RULES = ('fuel', 'past_target', 'edge')
+PROVEN_CULLING_RULES = ('fuel',)
 
 
 class NavalModel(Model):
-    def __init__(self, swarm_mode=SwarmMode.SIMPLE, launch_interval=30, width=250, height=60, num_missiles=25, seed=None):
+    def __init__(self, swarm_mode=SwarmMode.SIMPLE, launch_interval=30, width=250, height=60, num_missiles=25, seed=None,
+                 trail_length=None, compact_state=False, parallel_strips=1, update_mode='sequential',
+                 dt=1.0, target_radius=0.5, comms_hops=1, culling=False, target_tracking=False,
+                 tru_update_interval=5, track_max_lead=0.0, comms_degradation=None, broadcast_deltas=None,
+                 hierarchical_comms=False, tactic_params=None, target_defence=None, accelerated=False):
+        """
+        :param trail_length: Positions kept per missile trail (None = all, 0 = none). Trails dominate memory on long runs.
+        :param compact_state: Store missile numeric state in shared NumPy columns (see swarm_state.py)
+        :param parallel_strips: Step missiles in this many worker processes, each owning a strip of the
+            arena along x (see parallel_engine.py). Call close() when done with a parallel model.
+        :param update_mode: 'sequential' - agents are stepped one after another in random order and
+            each sees the moves and removals of those stepped before it (the original behaviour).
+            'synchronous' - every agent computes its step from the state at the start of the step;
+            moves are committed and removals applied once all agents have stepped (see step_synchronously).
+        :param dt: Simulated time per step. Speeds are per unit of time and fuel burns one unit per unit
+            of time; the launch and TRU intervals are in time units too. Larger values need fewer steps
+            per engagement.
+        :param target_radius: A missile hits when its path over a step passes this close to the target
+            (swept against the target's own motion), besides ending the step in the target's cell.
+            0 keeps only the cell check, which fast missiles can tunnel past.
+        :param comms_hops: How many missile-to-missile links a broadcast may cross. 1 is direct
+            broadcast within the sender's comms range; more relays messages through the swarm's
+            comms graph (see comms_network.py). Not supported with parallel_strips.
+        :param culling: Retire missiles that can no longer hit the target at the end of each step,
+            instead of flying them until their fuel runs out. False, True (the rules that are
+            proofs: 'fuel') or a sequence of rule names from CULLING_RULES (see MissileAgent.hopeless).
+            Culled missiles are recorded with the outcome 'culled_<rule>'.
+        :param target_tracking: The TRU filters its detections into Kalman tracks and every missile
+            is given its own predicted intercept point instead of the raw detection (see tracking.py)
+        :param tru_update_interval: Time between TRU sensor sweeps
+        :param track_max_lead: With tracking, how far ahead (in time) missiles lead the target: 0 aims at
+            the track's position extrapolated to the current time, None at the full intercept point.
+            The default target reverses course every 5-20 time units, so leading it costs hits.
+        :param comms_degradation: Dict of CommsEngine settings (latency, jitter, bandwidth, loss,
+            corruption, corruption_std) to deliver broadcasts over imperfect links (see communication.py),
+            e.g. {'latency': 2, 'loss': 0.1}. None delivers them instantly and intact. Not supported
+            with relay comms or parallel_strips.
+        :param broadcast_deltas: Dict of DeltaBroadcastPolicy settings (position, estimate, fuel,
+            heartbeat, expiry) to have missiles transmit only when their state has changed, with
+            receivers remembering each neighbour's last message (see communication.py). {} uses
+            the defaults; None broadcasts every step. Not supported with relay comms or parallel_strips.
+        :param hierarchical_comms: Each wave (per missile type) elects leaders that gather their members'
+            state and broadcast one summary each, instead of every missile broadcasting to every other
+            (see comms_network.LeaderHierarchy). Not supported with the other comms options or
+            parallel_strips.
+        :param tactic_params: Dict overriding the constants of the mode's tactic, e.g.
+            {'loiter_buffer': 8} (see swarm_modes.TACTIC_PARAMS). None keeps the defaults.
+        :param target_defence: Dict of TargetDefence settings (channels, reload_time, engagement_time,
+            kill_probability, tolerance) to give the target interceptors that engage the missiles
+            about to arrive first (see defence.py). {} uses the defaults; None leaves the target
+            defenceless. Not supported with parallel_strips.
+        :param accelerated: Run the direct comms exchange, and with update_mode='synchronous' and
+            compact_state the missiles' moves and hit checks, as array kernels (see kernels.py;
+            compiled with Numba if it is installed). Results are the same as without.
+        """
+        if update_mode not in ('sequential', 'synchronous'):
+            raise ValueError(f"Unknown update_mode {update_mode!r}; expected 'sequential' or 'synchronous'")
+        if comms_hops > 1 and parallel_strips > 1:
+            raise ValueError("Relay comms (comms_hops > 1) cannot be combined with parallel_strips")
+        if comms_degradation is not None and (comms_hops > 1 or parallel_strips > 1):
+            raise ValueError("comms_degradation cannot be combined with relay comms or parallel_strips")
+        if broadcast_deltas is not None and (comms_hops > 1 or parallel_strips > 1):
+            raise ValueError("broadcast_deltas cannot be combined with relay comms or parallel_strips")
+        if hierarchical_comms and (comms_hops > 1 or parallel_strips > 1 or comms_degradation is not None
+                                   or broadcast_deltas is not None):
+            raise ValueError("hierarchical_comms cannot be combined with other comms options or parallel_strips")
+        if target_defence is not None and parallel_strips > 1:
+            raise ValueError("target_defence cannot be combined with parallel_strips")
+        if culling is True:
+            culling = PROVEN_CULLING_RULES
+        culling = tuple(culling or ())
+        params = resolve_tactic_params(swarm_mode, tactic_params) # Rejects unknown names before any set-up
+        for rule in culling:
+            if rule not in CULLING_RULES:
+                raise ValueError(f"Unknown culling rule {rule!r}; expected one of {CULLING_RULES}")
         super().__init__(seed=seed)
+        # Root of the independent random streams (see random_stream)
+        self.stream_seed = seed if seed is not None else self.random.getrandbits(64)
+
+        # Constructor arguments, so that equivalent models can be rebuilt elsewhere (e.g. in worker processes)
+        self.config = {
+            'swarm_mode': swarm_mode,
+            'launch_interval': launch_interval,
+            'width': width,
+            'height': height,
+            'num_missiles': num_missiles,
+            'seed': seed,
+            'trail_length': trail_length,
+            'compact_state': compact_state,
+            'update_mode': update_mode,
+            'dt': dt,
+            'target_radius': target_radius,
+            'comms_hops': comms_hops,
+            'culling': culling,
+            'target_tracking': target_tracking,
+            'tru_update_interval': tru_update_interval,
+            'track_max_lead': track_max_lead,
+            'comms_degradation': comms_degradation,
+            'broadcast_deltas': broadcast_deltas,
+            'hierarchical_comms': hierarchical_comms,
+            'tactic_params': tactic_params,
+            'target_defence': target_defence,
+            'accelerated': accelerated,
+        }
 
         self.swarm_mode = swarm_mode
+        self.tactic_params = params # Read by the guidance strategies
         self.launch_interval = launch_interval
-        self.last_launch_step = -launch_interval
+        self.last_launch_time = -launch_interval
+        self.dt = dt
+        self.target_radius = target_radius
+        self.track_max_lead = track_max_lead
+        self.culling = culling
         self.width = width
         self.height = height
         self.num_missiles = num_missiles
         self.grid = MultiGrid(width, height, torus=False)
+        self.trail_length = trail_length
+        self.synchronous = update_mode == 'synchronous'
+        self.defer_removals = False # Set while a synchronous step is running
+        self.pending_removals = [] # Missiles retired during a synchronous step, removed at its end
+
+        if compact_state:
+            from swarm_state import SwarmState # Deferred: NumPy columns are only needed here
+            self.swarm_state = SwarmState(capacity=num_missiles)
+        else:
+            self.swarm_state = None
+
+        self.kernels = None
+        if accelerated:
+            import kernels # Deferred: Numba, when installed, is slow to import
+            self.kernels = kernels
+        # Synchronous steps over compact state move the whole swarm at once (see move_batch)
+        self.batched_moves = self.kernels is not None and self.synchronous and self.swarm_state is not None
+        self.pending_moves = [] # Missiles that burnt fuel this step and are waiting to be moved
+        self.miss_distances = None # SwarmState row -> closest approach to the target during this step's move
 
         self.missile_count = 0  # Total missiles launched so far
         self.NUM_WAVES = 3
-        self.SCOUT_RATIO = 0.2
+        self.SCOUT_RATIO = params.get('scout_ratio', TACTIC_PARAMS[SwarmMode.RECCE]['scout_ratio'])
 
         # New: Pre-calculate the exact number of scouts and attackers
         if self.swarm_mode == SwarmMode.RECCE:
@@ -42,6 +177,24 @@ class NavalModel(Model):
         self.scouts_launched_count = 0
         self.attackers_launched_count = 0
 
+        # How each missile's flight ended ('hit', 'fuel_out', 'self_destruct', ...), in order.
+        # Removed agents leave model.agents, so this is the only record of results.
+        self.outcomes = []
+
+        # Target estimates published by the TRUs, pulled by the missiles (see estimate_store.py)
+        self.estimate_store = EstimateStore()
+
+        # Actions for RL missiles supplied from outside the model, indexed by MissileAgent.launch_index
+        # (see rl_rollout.py). None lets the agents pick their own.
+        self.rl_actions = None
+        # Where the actions read from rl_actions are logged, if anywhere (see replay.ActionLog.attach)
+        self.action_log = None
+        # Where RL missiles record their transitions, if anywhere (see ReplayBuffer.attach)
+        self.replay_buffer = None
+        # Where sensor detections and outcomes are binned, if anywhere (see HeatmapAccumulator.attach)
+        self.heatmaps = None
+        self.replay_episode_id = 0
+
 
         # Define sensor capabilities for different missile types
         self.ATTACKER_SENSOR_PARAMS = {
@@ -62,68 +215,318 @@ class NavalModel(Model):
         target = TargetAgent(model=self, pos=target_pos, speed=0.5)
         self.grid.place_agent(target, target_pos)
         self.agents.add(target)
+        self.target = target
+        if target_defence is not None:
+            from defence import TargetDefence
+            target.defence = TargetDefence(self, **target_defence)
         print(f"Target id {target.unique_id} has been created at {target.pos}")
 
         # Create and add the TRU
         tru_pos = (target_pos[0] - 65, target_pos[1])
-        tru = TargetReportingUnit(model=self, pos=tru_pos, direction=None, speed=1)
+        tru = TargetReportingUnit(model=self, pos=tru_pos, direction=None, speed=1,
+                                  update_interval=tru_update_interval, tracking=target_tracking)
         self.grid.place_agent(tru, tru_pos)
         self.agents.add(tru)
         print(f"TRU id {tru.unique_id} has been created at {tru.pos}")
 
         self.launch_platform_pos = (0, height // 2)
 
+        self.relay_network = None
+        if comms_hops > 1:
+            from comms_network import RelayNetwork # Deferred: pulls in networkx
+            self.relay_network = RelayNetwork(comms_hops, MISSILE_COMMS_RANGE)
+
+        self.comms_engine = None
+        if comms_degradation is not None:
+            from communication import CommsEngine
+            self.comms_engine = CommsEngine(self, MISSILE_COMMS_RANGE, **comms_degradation)
+
+        self.leader_hierarchy = None
+        if hierarchical_comms:
+            from comms_network import LeaderHierarchy
+            self.leader_hierarchy = LeaderHierarchy(MISSILE_COMMS_RANGE)
+
+        self.broadcast_policy = None
+        if broadcast_deltas is not None:
+            from communication import DeltaBroadcastPolicy
+            self.broadcast_policy = DeltaBroadcastPolicy(**broadcast_deltas)
+
+        self.strip_engine = None
+        if parallel_strips > 1:
+            from parallel_engine import StripEngine
+            self.strip_engine = StripEngine(self, parallel_strips)
+
     def step(self):
         print(f"Step {self.steps} starting...")
 
-        # --- Communication Phase ---
-        for agent in self.agents:
-            if isinstance(agent, MissileAgent):
-                agent.incoming_messages = []
+        if self.strip_engine is not None:
+            # Missiles live in the strip worker processes (see parallel_engine.py)
+            self.strip_engine.step()
+            self.running = not self.finished()
+            print(f"Step {self.steps} completed.")
+            return
 
+        # --- Communication Phase ---
         missile_agents = [agent for agent in self.agents if isinstance(agent, MissileAgent)]
-        for sender_missile in missile_agents:
-            if not sender_missile.alive:
-                continue
+        self.exchange_messages(missile_agents)
+
+        # 3. Missile launching
+        self.launch_phase()
+        print(f"Missiles now: {len([a for a in self.agents if isinstance(a, MissileAgent)])}")
+
+        # 4. Estimates the TRUs published last step become visible; missiles pull them when they step
+        if self.estimate_phase():
+            missile_agents_still_alive = [agent for agent in self.agents if isinstance(agent, MissileAgent) and agent.alive]
+            self.distribute_estimates(missile_agents_still_alive)
+
+        # 5. Step all agents
+        if self.synchronous:
+            self.step_synchronously(list(self.agents))
+        else:
+            self.agents.shuffle_do("step")
+
+        # 6. The target's defence engages what is about to arrive
+        self.defence_phase([agent for agent in self.agents if isinstance(agent, MissileAgent)])
+
+        # 7. Culling and termination
+        self.cull_phase([agent for agent in self.agents if isinstance(agent, MissileAgent)])
+        self.running = not self.finished()
+        print(f"Step {self.steps} completed.")
+
+    def step_synchronously(self, agents):
+        """
+        Double-buffered update of the given agents. Every agent first computes its step against
+        the frozen start-of-step state: moves are held back (missiles keep their grid cell, the
+        target its position) and retired missiles stay in place. Then all moves are committed with
+        advance(), target first, and finally the retired missiles are removed.
+        No agent sees another's update, so the result does not depend on the stepping order,
+        and the compute pass could be spread over a pool of workers.
+        """
+        self.defer_removals = True
+        for agent in agents:
+            agent.step()
+        if self.batched_moves:
+            self.move_batch()
+        for agent in sorted(agents, key=lambda agent: not isinstance(agent, TargetAgent)):
+            agent.advance()
+        self.defer_removals = False
+        self.miss_distances = None
+
+        for missile in self.pending_removals:
+            missile.detach()
+        self.pending_removals = []
+
+    def defence_phase(self, missiles):
+        """Updates the target defence's threat queue and fires its free channels."""
+        defence = self.target.defence
+        if defence is None:
+            return
+        defence.update(missiles, self.target.motion_this_step()[1], self.sim_time)
+        defence.engage(self.sim_time)
+
+    def move_batch(self):
+        """
+        Moves the missiles that stepped this step in one kernel call over their SwarmState rows,
+        and works out how close each came to the target for the hit checks in advance().
+        """
+        rows = [missile._row for missile in self.pending_moves]
+        self.pending_moves = []
+        if not rows:
+            return
+        self.kernels.advance_positions(self.swarm_state, rows, self.dt)
+        if self.target_radius > 0:
+            distances = self.kernels.closest_approach(self.swarm_state, rows, self.dt, self.target.motion_this_step())
+            self.miss_distances = dict(zip(rows, distances.tolist()))
+
+    def cull_phase(self, missiles):
+        """Retires the live missiles that the culling rules find can no longer hit the target."""
+        if not self.culling:
+            return
+        for missile in missiles:
+            if missile.alive:
+                rule = missile.hopeless(self.culling)
+                if rule is not None:
+                    missile.retire(f'culled_{rule}')
+                    print(f"[Missile {missile.unique_id}] Culled: {rule}.")
+
+    def finished(self):
+        """
+        True once nothing can change the outcome any more: every missile has been launched and
+        none is still flying. step() keeps self.running in line with it.
+        """
+        return self.missile_count >= self.num_missiles and self.missiles_in_flight() == 0
 
-            message_to_send = {
-                'sender_id': sender_missile.unique_id,
-                'sender_pos': sender_missile.pos,
-                'sender_target_estimate': sender_missile.estimated_target_pos,
-                'sender_speed': sender_missile.speed,
-                'sender_fuel': sender_missile.fuel,
-                'sender_wave_id': sender_missile.wave_id,
-                'sender_type': sender_missile.missile_type.value
-            }
-
-            for receiver_missile in missile_agents:
-                if sender_missile.unique_id == receiver_missile.unique_id or not receiver_missile.alive:
+    def exchange_messages(self, missiles, remote_broadcasts=()):
+        """
+        Clears the missiles' inboxes, then delivers each live missile's broadcast to every
+        other live missile within the sender's comms range. With delta broadcasting only the
+        missiles whose state has changed transmit, and inboxes keep what was heard before.
+
+        :param missiles: Missiles that send and receive (dead ones are skipped)
+        :param remote_broadcasts: (sender_pos, comms_range, message) tuples from missiles that are
+            not in this model (the halo of a strip in parallel runs); they are heard but not sent to
+        """
+        if self.broadcast_policy is not None:
+            self.broadcast_policy.prepare_inboxes(missiles, self.sim_time)
+        else:
+            for missile in missiles:
+                missile.incoming_messages = NO_MESSAGES
+
+        if self.relay_network is not None:
+            self.relay_network.update(missiles)
+            self.relay_network.deliver(missiles)
+            return
+
+        if self.comms_engine is not None:
+            self.comms_engine.exchange(missiles)
+            return
+
+        if self.leader_hierarchy is not None:
+            self.leader_hierarchy.deliver(missiles, self.target.pos)
+            return
+
+        live_missiles = [missile for missile in missiles if missile.alive]
+        broadcasts = [(m.pos, m.comms_range, message) for m, message in self.outgoing_broadcasts(live_missiles)]
+        broadcasts.extend(remote_broadcasts)
+
+        if self.kernels is not None:
+            self._deliver_in_range(broadcasts, live_missiles)
+            return
+
+        for sender_pos, comms_range, message_to_send in broadcasts:
+            for receiver_missile in live_missiles:
+                if message_to_send['sender_id'] == receiver_missile.unique_id:
                     continue
 
-                distance = math.hypot(sender_missile.pos[0] - receiver_missile.pos[0],
-                                      sender_missile.pos[1] - receiver_missile.pos[1])
+                dx = sender_pos[0] - receiver_missile.pos[0]
+                dy = sender_pos[1] - receiver_missile.pos[1]
+                distance = math.sqrt(dx * dx + dy * dy) # As in kernels.in_range, which must agree to the bit
 
-                if distance <= sender_missile.comms_range:
+                if distance <= comms_range:
                     receiver_missile._receive_message(message_to_send)
 
-        # 3. Missile launching
-        if self.steps - self.last_launch_step >= self.launch_interval and self.missile_count < self.num_missiles:
-            self.launch_missile()
-            self.last_launch_step = self.steps
-        print(f"Missiles now: {len([a for a in self.agents if isinstance(a, MissileAgent)])}")
+    def _deliver_in_range(self, broadcasts, receivers):
+        """The direct delivery loop of exchange_messages, with the ranges tested in one kernel call."""
+        if not broadcasts or not receivers:
+            return
+        reach = self.kernels.in_range([pos for pos, _, _ in broadcasts], [comms_range for _, comms_range, _ in broadcasts],
+                                      [receiver.pos for receiver in receivers])
+        index = {receiver.unique_id: column for column, receiver in enumerate(receivers)}
+        for row, (_, _, message) in enumerate(broadcasts):
+            column = index.get(message['sender_id'])
+            if column is not None:
+                reach[row, column] = False # Missiles do not hear themselves
 
-        # 4. TRUs update all missiles with new estimates
-        tru_agents = [agent for agent in self.agents if isinstance(agent, TargetReportingUnit)]
-        missile_agents_still_alive = [agent for agent in self.agents if isinstance(agent, MissileAgent) and agent.alive]
+        messages = [message for _, _, message in broadcasts]
+        for receiver, heard in zip(receivers, reach.T):
+            senders = heard.nonzero()[0].tolist()
+            if not senders:
+                continue
+            if receiver.neighbour_table is None and not receiver.incoming_messages:
+                receiver.incoming_messages = [messages[sender] for sender in senders] # In sending order, as the loop does
+            else:
+                for sender in senders:
+                    receiver._receive_message(messages[sender])
 
-        for tru in tru_agents:
-            if tru.latest_estimate is not None:
-                for missile in missile_agents_still_alive:
-                    missile.update_target_estimate(tru.latest_estimate)
+    def outgoing_broadcasts(self, missiles):
+        """(missile, message) for each of the live missiles that transmits this step."""
+        if self.broadcast_policy is None:
+            return [(missile, missile.make_broadcast()) for missile in missiles]
+        return self.broadcast_policy.outgoing(missiles, self.sim_time)
 
-        # 5. Step all agents
-        self.agents.shuffle_do("step")
-        print(f"Step {self.steps} completed.")
+    def launch_phase(self):
+        """Launches the next missile once the launch interval has elapsed. Returns it, or None."""
+        if self.interval_elapsed(self.last_launch_time, self.launch_interval) and self.missile_count < self.num_missiles:
+            missile = self.launch_missile()
+            self.last_launch_time = self.sim_time
+            return missile
+        return None
+
+    def random_stream(self, *key):
+        """
+        A random.Random of its own for one source of randomness, seeded from the model seed and
+        `key` (e.g. 'target manoeuvres'). Target manoeuvres and sensor noise draw from such streams
+        rather than model.random, so for a given seed they are the same in every swarm mode however
+        much randomness the tactics consume: comparisons between modes then use common random numbers.
+        """
+        return random.Random(repr((self.stream_seed,) + key))
+
+    @property
+    def sim_time(self):
+        """Simulated time at the current step; every step advances it by dt."""
+        return self.steps * self.dt
+
+    def interval_elapsed(self, last_time, interval):
+        """Whether `interval` time units have passed since `last_time` (tolerant of float drift in sim_time)."""
+        return self.sim_time - last_time >= interval - 1e-9
+
+    def estimate_phase(self):
+        """
+        Makes the estimates published during the last step visible to the missiles.
+        Plain estimates are pulled by the missiles themselves (MissileAgent.pull_estimate), so there
+        is nothing to hand out. Returns True if the visible estimate is a track, whose aim points
+        move every step and have to be handed out by distribute_estimates.
+        """
+        published = self.estimate_store.commit()
+        return published is not None and hasattr(published.position, 'velocity')
+
+    def distribute_estimates(self, missiles):
+        """Turns the visible track (from a tracking TRU) into each missile's own intercept point."""
+        if not missiles:
+            return
+        from tracking import intercept_points
+        published = self.estimate_store.current
+        points = intercept_points(
+            published.position, self.sim_time,
+            [missile.float_pos for missile in missiles], [missile.base_speed for missile in missiles],
+            bounds=(self.width, self.height), max_lead=self.track_max_lead,
+        )
+        for missile, point in zip(missiles, points.tolist()):
+            missile.update_target_estimate(point, published.source)
+            missile.estimate_version = published.version
+
+    def missiles_in_flight(self):
+        """Number of missiles still flying."""
+        if self.strip_engine is not None:
+            return self.strip_engine.live_count
+        # Every launched missile records exactly one outcome when it is retired
+        return self.missile_count - len(self.outcomes)
+
+    def missile_class(self):
+        """The agent class used for this model's missiles."""
+        if self.swarm_mode == SwarmMode.RL:
+            # Imported here so non-RL runs never load the RL agent module
+            from missile_rl_agent import MissileRLAgent
+            missile_class = MissileRLAgent
+        else:
+            missile_class = MissileAgent
+
+        if self.swarm_state is not None:
+            from swarm_state import array_backed
+            missile_class = array_backed(missile_class)
+        return missile_class
+
+    def close(self):
+        """Releases worker processes held by a parallel model. Safe to call more than once."""
+        if self.strip_engine is not None:
+            self.strip_engine.close()
+
+    def record_outcome(self, missile, outcome):
+        """Records how a missile's flight ended. Called by the missile as it is removed."""
+        self.outcomes.append({
+            'step': self.steps,
+            'time': self.sim_time,
+            'missile_id': missile.unique_id,
+            'missile_type': missile.missile_type,
+            'outcome': outcome,
+            'launch_time': missile.launch_time,
+            'pos': tuple(missile.float_pos),
+        })
+
+    def record_detection(self, pos):
+        """Notes where a missile's own sensor detected the target. Called by the guidance."""
+        if self.heatmaps is not None:
+            self.heatmaps.add_point('detection', pos)
 
     def launch_missile(self):
         pos = self.launch_platform_pos
@@ -151,17 +554,13 @@ class NavalModel(Model):
             else:
                 # Should not happen if num_missiles limit is respected
                 print("Warning: Attempted to launch missile beyond total_scouts + total_attackers count.")
-                return # Do not launch
+                return None # Do not launch
         else:
             # For non-Recce modes, use default attacker parameters for all missiles
             assigned_missile_type = MissileType.ATTACKER
             sensor_params_for_missile = self.ATTACKER_SENSOR_PARAMS
 
-        # Choose the appropriate missile class
-        if self.swarm_mode == SwarmMode.RL:
-            missile_class = MissileRLAgent
-        else:
-            missile_class = MissileAgent
+        missile_class = self.missile_class()
 
         missile = missile_class(
             model=self,
@@ -169,17 +568,19 @@ class NavalModel(Model):
             direction=None,
             speed=1, # Base speed for launch
             fuel=400,
-            initial_target_estimate=[90, 15],
+            initial_target_estimate=INITIAL_TARGET_ESTIMATE,
             mode=self.swarm_mode,
-            comms_range=50,
+            comms_range=MISSILE_COMMS_RANGE,
             min_speed=DEFAULT_MIN_MISSILE_SPEED,
             max_speed=DEFAULT_MAX_MISSILE_SPEED,
             wave_id=current_wave_id,
             missile_type=assigned_missile_type,
+            trail_length=self.trail_length,
             **sensor_params_for_missile
         )
         self.grid.place_agent(missile, pos)
         self.agents.add(missile)
         self.missile_count += 1 # Increment total launched missiles
         print(f"Missile {missile.unique_id} (Type: {missile.missile_type.name}, Wave: {missile.wave_id}) launched at step {self.steps} from {missile.pos}")
+        return missile
 
@@ -0,0 +1,197 @@
+"""
+Parallel search for the tactic constants of a swarm mode.
+
+Each candidate set of constants (swarm_modes.TACTIC_PARAMS) is scored by
+running it on a fixed batch of seeds, and scipy's differential evolution
+searches the bounds in SEARCH_SPACE, evaluating each generation's candidates
+in parallel worker processes.
+
+Simulation outcomes are noisy, so the search is built to be fooled by noise as
+little as possible:
+
+- Every candidate runs on the same seeds in the synchronous update mode (see
+  crn_compare.py), so it meets the same target track and sensor noise as its
+  rivals and their scores differ by the constants rather than by luck.
+- The defaults are part of the first generation, so the search starts from
+  today's behaviour.
+- The winner is then re-run against the defaults on fresh seeds. Its score on
+  the search seeds is biased upwards (it won because of them), so only the
+  paired difference on the validation seeds says whether it is really better.
+
+    python optimize_tactics.py --mode WAVE --replicates 8 --maxiter 10 --validate 30
+"""
+import argparse
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_runner import RunningStat
+from headless import run_headless
+from swarm_modes import SwarmMode, TACTIC_PARAMS
+
+# Bounds searched for each mode's constants. DECOY is left out: decoys are not meant to hit,
+# so hit rate and time to impact say nothing about them.
+SEARCH_SPACE = {
+    SwarmMode.OVERWHELM: {
+        'loiter_buffer': (0.0, 30.0),
+        'final_assault_distance': (0.0, 60.0),
+        'loiter_speed_factor': (0.05, 1.0),
+    },
+    SwarmMode.WAVE: {
+        'loiter_buffer': (0.0, 30.0),
+        'final_assault_distance': (0.0, 60.0),
+        'wave_stagger_increment': (0.0, 40.0),
+        'loiter_speed_factor': (0.05, 1.0),
+    },
+    SwarmMode.RECCE: {
+        'scout_ratio': (0.08, 0.6),
+        'scout_lateral_offset': (0.0, 1.0),
+    },
+    SwarmMode.SPLIT_AXIS: {
+        'terminal_distance': (10.0, 120.0),
+        'approach_offset': (10.0, 100.0),
+        'cohesion_buffer': (0.0, 40.0),
+    },
+}
+
+
+def run_score(summary, max_steps, time_weight):
+    """
+    Score of one run: its hit rate, less time_weight times the mean time to impact as a
+    fraction of max_steps. A run without hits counts as taking all of max_steps.
+    """
+    time_to_impact = summary['mean_time_to_impact']
+    time_fraction = 1.0 if time_to_impact is None else time_to_impact / max_steps
+    return summary['hit_rate'] - time_weight * time_fraction
+
+
+def evaluate(swarm_mode, params, seeds, max_steps=1000, time_weight=0.1, **run_kwargs):
+    """
+    Runs one set of constants on every seed, one after another.
+
+    :param params: Dict of tactic parameter overrides
+    :returns: List of run scores (see run_score), in seed order
+    """
+    return [
+        run_score(run_headless(swarm_mode=swarm_mode, max_steps=max_steps, seed=seed, tactic_params=params,
+                               update_mode='synchronous', **run_kwargs), max_steps, time_weight)
+        for seed in seeds
+    ]
+
+
+class _Objective:
+    """Negated mean score of a parameter vector; picklable, so the worker processes can call it."""
+
+    def __init__(self, swarm_mode, names, seeds, max_steps, time_weight, run_kwargs):
+        self.swarm_mode = swarm_mode
+        self.names = names
+        self.seeds = seeds
+        self.max_steps = max_steps
+        self.time_weight = time_weight
+        self.run_kwargs = run_kwargs
+
+    def __call__(self, vector):
+        params = dict(zip(self.names, (float(value) for value in vector)))
+        scores = evaluate(self.swarm_mode, params, self.seeds, self.max_steps, self.time_weight, **self.run_kwargs)
+        return -sum(scores) / len(scores)
+
+
+def optimize(swarm_mode, replicates=8, maxiter=10, popsize=5, time_weight=0.1, max_steps=1000,
+             validation_replicates=30, confidence=0.95, workers=None, base_seed=0, search_seed=None,
+             bounds=None, **run_kwargs):
+    """
+    Searches a mode's tactic constants with differential evolution.
+
+    :param replicates: Seeds every candidate is scored on (base_seed onwards)
+    :param maxiter: Generations of differential evolution
+    :param popsize: Candidates per generation, per searched parameter
+    :param time_weight: Weight of the time to impact against the hit rate (see run_score)
+    :param validation_replicates: Fresh seeds on which the winner is compared with the defaults
+        (0 to skip the comparison)
+    :param workers: Worker processes (default: one per CPU)
+    :param search_seed: Seed of the search itself
+    :param bounds: Dict of parameter name -> (low, high) to search instead of SEARCH_SPACE[swarm_mode];
+        parameters left out keep their defaults
+    :param run_kwargs: Further run_headless / NavalModel arguments
+    :returns: Dict with 'params' (the winner), 'defaults', 'search_score' (its mean score on the
+        search seeds), 'evaluations', and, when validated, 'validation': {'best', 'default',
+        'diff', 'diff_ci', 'runs'} (mean scores, paired mean difference and its CI half-width)
+    """
+    from scipy.optimize import differential_evolution # Deferred: only the search needs it
+
+    bounds = bounds or SEARCH_SPACE[swarm_mode]
+    names = list(bounds)
+    defaults = TACTIC_PARAMS[swarm_mode]
+    seeds = [base_seed + replicate for replicate in range(replicates)]
+    objective = _Objective(swarm_mode, names, seeds, max_steps, time_weight, run_kwargs)
+
+    workers = workers or multiprocessing.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        result = differential_evolution(
+            objective, [bounds[name] for name in names], maxiter=maxiter, popsize=popsize,
+            x0=[defaults[name] for name in names], seed=search_seed, polish=False,
+            updating='deferred', workers=executor.map, # A whole generation is scored at once
+        )
+        best = dict(zip(names, (float(value) for value in result.x)))
+        report = {'params': best, 'defaults': dict(defaults), 'search_score': -result.fun, 'evaluations': result.nfev}
+
+        if validation_replicates:
+            # Seeds the search never saw, one job per run so that every worker is busy
+            validation_seeds = [base_seed + replicates + replicate for replicate in range(validation_replicates)]
+            jobs = {
+                name: [executor.submit(evaluate, swarm_mode, params, [seed], max_steps, time_weight, **run_kwargs)
+                       for seed in validation_seeds]
+                for name, params in (('best', best), ('default', {}))
+            }
+            best_stat, default_stat, differences = RunningStat(), RunningStat(), RunningStat()
+            for best_job, default_job in zip(jobs['best'], jobs['default']):
+                best_score, default_score = best_job.result()[0], default_job.result()[0]
+                best_stat.add(best_score)
+                default_stat.add(default_score)
+                differences.add(best_score - default_score)
+            report['validation'] = {
+                'best': best_stat.mean,
+                'default': default_stat.mean,
+                'diff': differences.mean,
+                'diff_ci': differences.half_width(confidence),
+                'runs': differences.count,
+            }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', default='WAVE', choices=[mode.name for mode in SEARCH_SPACE])
+    parser.add_argument('--replicates', type=int, default=8, help="Seeds per candidate")
+    parser.add_argument('--maxiter', type=int, default=10, help="Generations")
+    parser.add_argument('--popsize', type=int, default=5, help="Candidates per generation, per parameter")
+    parser.add_argument('--time-weight', type=float, default=0.1, help="Weight of the time to impact against the hit rate")
+    parser.add_argument('--validate', type=int, default=30, help="Fresh seeds to compare the winner with the defaults on")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0, help="Base seed of the runs")
+    parser.add_argument('--search-seed', type=int, default=None, help="Seed of the search itself")
+    args = parser.parse_args(argv)
+
+    report = optimize(
+        SwarmMode[args.mode], replicates=args.replicates, maxiter=args.maxiter, popsize=args.popsize,
+        time_weight=args.time_weight, max_steps=args.max_steps, validation_replicates=args.validate,
+        workers=args.workers, base_seed=args.seed, search_seed=args.search_seed,
+    )
+
+    print(f"{args.mode}: {report['evaluations']} candidates scored on {args.replicates} seeds each")
+    print(f"{'parameter':<24} {'default':>9} {'best':>9}")
+    for name, value in report['params'].items():
+        print(f"{name:<24} {report['defaults'][name]:>9.3f} {value:>9.3f}")
+    print(f"search score: {report['search_score']:.4f}")
+    validation = report.get('validation')
+    if validation:
+        verdict = 'better' if validation['diff'] - validation['diff_ci'] > 0 else 'not shown to be better'
+        ci = validation['diff_ci'] if math.isfinite(validation['diff_ci']) else float('nan')
+        print(f"validation on {validation['runs']} fresh seeds: best {validation['best']:.4f}, "
+              f"default {validation['default']:.4f}, diff {validation['diff']:+.4f} ± {ci:.4f} ({verdict})")
+    print(f"tactic_params={report['params']!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Domain-decomposed parallel stepping for very large swarms.
+
+With NavalModel(parallel_strips=N) the arena is cut along x into N strips of
+equal width, each owned by a worker process that holds and steps the missiles
+inside it. The main model keeps the target and the TRU and coordinates the
+workers once per step:
+
+1. Missiles launched by the main model are handed to the strip that owns the
+   launch position.
+2. Each worker receives the target position, the published estimate, the missiles
+   migrating into its strip and a halo: the broadcasts of missiles in other
+   strips that lie within comms range of its own strip.
+3. Workers exchange messages (local missiles plus halo), step their missiles,
+   and report outcomes, their missiles' broadcasts (used for the next halo) and
+   the missiles that left the strip, which migrate to their new owner.
+
+The phases are the ones of the serial NavalModel.step, so results agree with
+the serial engine statistically, not bit for bit: each worker shuffles and
+draws random numbers independently, and missiles see the target where it was
+at the start of the step (in the serial engine that depends on whether the
+target happens to be stepped before or after them).
+"""
+import multiprocessing
+import traceback
+
+from base_agent import MissileAgent
+from model import NavalModel
+from TargetReportingUnit import TargetReportingUnit
+
+
+class StripPartition:
+    """Equal-width strips along x, numbered from the launch side."""
+
+    def __init__(self, width, num_strips):
+        self.width = width
+        self.num_strips = num_strips
+        self.strip_width = width / num_strips
+
+    def owner(self, x):
+        """Index of the strip that owns x. Positions outside the arena belong to the nearest edge strip."""
+        strip = int(x // self.strip_width)
+        return max(0, min(strip, self.num_strips - 1))
+
+    def bounds(self, strip):
+        """(x_min, x_max) of a strip, x_max exclusive."""
+        return strip * self.strip_width, (strip + 1) * self.strip_width
+
+
+class StripEngine:
+    """
+    Runs the missiles of a NavalModel in one worker process per strip.
+    Created by NavalModel when parallel_strips > 1; the model calls step() and close().
+    """
+
+    def __init__(self, model, num_strips):
+        self.model = model
+        self.partition = StripPartition(model.width, num_strips)
+        self.live_count = 0
+        self.broadcasts = [] # (sender_pos, comms_range, message) of every live missile after the last step
+        self._immigrants = [[] for _ in range(num_strips)]
+
+        # Spawn (rather than fork) so that workers are clean on every platform and do not
+        # inherit GUI threads; thanks to the lazy imports in model.py they start quickly.
+        context = multiprocessing.get_context('spawn')
+        self._connections = []
+        self._workers = []
+        for strip in range(num_strips):
+            parent_end, worker_end = context.Pipe()
+            seed = model.config['seed']
+            worker_seed = None if seed is None else hash((seed, strip)) & 0x7FFFFFFF
+            worker = context.Process(
+                target=_strip_worker,
+                args=(worker_end, strip, num_strips, dict(model.config, seed=worker_seed)),
+                daemon=True,
+            )
+            worker.start()
+            worker_end.close()
+            self._connections.append(parent_end)
+            self._workers.append(worker)
+
+    def step(self):
+        model = self.model
+
+        # Launches happen in the main model; the new missile is moved to the strip that owns it
+        launches = [[] for _ in range(self.partition.num_strips)]
+        missile = model.launch_phase()
+        if missile is not None:
+            launches[self.partition.owner(missile.float_pos[0])].append(self._detach(missile))
+
+        target = model.target
+        track_published = model.estimate_phase()
+        halo_range = max((comms_range for _, comms_range, _ in self.broadcasts), default=0)
+
+        for strip, connection in enumerate(self._connections):
+            connection.send({
+                'steps': model.steps,
+                'target_pos': target.pos,
+                'target_float_y': target.float_y,
+                'estimate': model.estimate_store.current,
+                'track_published': track_published,
+                'halo': self._halo(strip, halo_range),
+                'immigrants': self._immigrants[strip],
+                'launches': launches[strip],
+            })
+
+        # The target and TRU are stepped here while the workers step the missiles
+        if model.synchronous:
+            model.step_synchronously(list(model.agents))
+        else:
+            model.agents.shuffle_do("step")
+
+        self._immigrants = [[] for _ in range(self.partition.num_strips)]
+        self.broadcasts = []
+        self.live_count = 0
+        for strip, connection in enumerate(self._connections):
+            try:
+                report = connection.recv()
+            except (EOFError, OSError) as error:
+                raise RuntimeError(f"Strip worker {strip} exited unexpectedly") from error
+            if 'error' in report:
+                raise RuntimeError(f"Strip worker {strip} failed:\n{report['error']}")
+            model.outcomes.extend(report['outcomes'])
+            self.broadcasts.extend(report['broadcasts'])
+            self.live_count += len(report['broadcasts'])
+            for state in report['emigrants']:
+                self._immigrants[self.partition.owner(state['float_pos'][0])].append(state)
+
+    def _halo(self, strip, halo_range):
+        """Broadcasts from missiles in other strips that are within halo_range of this strip."""
+        x_min, x_max = self.partition.bounds(strip)
+        return [
+            broadcast for broadcast in self.broadcasts
+            if x_min - halo_range <= broadcast[0][0] < x_max + halo_range
+            and self.partition.owner(broadcast[0][0]) != strip
+        ]
+
+    def _detach(self, missile):
+        """Removes a missile from the main model (without recording an outcome) and returns its state."""
+        state = missile.get_state()
+        missile.detach()
+        return state
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._connections = []
+        self._workers = []
+
+
+def _strip_worker(connection, strip, num_strips, config):
+    """Worker process entry point: owns the missiles of one strip until told to stop."""
+    from headless import quiet_output
+
+    with quiet_output():
+        try:
+            model = StripModel(strip, num_strips, config)
+            while True:
+                command = connection.recv()
+                if command is None:
+                    break
+                connection.send(model.step_strip(command))
+        except Exception:
+            connection.send({'error': traceback.format_exc()})
+    connection.close()
+
+
+class StripModel(NavalModel):
+    """
+    A NavalModel that holds only one strip's missiles. Its target is a replica that is
+    moved to the main model's target position each step; it has no TRU of its own.
+    """
+
+    def __init__(self, strip, num_strips, config):
+        super().__init__(**config)
+        self.strip = strip
+        self.partition = StripPartition(self.width, num_strips)
+        for tru in [agent for agent in self.agents if isinstance(agent, TargetReportingUnit)]:
+            self.grid.remove_agent(tru)
+            tru.remove()
+
+    def step_strip(self, command):
+        """Runs one step for this strip's missiles and reports back to the StripEngine."""
+        self.steps = command['steps']
+        if command['target_pos'] != self.target.pos:
+            self.grid.move_agent(self.target, command['target_pos'])
+        self.target.float_y = command['target_float_y']
+
+        missile_class = self.missile_class()
+        for state in command['immigrants']:
+            missile_class.from_state(self, state)
+
+        # Same phase order as NavalModel.step: comms, launch, TRU estimates, then stepping
+        missiles = [agent for agent in self.agents if isinstance(agent, MissileAgent)]
+        self.exchange_messages(missiles, command['halo'])
+
+        for state in command['launches']:
+            missiles.append(missile_class.from_state(self, state))
+
+        live_missiles = [missile for missile in missiles if missile.alive]
+        self.estimate_store.adopt(command['estimate'])
+        if command['track_published']:
+            self.distribute_estimates(live_missiles)
+
+        if self.synchronous:
+            self.step_synchronously(live_missiles)
+        else:
+            self.random.shuffle(live_missiles)
+            for missile in live_missiles:
+                missile.step()
+        self.cull_phase(live_missiles)
+
+        emigrants = []
+        broadcasts = []
+        for missile in live_missiles:
+            if not missile.alive:
+                continue
+            # Emigrants' broadcasts are reported too: their old strip hears them through its halo
+            broadcasts.append((missile.pos, missile.comms_range, missile.make_broadcast()))
+            if self.partition.owner(missile.float_pos[0]) != self.strip:
+                emigrants.append(missile.get_state())
+                missile.detach()
+
+        outcomes, self.outcomes = self.outcomes, []
+        return {
+            'outcomes': outcomes,
+            'broadcasts': broadcasts,
+            'emigrants': emigrants,
+        }
@@ -0,0 +1,317 @@
+"""
+Exact replay of a run from a compact log.
+
+A seeded run is already reproducible from its seed and configuration (all its
+randomness comes from the model's RNG streams), except for what is injected
+from outside the model: the actions a policy writes into model.rl_actions for
+the RL missiles, and the steps on which it wrote any. An ActionLog records
+just those, plus a
+fingerprint of the model state every few steps, so a log is kilobytes where a
+per-step recording (export_animation.RunRecording) is hundreds of kilobytes
+or more.
+
+Replay rebuilds the model from the log, feeds it the logged actions and checks
+the fingerprints as it goes, so a replay that would not reproduce the
+recorded run (changed code, a different library version, a run that drew
+randomness from outside the model) stops with ReplayDivergence at the first
+checkpoint that differs instead of quietly showing a different run.
+
+    log = ActionLog.attach(model)       # a seeded model, before its first step
+    while running:
+        model.rl_actions = policy(...)
+        log.step(model)                 # model.step() plus the checkpoint
+    log.finish(model)
+    log.save('run.npz')
+
+    replay = Replay(ActionLog.load('run.npz'))
+    replay.fast_forward(350)            # replay.model is now the run at step 350
+
+    python replay.py record --mode RL --policy random --seed 3 --out run.npz
+    python replay.py replay run.npz --to-step 350
+"""
+import argparse
+import json
+import random
+import zlib
+
+import numpy as np
+
+from swarm_modes import SwarmMode
+
+
+class ReplayDivergence(RuntimeError):
+    """Raised when a replayed run stops matching the run it was recorded from."""
+
+
+def fingerprint(model):
+    """CRC32 of the state a replay has to reproduce: step, outcomes, and the exact position of every agent."""
+    state = (
+        model.steps,
+        [(outcome['missile_id'], outcome['outcome'], outcome['pos']) for outcome in model.outcomes],
+        sorted((agent.unique_id, tuple(getattr(agent, 'float_pos', agent.pos))) for agent in model.agents),
+        model.target.float_y,
+    )
+    return zlib.crc32(repr(state).encode())
+
+
+def _config_to_json(config):
+    return json.dumps(dict(config, swarm_mode=config['swarm_mode'].name))
+
+
+def _config_from_json(text):
+    config = json.loads(text)
+    config['swarm_mode'] = SwarmMode[config['swarm_mode']]
+    return config
+
+
+class ActionLog:
+    """The seed, configuration and injected actions of a run, with periodic state fingerprints."""
+
+    def __init__(self, config, checkpoint_interval=50):
+        """
+        :param config: The model's constructor arguments (NavalModel.config), seed included
+        :param checkpoint_interval: Steps between state fingerprints
+        """
+        self.config = config
+        self.checkpoint_interval = checkpoint_interval
+        self.steps = [] # Step, launch index and value of every action read from model.rl_actions
+        self.launch_indices = []
+        self.actions = []
+        self.injected_steps = [] # Steps run with model.rl_actions set; on the others the RL missiles chose
+        self.checkpoints = {} # step -> fingerprint
+        self.final_step = None
+
+    @classmethod
+    def attach(cls, model, checkpoint_interval=50):
+        """Starts logging a model's injected actions; call before its first step. Returns the log."""
+        if model.config['seed'] is None:
+            raise ValueError("An unseeded run cannot be replayed; give the model a seed")
+        if model.strip_engine is not None:
+            raise ValueError("Strip-parallel runs are not reproducible step for step; run without parallel_strips")
+        if model.steps:
+            raise ValueError("The log has to be attached before the first step")
+        log = cls(dict(model.config), checkpoint_interval)
+        log.checkpoints[0] = fingerprint(model)
+        model.action_log = log
+        return log
+
+    def record(self, step, launch_index, action):
+        """Logs one action read from model.rl_actions (called by MissileRLAgent.select_action)."""
+        self.steps.append(step)
+        self.launch_indices.append(launch_index)
+        self.actions.append(action)
+
+    def step(self, model):
+        """Steps the model and takes a fingerprint when a checkpoint is due."""
+        injected = model.rl_actions is not None
+        model.step()
+        if injected:
+            self.injected_steps.append(model.steps)
+        if model.steps % self.checkpoint_interval == 0:
+            self.checkpoints[model.steps] = fingerprint(model)
+
+    def finish(self, model):
+        """Marks the end of the run, with a last fingerprint."""
+        model.action_log = None
+        self.final_step = model.steps
+        self.checkpoints[model.steps] = fingerprint(model)
+
+    def actions_by_step(self):
+        """Dict of step -> {launch_index: action}."""
+        by_step = {}
+        for step, launch_index, action in zip(self.steps, self.launch_indices, self.actions):
+            by_step.setdefault(step, {})[launch_index] = action
+        return by_step
+
+    def save(self, path):
+        """Writes the log to a .npz file."""
+        checkpoint_steps = sorted(self.checkpoints)
+        np.savez_compressed(
+            path,
+            config=np.array(_config_to_json(self.config)),
+            checkpoint_interval=np.array(self.checkpoint_interval),
+            final_step=np.array(-1 if self.final_step is None else self.final_step),
+            # Steps as differences: mostly zeros and ones, which compress to almost nothing
+            step_deltas=np.diff(np.array(self.steps, dtype=np.int32), prepend=0).astype(np.int32),
+            launch_indices=np.array(self.launch_indices, dtype=np.int32),
+            actions=np.array(self.actions, dtype=np.int8),
+            injected_step_deltas=np.diff(np.array(self.injected_steps, dtype=np.int32), prepend=0).astype(np.int32),
+            checkpoint_steps=np.array(checkpoint_steps, dtype=np.int64),
+            checkpoint_hashes=np.array([self.checkpoints[step] for step in checkpoint_steps], dtype=np.uint32),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Reads a log written by save()."""
+        with np.load(path) as data:
+            log = cls(_config_from_json(str(data['config'])), int(data['checkpoint_interval']))
+            final_step = int(data['final_step'])
+            log.final_step = None if final_step < 0 else final_step
+            log.steps = np.cumsum(data['step_deltas']).tolist()
+            log.launch_indices = data['launch_indices'].tolist()
+            log.actions = data['actions'].tolist()
+            if 'injected_step_deltas' in data:
+                log.injected_steps = np.cumsum(data['injected_step_deltas']).tolist()
+            else: # Written before the injected steps were logged: actions were injected where any were read
+                log.injected_steps = sorted(set(log.steps))
+            log.checkpoints = dict(zip(data['checkpoint_steps'].tolist(), data['checkpoint_hashes'].tolist()))
+        return log
+
+
+class _LoggedActions:
+    """Stands in for model.rl_actions during a replay: the action logged for the current step."""
+
+    def __init__(self, model, by_step):
+        self.model = model
+        self.by_step = by_step
+
+    def __getitem__(self, launch_index):
+        try:
+            return self.by_step[self.model.steps][launch_index]
+        except KeyError:
+            raise ReplayDivergence(f"Missile {launch_index} (launch index) asked for an action at step "
+                                   f"{self.model.steps}, but the recorded run injected none there") from None
+
+
+class Replay:
+    """Rebuilds a logged run and steps it forward, checking it against the log's fingerprints."""
+
+    def __init__(self, log, quiet=True, verify=True):
+        """
+        :param quiet: Discard the agents' per-step logging while replaying
+        :param verify: Check every fingerprint in the log, raising ReplayDivergence on a mismatch
+        """
+        from headless import quiet_output
+        from model import NavalModel
+
+        self.log = log
+        self.quiet = quiet
+        self.verify = verify
+        with quiet_output(quiet):
+            self.model = NavalModel(**log.config)
+        # On the steps where the recorded run injected actions, the replay does too; on the
+        # others rl_actions is None, so the RL missiles choose their own as they did then
+        self.injected_steps = set(log.injected_steps)
+        self.logged_actions = _LoggedActions(self.model, log.actions_by_step())
+        self._check()
+
+    @property
+    def end_step(self):
+        """Last step of the recorded run, if it was finished with ActionLog.finish."""
+        return self.log.final_step
+
+    def step(self, steps=1):
+        """Replays up to `steps` more steps (not past the end of the recorded run)."""
+        from headless import quiet_output
+
+        with quiet_output(self.quiet):
+            for _ in range(steps):
+                if self.end_step is not None and self.model.steps >= self.end_step:
+                    break
+                model = self.model
+                model.rl_actions = self.logged_actions if model.steps + 1 in self.injected_steps else None
+                model.step()
+                self._check()
+        return self.model
+
+    def fast_forward(self, step):
+        """Replays until the model is at `step`. Going back means starting a new Replay."""
+        if step < self.model.steps:
+            raise ValueError(f"The replay is already at step {self.model.steps}; start a new Replay to go back")
+        if self.end_step is not None and step > self.end_step:
+            raise ValueError(f"The recorded run ended at step {self.end_step}")
+        return self.step(step - self.model.steps)
+
+    def run(self):
+        """Replays to the end of the recorded run."""
+        if self.end_step is None:
+            raise ValueError("The log was not finished, so the end of the run is unknown; use fast_forward")
+        return self.fast_forward(self.end_step)
+
+    def _check(self):
+        expected = self.log.checkpoints.get(self.model.steps)
+        if self.verify and expected is not None and fingerprint(self.model) != expected:
+            raise ReplayDivergence(f"The replay no longer matches the recorded run at step {self.model.steps}")
+
+
+def record_run(max_steps=1000, seed=None, policy=None, quiet=True, checkpoint_interval=50, **model_kwargs):
+    """
+    Runs an engagement like headless.run_headless and logs it for replay.
+
+    :param seed: Seed of the run; None draws one, which is kept in the log
+    :param policy: Called with the model before every step; returns the actions array to inject
+        (indexed by launch index) or None to let the RL missiles choose their own
+    :returns: (model, finished ActionLog)
+    """
+    from headless import quiet_output, simulation_finished
+    from model import NavalModel
+
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 31)
+    with quiet_output(quiet):
+        model = NavalModel(seed=seed, **model_kwargs)
+        try:
+            log = ActionLog.attach(model, checkpoint_interval)
+            while model.steps < max_steps and not simulation_finished(model):
+                if policy is not None:
+                    model.rl_actions = policy(model)
+                log.step(model)
+            log.finish(model)
+        finally:
+            model.close()
+    return model, log
+
+
+class RandomPolicy:
+    """Uniformly random actions from an RNG of its own, i.e. randomness the model's seed does not cover."""
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, model):
+        from missile_rl_agent import NUM_ACTIONS
+        return self.rng.integers(0, NUM_ACTIONS, model.config['num_missiles'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help="Run an engagement and write its log")
+    record.add_argument('--mode', default='RL', choices=[mode.name for mode in SwarmMode])
+    record.add_argument('--missiles', type=int, default=25)
+    record.add_argument('--launch-interval', type=int, default=30)
+    record.add_argument('--max-steps', type=int, default=1000)
+    record.add_argument('--seed', type=int, default=None)
+    record.add_argument('--policy', choices=['none', 'random'], default='none',
+                        help="Inject actions from an external random policy (RL mode)")
+    record.add_argument('--out', default='run_log.npz')
+    play = commands.add_parser('replay', help="Replay a log, checking it against the recorded run")
+    play.add_argument('log')
+    play.add_argument('--to-step', type=int, default=None, help="Stop at this step (default: the end of the run)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        policy = RandomPolicy() if args.policy == 'random' else None
+        model, log = record_run(max_steps=args.max_steps, seed=args.seed, policy=policy,
+                                swarm_mode=SwarmMode[args.mode], num_missiles=args.missiles,
+                                launch_interval=args.launch_interval)
+        log.save(args.out)
+        print(f"{args.mode} seed {log.config['seed']}: {log.final_step} steps, {len(log.actions)} injected actions, "
+              f"{len(log.checkpoints)} checkpoints -> {args.out}")
+        return
+
+    replay = Replay(ActionLog.load(args.log))
+    model = replay.fast_forward(args.to_step) if args.to_step is not None else replay.run()
+    from base_agent import MissileAgent
+
+    in_flight = sum(1 for agent in model.agents if isinstance(agent, MissileAgent) and agent.alive)
+    counts = {}
+    for outcome in model.outcomes:
+        counts[outcome['outcome']] = counts.get(outcome['outcome'], 0) + 1
+    print(f"Replayed to step {model.steps} of {replay.end_step}; every checkpoint on the way matched")
+    print(f"  launched {model.missile_count}, in flight {in_flight}, outcomes {counts}")
+    print(f"  target at {model.target.pos}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+Preallocated experience storage for MissileRLAgent.
+
+ReplayBuffer keeps transitions (obs, action, reward, next_obs, done, missile id,
+episode id) in fixed-capacity NumPy columns used as a ring buffer: inserting
+writes one row (plus an O(log n) priority update) and, once full, the oldest
+transitions are overwritten. It supports
+
+- uniform and prioritized sampling (proportional prioritization over a sum
+  tree, with importance-sampling weights),
+- discounted returns and GAE advantages, computed over whole trajectories at
+  once (transitions grouped by episode and missile),
+- saving to and loading from .npz.
+
+Transitions are recorded directly from a model with buffer.attach(model,
+episode_id), or added in bulk, e.g. from the arrays of a RolloutPool, with
+add_batch.
+"""
+import numpy as np
+
+from missile_rl_agent import OBSERVATION_SIZE
+
+
+class SumTree:
+    """
+    Binary tree over `capacity` non-negative values in which each node holds the sum of
+    its children, so prefix-sum lookups and updates take O(log capacity).
+    Lookups and updates are vectorized over batches.
+    """
+
+    def __init__(self, capacity):
+        self.leaf_count = 1
+        while self.leaf_count < capacity:
+            self.leaf_count *= 2
+        self.nodes = np.zeros(2 * self.leaf_count, dtype=np.float64) # nodes[1] is the root
+
+    def total(self):
+        return self.nodes[1]
+
+    def update(self, indices, values):
+        """Sets the values at the given leaf indices and refreshes their ancestors."""
+        nodes = np.asarray(indices, dtype=np.int64) + self.leaf_count
+        self.nodes[nodes] = values
+        while True:
+            nodes = np.unique(nodes // 2) # All at the same depth, so one level per pass
+            if nodes[0] == 0:
+                break
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def update_one(self, index, value):
+        """update() for a single leaf, without the array overhead."""
+        nodes = self.nodes
+        node = index + self.leaf_count
+        nodes[node] = value
+        node //= 2
+        while node:
+            nodes[node] = nodes[2 * node] + nodes[2 * node + 1]
+            node //= 2
+
+    def find(self, prefix_sums):
+        """Leaf index at which the running sum of values reaches each of prefix_sums."""
+        prefix_sums = np.array(prefix_sums, dtype=np.float64)
+        nodes = np.ones(len(prefix_sums), dtype=np.int64)
+        while nodes[0] < self.leaf_count: # All leaves are at the same depth
+            left = 2 * nodes
+            go_right = prefix_sums >= self.nodes[left]
+            prefix_sums -= np.where(go_right, self.nodes[left], 0.0)
+            nodes = left + go_right
+        return nodes - self.leaf_count
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity transition storage. The columns are public attributes
+    (observations, actions, rewards, next_observations, dones, missile_ids,
+    episode_ids); only the first len(buffer) rows are valid.
+    """
+
+    def __init__(self, capacity, observation_size=OBSERVATION_SIZE, alpha=0.6):
+        """
+        :param capacity: Maximum number of transitions; the oldest are overwritten beyond it
+        :param observation_size: Length of an observation vector
+        :param alpha: How strongly priorities skew prioritized sampling (0 = uniform)
+        """
+        self.capacity = capacity
+        self.alpha = alpha
+        self.observations = np.zeros((capacity, observation_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_observations = np.zeros((capacity, observation_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.bool_)
+        self.missile_ids = np.zeros(capacity, dtype=np.int32)
+        self.episode_ids = np.zeros(capacity, dtype=np.int32)
+
+        self.position = 0 # Row the next transition is written to
+        self.size = 0
+        self.priorities = SumTree(capacity)
+        self.max_priority = 1.0 # New transitions get the highest priority seen, so each is sampled at least once
+
+    def __len__(self):
+        return self.size
+
+    def add(self, observation, action, reward, next_observation, done, missile_id, episode_id):
+        """Stores one transition, overwriting the oldest once the buffer is full."""
+        row = self.position
+        self.observations[row] = observation
+        self.actions[row] = action
+        self.rewards[row] = reward
+        self.next_observations[row] = next_observation
+        self.dones[row] = done
+        self.missile_ids[row] = missile_id
+        self.episode_ids[row] = episode_id
+        self.priorities.update_one(row, self.max_priority ** self.alpha)
+
+        self.position = (row + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_batch(self, observations, actions, rewards, next_observations, dones, missile_ids, episode_ids):
+        """Stores a batch of transitions (equal-length arrays, or scalars broadcast over the batch)."""
+        count = len(observations)
+        if count > self.capacity:
+            # Only the last `capacity` would survive anyway
+            skip = count - self.capacity
+            return self.add_batch(*(
+                column[skip:] if np.ndim(column) else column
+                for column in (observations, actions, rewards, next_observations, dones, missile_ids, episode_ids)
+            ))
+        rows = (self.position + np.arange(count)) % self.capacity
+        self.observations[rows] = observations
+        self.actions[rows] = actions
+        self.rewards[rows] = rewards
+        self.next_observations[rows] = next_observations
+        self.dones[rows] = dones
+        self.missile_ids[rows] = missile_ids
+        self.episode_ids[rows] = episode_ids
+        self.priorities.update(rows, np.full(count, self.max_priority ** self.alpha))
+
+        self.position = (self.position + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def attach(self, model, episode_id=0):
+        """Makes the RL missiles of `model` record every step they take into this buffer."""
+        model.replay_buffer = self
+        model.replay_episode_id = episode_id
+
+    def _batch(self, rows):
+        batch = {name: column[rows] for name, column in self._columns().items()}
+        batch['rows'] = rows
+        return batch
+
+    def sample(self, batch_size, rng=None):
+        """Uniformly samples transitions (with replacement). Returns a dict of arrays, including their 'rows'."""
+        rng = rng if rng is not None else np.random.default_rng()
+        return self._batch(rng.integers(0, self.size, batch_size))
+
+    def sample_prioritized(self, batch_size, beta=0.4, rng=None):
+        """
+        Samples transitions with probability proportional to priority ** alpha. The batch also holds
+        importance-sampling 'weights' (normalized to a maximum of 1) that correct for the skew;
+        beta = 1 corrects it fully.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        total = self.priorities.total()
+        # One draw per equal slice of the total, which spreads the batch over the buffer
+        bounds = np.arange(batch_size + 1) * (total / batch_size)
+        prefix_sums = rng.uniform(bounds[:-1], bounds[1:])
+        rows = np.minimum(self.priorities.find(prefix_sums), self.size - 1)
+
+        probabilities = self.priorities.nodes[rows + self.priorities.leaf_count] / total
+        weights = (self.size * probabilities) ** -beta
+        batch = self._batch(rows)
+        batch['weights'] = (weights / weights.max()).astype(np.float32)
+        return batch
+
+    def update_priorities(self, rows, priorities):
+        """Sets new priorities for sampled rows, typically their absolute TD errors."""
+        priorities = np.maximum(np.asarray(priorities, dtype=np.float64), 1e-6)
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.priorities.update(rows, priorities ** self.alpha)
+
+    def trajectories(self):
+        """
+        Groups the stored transitions into trajectories, one per (episode, missile), in the order
+        they were added.
+
+        :returns: int array (num_trajectories, longest_trajectory) of buffer rows, padded with -1
+        """
+        # Rows in insertion order, oldest first
+        order = (self.position - self.size + np.arange(self.size)) % self.capacity
+        # Stable sort by episode then missile, keeping insertion order within each trajectory
+        order = order[np.lexsort((self.missile_ids[order], self.episode_ids[order]))]
+
+        episodes = self.episode_ids[order]
+        missiles = self.missile_ids[order]
+        starts = np.flatnonzero(np.r_[True, (episodes[1:] != episodes[:-1]) | (missiles[1:] != missiles[:-1])])
+        lengths = np.diff(np.r_[starts, len(order)])
+        trajectory = np.repeat(np.arange(len(starts)), lengths)
+        step = np.arange(len(order)) - np.repeat(starts, lengths)
+
+        padded = np.full((len(starts), lengths.max(initial=0)), -1, dtype=np.int64)
+        padded[trajectory, step] = order
+        return padded
+
+    def compute_gae(self, values=None, next_values=None, gamma=0.99, lam=0.95):
+        """
+        Generalized advantage estimates and returns for every stored transition, computed backwards
+        over all trajectories at once.
+
+        :param values: V(observation) per buffer row, either len(buffer) or capacity values (only the
+            first len(buffer) are read); None gives plain discounted returns
+        :param next_values: V(next_observation) per buffer row, of either length too (used where a
+            trajectory is cut off without being done); defaults to zero
+        :returns: Tuple (advantages, returns) of float32 arrays indexed by buffer row
+        """
+        if values is None:
+            values = np.zeros(self.size)
+            lam = 1.0 # With zero values and lam = 1 the advantage is the discounted return
+        values = self._row_values(values, 'values')
+        next_values = np.zeros(self.size) if next_values is None else self._row_values(next_values, 'next_values')
+
+        padded = self.trajectories()
+        valid = padded >= 0
+        rows = np.where(valid, padded, 0)
+        rewards = np.where(valid, self.rewards[rows], 0.0)
+        not_done = np.where(valid, ~self.dones[rows], False)
+        step_values = np.where(valid, values[rows], 0.0)
+        bootstrap = np.where(valid, next_values[rows], 0.0)
+
+        advantages = np.zeros(padded.shape, dtype=np.float64)
+        next_advantage = np.zeros(len(padded))
+        for t in reversed(range(padded.shape[1])):
+            # Within a trajectory the next value is the next step's; at its last step, the bootstrap
+            next_value = step_values[:, t + 1] if t + 1 < padded.shape[1] else np.zeros(len(padded))
+            last = ~valid[:, t + 1] if t + 1 < padded.shape[1] else np.ones(len(padded), dtype=bool)
+            next_value = np.where(last, bootstrap[:, t], next_value)
+            next_advantage = np.where(last, 0.0, next_advantage)
+
+            delta = rewards[:, t] + gamma * next_value * not_done[:, t] - step_values[:, t]
+            next_advantage = delta + gamma * lam * not_done[:, t] * next_advantage
+            advantages[:, t] = next_advantage
+
+        result_advantages = np.zeros(self.size, dtype=np.float32)
+        result_advantages[padded[valid]] = advantages[valid]
+        result_returns = result_advantages + values.astype(np.float32)
+        return result_advantages, result_returns
+
+    def _row_values(self, values, name):
+        """The first len(buffer) entries of a per-row array given for the filled rows or the whole capacity."""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) not in (self.size, self.capacity):
+            raise ValueError(f"{name} has {len(values)} entries; expected len(buffer) ({self.size}) "
+                             f"or the capacity ({self.capacity})")
+        return values[:self.size]
+
+    def save(self, path):
+        """Writes the stored transitions and priorities to an .npz file."""
+        rows = (self.position - self.size + np.arange(self.size)) % self.capacity # Oldest first
+        np.savez_compressed(
+            path,
+            capacity=self.capacity,
+            alpha=self.alpha,
+            max_priority=self.max_priority,
+            priorities=self.priorities.nodes[rows + self.priorities.leaf_count],
+            **{name: column[rows] for name, column in self._columns().items()},
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Recreates a buffer written by save()."""
+        with np.load(path) as data:
+            buffer = cls(int(data['capacity']), data['observations'].shape[1], float(data['alpha']))
+            count = len(data['actions'])
+            for name, column in buffer._columns().items():
+                column[:count] = data[name]
+            buffer.size = count
+            buffer.position = count % buffer.capacity
+            buffer.max_priority = float(data['max_priority'])
+            if count:
+                buffer.priorities.update(np.arange(count), data['priorities'])
+        return buffer
+
+    def _columns(self):
+        return {
+            'observations': self.observations,
+            'actions': self.actions,
+            'rewards': self.rewards,
+            'next_observations': self.next_observations,
+            'dones': self.dones,
+            'missile_ids': self.missile_ids,
+            'episode_ids': self.episode_ids,
+        }
@@ -0,0 +1,353 @@
+"""
+Shared-memory rollout pool for collecting RL experience from MissileRLAgent.
+
+RolloutPool runs one RL-mode NavalModel per worker process. Observations,
+rewards and done flags are written by the workers straight into NumPy arrays
+backed by one multiprocessing.shared_memory block, and the policy's actions
+are read from the same block, so nothing is pickled on the per-step path: the
+pipe to each worker only carries a one-byte command and a one-byte reply.
+
+Every array is indexed [env, missile], where missile is the launch order within
+the episode (MissileAgent.launch_index), up to the model's num_missiles:
+
+    observations  float32 (envs, missiles, OBSERVATION_SIZE)  valid where active
+    actions       int8    (envs, missiles)   written by the caller before stepping
+    rewards       float32 (envs, missiles)   reward of the last step
+    dones         bool    (envs, missiles)   the missile's flight ended in the last step
+    truncated     bool    (envs, missiles)   the episode was cut off at max_steps with the
+                                             missile still in flight
+    active        bool    (envs, missiles)   the missile is in flight
+    episode_done  bool    (envs,)            the episode ended in the last step
+
+Observations are taken at the end of a step, so the policy picks the next
+actions from them; a missile launched during a step takes whatever action is
+in its row (0, hold course, after a reset) for its first step. When an
+episode ends, its rows are left as they are until the environment is next
+stepped, so the learner can read them: a truncated missile's observation is
+its final one, to bootstrap from. That step then starts the next episode
+(with a new seed), which resets the rows, actions included, and steps it.
+
+Synchronous stepping:
+
+    pool = RolloutPool(num_envs=4, seed=1)
+    while collecting:
+        pool.actions[:] = policy(pool.observations, pool.active)
+        pool.step()
+        learn(pool.observations, pool.rewards, pool.dones, pool.truncated, pool.episode_done)
+    pool.close()
+
+Asynchronous (first-ready) stepping, so that slow environments do not hold up
+fast ones:
+
+    pool.step_async(range(pool.num_envs))
+    while collecting:
+        for env in pool.wait_ready():
+            ... # read row `env`, write pool.actions[env]
+            pool.step_async([env])
+"""
+import argparse
+import gc
+import inspect
+import multiprocessing
+import time
+import traceback
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from missile_rl_agent import NUM_ACTIONS, OBSERVATION_SIZE
+
+# One-byte commands and replies on the worker pipes
+_STEP = b's'
+_RESET = b'r'
+_QUIT = b'q'
+_OK = b'k'
+_ERROR = b'e'
+
+
+def _layout(num_envs, max_missiles):
+    """Name -> (dtype, shape, byte offset) of every array in the shared block, and the total size."""
+    shapes = {
+        'observations': (np.float32, (num_envs, max_missiles, OBSERVATION_SIZE)),
+        'actions': (np.int8, (num_envs, max_missiles)),
+        'rewards': (np.float32, (num_envs, max_missiles)),
+        'dones': (np.bool_, (num_envs, max_missiles)),
+        'truncated': (np.bool_, (num_envs, max_missiles)),
+        'active': (np.bool_, (num_envs, max_missiles)),
+        'episode_done': (np.bool_, (num_envs,)),
+    }
+    layout = {}
+    offset = 0
+    for name, (dtype, shape) in shapes.items():
+        layout[name] = (dtype, shape, offset)
+        size = np.dtype(dtype).itemsize * int(np.prod(shape))
+        offset += (size + 7) // 8 * 8 # Keep every array 8-byte aligned
+    return layout, offset
+
+
+def _views(buffer, num_envs, max_missiles):
+    layout, _ = _layout(num_envs, max_missiles)
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        for name, (dtype, shape, offset) in layout.items()
+    }
+
+
+class RolloutPool:
+    """
+    Worker processes that each run RL episodes and exchange data through shared memory.
+    The arrays documented above are attributes of the pool (views of the shared block).
+    """
+
+    def __init__(self, num_envs, max_steps=1000, seed=None, **model_kwargs):
+        """
+        :param num_envs: Number of worker processes, one environment each
+        :param max_steps: Episodes are cut off after this many steps
+        :param seed: Base seed; each worker derives one per episode from it
+        :param model_kwargs: Further NavalModel arguments (swarm_mode is always RL)
+        """
+        from model import NavalModel # Deferred: workers import it themselves
+
+        self.num_envs = num_envs
+        default_missiles = inspect.signature(NavalModel).parameters['num_missiles'].default
+        self.max_missiles = model_kwargs.get('num_missiles', default_missiles)
+        self.num_actions = NUM_ACTIONS
+
+        _, size = _layout(num_envs, self.max_missiles)
+        self._shared_memory = SharedMemory(create=True, size=size)
+        for name, view in _views(self._shared_memory.buf, num_envs, self.max_missiles).items():
+            view.fill(0)
+            setattr(self, name, view)
+
+        # Spawned like the strip workers in parallel_engine.py
+        context = multiprocessing.get_context('spawn')
+        self._connections = []
+        self._workers = []
+        for env in range(num_envs):
+            parent_end, worker_end = context.Pipe()
+            worker = context.Process(
+                target=_rollout_worker,
+                args=(worker_end, env, self._shared_memory.name, num_envs, self.max_missiles,
+                      max_steps, seed, model_kwargs),
+                daemon=True,
+            )
+            worker.start()
+            worker_end.close()
+            self._connections.append(parent_end)
+            self._workers.append(worker)
+        self._pending = set()
+
+        # Every worker starts its first episode and reports ready
+        for env in range(num_envs):
+            self._send(env, _RESET)
+        self.wait_ready(all_envs=True)
+
+    def step(self):
+        """Steps every environment with the current actions and waits for all of them."""
+        self.step_async(range(self.num_envs))
+        self.wait_ready(all_envs=True)
+
+    def step_async(self, envs):
+        """Starts a step of the given environments with their current actions, without waiting."""
+        for env in envs:
+            self._send(env, _STEP)
+
+    def wait_ready(self, all_envs=False, timeout=None):
+        """
+        Waits for stepping environments to finish.
+
+        :param all_envs: Wait for every pending environment rather than the first to finish
+        :param timeout: Seconds to wait when not waiting for all; [] is returned on timeout
+        :returns: Indices of the environments that finished (their rows are up to date)
+        """
+        ready = []
+        while self._pending:
+            connections = [self._connections[env] for env in self._pending]
+            finished = wait(connections, timeout=None if all_envs else timeout)
+            for connection in finished:
+                env = self._connections.index(connection)
+                self._receive(env)
+                ready.append(env)
+            if not all_envs:
+                break
+        return ready
+
+    def _send(self, env, command):
+        if env in self._pending:
+            raise RuntimeError(f"Environment {env} is still stepping")
+        self._connections[env].send_bytes(command)
+        self._pending.add(env)
+
+    def _receive(self, env):
+        try:
+            reply = self._connections[env].recv_bytes()
+        except (EOFError, OSError) as error:
+            raise RuntimeError(f"Rollout worker {env} exited unexpectedly") from error
+        self._pending.discard(env)
+        if reply[:1] == _ERROR:
+            raise RuntimeError(f"Rollout worker {env} failed:\n{reply[1:].decode()}")
+
+    def close(self):
+        """Stops the workers and releases the shared memory. Safe to call more than once."""
+        for connection in self._connections:
+            try:
+                connection.send_bytes(_QUIT)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._connections = []
+        self._workers = []
+        if self._shared_memory is not None:
+            # Drop the views before the block they point into
+            for name in _layout(self.num_envs, self.max_missiles)[0]:
+                setattr(self, name, None)
+            self._shared_memory.close()
+            self._shared_memory.unlink()
+            self._shared_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _RolloutEnv:
+    """One worker's environment: runs episodes and mirrors them into its rows of the shared arrays."""
+
+    def __init__(self, env, views, max_steps, seed, model_kwargs):
+        self.env = env
+        self.max_steps = max_steps
+        self.seed = seed
+        self.model_kwargs = model_kwargs
+        self.episode = 0
+        self.model = None
+        self.in_flight = {} # launch_index -> missile, for missiles not yet reported done
+        self.reset_pending = False # The episode has ended; the next step starts a new one
+
+        self.observations = views['observations'][env]
+        self.actions = views['actions'][env]
+        self.rewards = views['rewards'][env]
+        self.dones = views['dones'][env]
+        self.truncated = views['truncated'][env]
+        self.active = views['active'][env]
+        self.episode_done = views['episode_done'][env:env + 1]
+
+    def reset(self):
+        from model import NavalModel
+        from swarm_modes import SwarmMode
+
+        self.episode += 1
+        seed = None if self.seed is None else hash((self.seed, self.env, self.episode)) & 0x7FFFFFFF
+        self.model = NavalModel(swarm_mode=SwarmMode.RL, seed=seed, **self.model_kwargs)
+        self.model.rl_actions = self.actions # Read in place by MissileRLAgent.select_action
+        self.in_flight = {}
+        self.reset_pending = False
+        self.observations.fill(0)
+        self.actions.fill(0)
+        self.rewards.fill(0)
+        self.dones.fill(False)
+        self.truncated.fill(False)
+        self.active.fill(False)
+        self.episode_done[0] = False
+
+    def step(self):
+        from headless import simulation_finished
+        from missile_rl_agent import MissileRLAgent
+
+        if self.reset_pending:
+            self.reset()
+        self.model.step()
+
+        self.rewards.fill(0)
+        self.dones.fill(False)
+        for agent in self.model.agents:
+            if isinstance(agent, MissileRLAgent):
+                self.in_flight[agent.launch_index] = agent # Picks up this step's launch
+
+        # Missiles retired this step have left model.agents but are still held here
+        for index, missile in list(self.in_flight.items()):
+            self.rewards[index] = missile.reward
+            if missile.alive:
+                self.observations[index] = missile.get_observation()
+                self.active[index] = True
+            else:
+                self.dones[index] = True
+                self.active[index] = False
+                del self.in_flight[index]
+
+        finished = simulation_finished(self.model) or self.model.steps >= self.max_steps
+        self.episode_done[0] = finished
+        if finished:
+            # Cut off with missiles still flying: their rows keep the final observations
+            for index in self.in_flight:
+                self.truncated[index] = True
+                self.active[index] = False
+            self.reset_pending = True
+
+
+def _rollout_worker(connection, env, shared_memory_name, num_envs, max_missiles, max_steps, seed, model_kwargs):
+    """Worker process entry point: steps its environment on command until told to quit."""
+    from headless import quiet_output
+
+    shared_memory = SharedMemory(name=shared_memory_name)
+    views = _views(shared_memory.buf, num_envs, max_missiles)
+    rollout_env = None
+    with quiet_output():
+        try:
+            rollout_env = _RolloutEnv(env, views, max_steps, seed, model_kwargs)
+            while True:
+                command = connection.recv_bytes()
+                if command == _QUIT:
+                    break
+                if command == _RESET:
+                    rollout_env.reset()
+                else:
+                    rollout_env.step()
+                connection.send_bytes(_OK)
+        except Exception:
+            connection.send_bytes(_ERROR + traceback.format_exc().encode())
+    # The model holds a view of the block (rl_actions) and agents and model reference each
+    # other, so collect the cycle before unmapping
+    del views, rollout_env
+    gc.collect()
+    shared_memory.close()
+    connection.close()
+
+
+def main(argv=None):
+    """Runs a random policy through a pool and reports the stepping rate of both modes."""
+    parser = argparse.ArgumentParser(description="Rollout pool throughput with a random policy")
+    parser.add_argument('--envs', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=500, help="Steps per environment")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    with RolloutPool(args.envs, seed=args.seed) as pool:
+        start = time.perf_counter()
+        transitions = 0
+        for _ in range(args.steps):
+            pool.actions[:] = rng.integers(0, pool.num_actions, pool.actions.shape)
+            pool.step()
+            transitions += int(pool.active.sum() + pool.dones.sum() + pool.truncated.sum())
+        elapsed = time.perf_counter() - start
+        print(f"sync:  {args.envs * args.steps / elapsed:8.0f} env steps/s, {transitions / elapsed:8.0f} missile transitions/s")
+
+        start = time.perf_counter()
+        env_steps = 0
+        pool.step_async(range(pool.num_envs))
+        while env_steps < args.envs * args.steps:
+            for env in pool.wait_ready():
+                env_steps += 1
+                pool.actions[env] = rng.integers(0, pool.num_actions, pool.max_missiles)
+                pool.step_async([env])
+        pool.wait_ready(all_envs=True)
+        elapsed = time.perf_counter() - start
+        print(f"async: {env_steps / elapsed:8.0f} env steps/s")
+
+
+if __name__ == '__main__':
+    main()
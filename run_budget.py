@@ -0,0 +1,211 @@
+"""
+Budgets, a watchdog and step timing for headless runs.
+
+run_headless (and so every batch runner built on it) stops a run at the first of
+max_steps steps or wall_time_budget seconds. The wall-time budget is enforced by
+a RunWatchdog thread:
+
+- When the budget runs out it takes a stack sample of the running thread and
+  flags the run, which stops at the end of the current step. The model is
+  then consistent, so a diagnostics file is written with the stack sample, the
+  configuration and a snapshot of every agent (see write_diagnostics).
+- A step is never interrupted. If the current one has still not returned after
+  a grace period, the watchdog takes a second sample and writes the
+  diagnostics itself, so a run stuck inside a step still leaves a trace of
+  where it is stuck. The run itself carries on: a single run_headless call
+  cannot pre-empt a step. Only the process running it can be killed, which
+  batch_runner.run_adaptive does to runs that are still going well past
+  their budget.
+
+Every run also times each of its steps into a StepLatencyHistogram, reported
+in the run summary as 'step_latency'.
+"""
+import json
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Steps are timed into power-of-two bins of microseconds: bin b holds latencies in [2**(b-1), 2**b) µs
+_LATENCY_BINS = 40
+
+
+class StepLatencyHistogram:
+    """Log-binned histogram of step wall times, with the exact count, total and maximum."""
+
+    def __init__(self):
+        self.bins = [0] * _LATENCY_BINS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        microseconds = seconds * 1e6
+        # frexp gives the exponent e with 2**(e-1) <= x < 2**e, i.e. the bin, without a log call
+        exponent = math.frexp(microseconds)[1] if microseconds >= 1 else 0
+        self.bins[min(exponent, _LATENCY_BINS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @classmethod
+    def from_summary(cls, summary):
+        """Rebuilds a histogram from its summary(), e.g. one sent back by a worker process."""
+        histogram = cls()
+        for edge, count in summary['bins_us'].items():
+            histogram.bins[int(edge).bit_length() - 1] = count
+        histogram.count = summary['count']
+        histogram.total = summary['mean'] * summary['count'] if summary['count'] else 0.0
+        histogram.max = summary['max']
+        return histogram
+
+    def merge(self, other):
+        """Adds another histogram's steps to this one. Returns self."""
+        self.bins = [mine + theirs for mine, theirs in zip(self.bins, other.bins)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Upper edge (seconds) of the bin holding the q-quantile step; within a factor of two of the true value."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for exponent, count in enumerate(self.bins):
+            seen += count
+            if seen >= rank and count:
+                return min(2.0 ** exponent * 1e-6, self.max)
+        return self.max
+
+    def summary(self):
+        """Plain dict for run summaries: count, mean, p50, p90, p99, max (seconds) and the non-empty bins."""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+            # Upper edge of each non-empty bin, in microseconds -> number of steps
+            'bins_us': {2 ** exponent: count for exponent, count in enumerate(self.bins) if count},
+        }
+
+
+class RunWatchdog:
+    """
+    Thread that flags a run once its wall-time budget is used up and samples where the run is.
+    The run polls `expired` between steps.
+    """
+
+    def __init__(self, budget, grace=None, on_hang=None):
+        """
+        :param budget: Seconds of wall time the run may take
+        :param grace: Seconds after the budget for the current step to return before the run counts
+            as hung (default: the budget, at least one second)
+        :param on_hang: Called with the watchdog, from its thread, if the run is hung
+        """
+        self.budget = budget
+        self.grace = grace if grace is not None else max(budget, 1.0)
+        self.on_hang = on_hang
+        self.expired = False
+        self.hung = False
+        self.stack_samples = [] # (seconds since start, formatted stack of the run's thread)
+        self._done = threading.Event()
+        self._thread = None
+        self._run_thread_id = None
+        self._start = None
+
+    def start(self):
+        """Starts timing the calling thread's run."""
+        self._run_thread_id = threading.get_ident()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._watch, name='run-watchdog', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the watchdog once the run is over. Safe to call more than once."""
+        self._done.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def sample(self):
+        """Records the run's thread's current stack."""
+        frame = sys._current_frames().get(self._run_thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame is not None else '(the run has finished)'
+        self.stack_samples.append((time.perf_counter() - self._start, stack))
+
+    def _watch(self):
+        if self._done.wait(self.budget):
+            return
+        self.sample()
+        self.expired = True
+        if self._done.wait(self.grace):
+            return
+        self.sample()
+        self.hung = True
+        if self.on_hang is not None:
+            try:
+                self.on_hang(self)
+            except Exception:
+                traceback.print_exc(file=sys.stderr) # stdout may be silenced by quiet_output
+
+
+def model_snapshot(model):
+    """
+    JSON-ready state of a model and its agents, for diagnosing a run after the fact.
+    Missiles run by strip workers (parallel_strips) are not in the main model and are left out.
+    """
+    from base_agent import MissileAgent
+
+    missiles = []
+    for agent in list(model.agents):
+        if isinstance(agent, MissileAgent):
+            state = agent.get_state()
+            trail = state.pop('trail')
+            state['trail_tail'] = trail[-10:] if trail else trail # Where it has just been; the full trail is too big
+            missiles.append(state)
+    outcome_counts = {}
+    for outcome in model.outcomes:
+        outcome_counts[outcome['outcome']] = outcome_counts.get(outcome['outcome'], 0) + 1
+    return {
+        'steps': model.steps,
+        'sim_time': model.sim_time,
+        'launched': model.missile_count,
+        'outcome_counts': outcome_counts,
+        'target_pos': model.target.pos,
+        'estimate': model.estimate_store.current,
+        'config': model.config,
+        'missiles': missiles,
+    }
+
+
+def write_diagnostics(directory, name, watchdog, model, extra=None):
+    """
+    Writes a timed-out run's diagnostics to <directory>/<name>.json.
+
+    :param watchdog: The RunWatchdog whose stack samples are written
+    :param model: The run's model, or None to leave out the snapshot
+    :param extra: Further JSON-ready fields (seed, budgets, step latencies, ...)
+    :returns: The file's path
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.json")
+    report = dict(extra or {})
+    report['hung'] = watchdog.hung
+    report['stack_samples'] = [{'elapsed': elapsed, 'stack': stack} for elapsed, stack in watchdog.stack_samples]
+    if model is not None:
+        try:
+            report['model'] = model_snapshot(model)
+        except Exception:
+            # A hung run's model may be half-way through a step
+            report['model_error'] = traceback.format_exc()
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=1, default=str) # Enums, tuples of numpy floats, ... as text
+    return path
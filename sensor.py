@@ -1,5 +1,6 @@
 import math
 import random
+from functools import lru_cache
 
 
 class Sensor:
@@ -9,7 +10,10 @@ class Sensor:
     - Detects a target within a specified angular field of view and range.
     - Returns boolean detection result and a noisy estimate of target position.
     - Uses forward direction of the sensing agent to determine if target is in view.
+    - Holds no per-detection state, so one instance can serve many agents (see shared_sensor).
     """
+    __slots__ = ('range', 'field_of_view_deg', 'noise_std', 'is_active')
+
     def __init__(self, range, field_of_view_deg, noise_std=0.0, is_active=False):
         """
         :param range: Max detection distance (units)
@@ -22,10 +26,13 @@ class Sensor:
         self.noise_std = noise_std
         self.is_active = is_active
 
-    def run_detection(self, missile_pos, missile_direction, target_pos):
+    def run_detection(self, missile_pos, missile_direction, target_pos, rng=random):
         """
         Determines whether the target is detected.
 
+        :param rng: Random source for the measurement noise (normally one of the model's random
+            streams, so that seeded runs are reproducible)
+
         :returns: Tuple (detected: bool, noisy_relative_position: tuple or None)
         """
         dx = target_pos[0] - missile_pos[0]
@@ -48,8 +55,18 @@ class Sensor:
             return False, None  # Outside field of view
 
         # Add noise to sensed position (optional)
-        noisy_dx = dx + random.gauss(0, self.noise_std)
-        noisy_dy = dy + random.gauss(0, self.noise_std)
+        noisy_dx = dx + rng.gauss(0, self.noise_std)
+        noisy_dy = dy + rng.gauss(0, self.noise_std)
         noisy_rel_pos = (noisy_dx, noisy_dy)
 
         return True, noisy_rel_pos
+
+
+@lru_cache(maxsize=None)
+def shared_sensor(range, field_of_view_deg, noise_std=0.0, is_active=False):
+    """
+    Returns the shared Sensor for a parameter set (one per missile type in practice),
+    so a salvo does not carry a Sensor object per missile.
+    The returned instance is shared: do not modify its attributes.
+    """
+    return Sensor(range, field_of_view_deg, noise_std=noise_std, is_active=is_active)
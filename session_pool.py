@@ -0,0 +1,418 @@
+"""
+Per-session models run in a bounded pool of worker processes.
+
+The Solara app keeps its state per browser session, but every session's
+NavalModel used to be stepped inside the server process, so concurrent
+analysts contended on one GIL and a heavy run slowed everyone's page down.
+SessionPool moves the models out:
+
+- Each session gets its own model, hosted by one of a fixed number of worker
+  processes (the least loaded when it opens). A worker steps its sessions one
+  at a time; sessions on different workers step in parallel.
+- Admission control: at most max_sessions models exist at once. Opening one
+  more first evicts the idle sessions and then, if still full, raises
+  PoolFull rather than overloading the workers.
+- Idle eviction: sessions not used for idle_timeout seconds are closed, by a
+  background thread and on every open, so abandoned browser tabs do not hold
+  models forever. Using an evicted session raises SessionClosed.
+
+Only snapshots (see snapshot()) travel back to the server: plain positions
+and trails, which is all the app draws.
+
+    pool = SessionPool(workers=2, max_sessions=8, idle_timeout=600, culling=True)
+    session, view = pool.open_session(swarm_mode=SwarmMode.WAVE, seed=1)
+    view = session.step() # Snapshot after the step
+    session.close()
+    pool.close()
+
+With workers=0 the models are hosted in the calling process, which is handy
+for a single user and for debugging.
+
+    python session_pool.py --sessions 8 --workers 2 --steps 200
+"""
+import argparse
+import itertools
+import multiprocessing
+import threading
+import time
+import traceback
+
+from swarm_modes import MissileType, SwarmMode
+
+
+class PoolFull(RuntimeError):
+    """Raised when a session is opened while the pool already holds max_sessions."""
+
+
+class SessionClosed(RuntimeError):
+    """Raised when a session that was closed or evicted is used."""
+
+
+def thin_trail(trail, stride):
+    """Every stride-th point of a trail, counted back from the missile so that it still ends there."""
+    if stride <= 1:
+        return trail
+    return trail[(len(trail) - 1) % stride::stride]
+
+
+def snapshot(model, trail_budget=None):
+    """
+    Plain dict of what the app draws of a model: picklable and free of agent references.
+
+    'missiles' holds (pos, trail, is_scout, exploded, alive, trail_stride) of every missile still
+    among the agents, trail_stride being how many steps apart the trail points sent are.
+
+    :param trail_budget: Most trail points in the whole snapshot (None: every point). Each trail
+        keeps every trail_stride-th point (see thin_trail()).
+    """
+    from base_agent import MissileAgent
+    from target_agent import TargetAgent
+    from TargetReportingUnit import TargetReportingUnit
+
+    missiles, targets, trus = [], [], []
+    per_trail = None
+    if trail_budget is not None:
+        per_trail = max(2, trail_budget // max(1, len(model.agents)))
+    for agent in model.agents:
+        if isinstance(agent, MissileAgent):
+            trail = list(agent.trail) if agent.alive and agent.trail else [] # Only live missiles' trails are drawn
+            stride = 1
+            if per_trail is not None and len(trail) > per_trail:
+                stride = -(-len(trail) // per_trail)
+                trail = thin_trail(trail, stride)
+            missiles.append((agent.pos, trail, agent.missile_type == MissileType.SCOUT, agent.exploded, agent.alive, stride))
+        elif isinstance(agent, TargetAgent):
+            targets.append(agent.pos)
+        elif isinstance(agent, TargetReportingUnit):
+            trus.append(agent.pos)
+    return {
+        'step': model.steps,
+        'running': model.running,
+        'swarm_mode': model.swarm_mode.name,
+        'width': model.grid.width,
+        'height': model.grid.height,
+        'missiles': missiles,
+        'targets': targets,
+        'trus': trus,
+    }
+
+
+class _SessionHost:
+    """The models of one worker, by session id. Commands are create, step, snapshot and close."""
+
+    def __init__(self, trail_budget=None):
+        self.models = {}
+        self.trail_budget = trail_budget
+
+    def handle(self, command, session_id, argument):
+        if command == 'create':
+            from model import NavalModel
+            self.models[session_id] = NavalModel(**argument)
+            return snapshot(self.models[session_id], self.trail_budget)
+        if command == 'close':
+            model = self.models.pop(session_id, None)
+            if model is not None:
+                model.close()
+            return None
+
+        model = self.models.get(session_id)
+        if model is None:
+            raise SessionClosed(f"No session {session_id} in this worker")
+        if command == 'step':
+            for _ in range(argument):
+                if not model.running:
+                    break
+                model.step()
+        elif command != 'snapshot':
+            raise ValueError(f"Unknown session command {command!r}")
+        return snapshot(model, self.trail_budget)
+
+    def close(self):
+        for model in self.models.values():
+            model.close()
+        self.models = {}
+
+
+def _session_worker(connection, quiet, trail_budget):
+    """Worker process entry point: runs commands on its sessions' models until told to stop."""
+    from headless import quiet_output
+
+    host = _SessionHost(trail_budget)
+    with quiet_output(quiet):
+        while True:
+            try:
+                request = connection.recv()
+            except (EOFError, OSError):
+                break # The server has gone
+            if request is None:
+                break
+            try:
+                connection.send(('ok', host.handle(*request)))
+            except SessionClosed as error:
+                connection.send(('closed', str(error)))
+            except Exception:
+                connection.send(('error', traceback.format_exc()))
+        host.close()
+    connection.close()
+
+
+class _WorkerProcess:
+    """A worker process and the pipe to it. One request at a time; callers serialize on `lock`."""
+
+    def __init__(self, index, context, quiet, trail_budget):
+        self.index = index
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self._connection, worker_end = context.Pipe()
+        self._process = context.Process(target=_session_worker, args=(worker_end, quiet, trail_budget), daemon=True)
+        self._process.start()
+        worker_end.close()
+
+    def request(self, command, session_id, argument=None):
+        with self.lock:
+            try:
+                self._connection.send((command, session_id, argument))
+                status, result = self._connection.recv()
+            except (EOFError, OSError) as error:
+                raise RuntimeError(f"Session worker {self.index} exited unexpectedly") from error
+        if status == 'closed':
+            raise SessionClosed(result)
+        if status == 'error':
+            raise RuntimeError(f"Session worker {self.index} failed:\n{result}")
+        return result
+
+    def close(self):
+        with self.lock:
+            try:
+                self._connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self._process.join(timeout=5)
+        self._connection.close()
+
+
+class _LocalWorker:
+    """Hosts sessions in the calling process, with the interface of _WorkerProcess (workers=0)."""
+
+    def __init__(self, index, trail_budget):
+        self.index = index
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self._host = _SessionHost(trail_budget)
+
+    def request(self, command, session_id, argument=None):
+        with self.lock:
+            return self._host.handle(command, session_id, argument)
+
+    def close(self):
+        with self.lock:
+            self._host.close()
+
+
+class Session:
+    """Handle on one session's model in a SessionPool. Every call returns a fresh snapshot."""
+
+    def __init__(self, pool, session_id, worker):
+        self.pool = pool
+        self.session_id = session_id
+        self.worker = worker
+        self.closed = False
+        self.last_used = time.monotonic()
+
+    def step(self, steps=1):
+        """Steps the model up to `steps` times (fewer once it has finished)."""
+        return self._request('step', steps)
+
+    def snapshot(self):
+        return self._request('snapshot')
+
+    def close(self):
+        """Closes the session and frees its model. Safe to call more than once."""
+        self.pool._close_session(self)
+
+    def _request(self, command, argument=None):
+        if self.closed:
+            raise SessionClosed(f"Session {self.session_id} was closed")
+        self.last_used = time.monotonic()
+        return self.worker.request(command, self.session_id, argument)
+
+
+class SessionPool:
+    """
+    A fixed number of workers hosting up to max_sessions models, with idle eviction.
+    Thread safe: sessions are opened, stepped and closed from the server's threads.
+    Running totals are kept in `counts`; an evicted session is counted as 'evicted', not as 'closed'.
+    """
+
+    def __init__(self, workers=None, max_sessions=8, idle_timeout=900.0, quiet=True, trail_budget=None,
+                 **model_defaults):
+        """
+        :param workers: Worker processes (default: one per CPU); 0 hosts the models in this process
+        :param max_sessions: Most models that may exist at once
+        :param idle_timeout: Seconds after its last use at which a session is evicted (None: never)
+        :param quiet: Discard the models' per-step logging in the workers
+        :param trail_budget: Most trail points per snapshot (see snapshot()), so that what is sent
+            back each step stays bounded however large the swarm
+        :param model_defaults: NavalModel arguments of every session, unless it overrides them
+        """
+        if max_sessions < 1:
+            raise ValueError("A session pool needs room for at least one session")
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.model_defaults = model_defaults
+        self.counts = {'opened': 0, 'closed': 0, 'evicted': 0, 'rejected': 0}
+        self._sessions = {} # session_id -> Session
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        if workers == 0:
+            self._workers = [_LocalWorker(0, trail_budget)]
+        else:
+            # Spawned like the strip workers in parallel_engine.py: no inherited server threads
+            context = multiprocessing.get_context('spawn')
+            self._workers = [
+                _WorkerProcess(index, context, quiet, trail_budget) for index in range(workers or multiprocessing.cpu_count())
+            ]
+
+        self._stop = threading.Event()
+        self._reaper = None
+        if idle_timeout is not None:
+            self._reaper = threading.Thread(target=self._reap, args=(min(idle_timeout / 4, 30.0),), daemon=True)
+            self._reaper.start()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def num_workers(self):
+        return len(self._workers)
+
+    def open_session(self, **model_kwargs):
+        """
+        Builds a new session's model on the least loaded worker.
+
+        :param model_kwargs: NavalModel arguments, over the pool's model_defaults
+        :returns: (Session, snapshot of the new model)
+        :raises PoolFull: if max_sessions are open and none of them is idle
+        """
+        self.evict_idle()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                self.counts['rejected'] += 1
+                raise PoolFull(f"All {self.max_sessions} simulation sessions are in use; try again later")
+            worker = min(self._workers, key=lambda candidate: len(candidate.sessions))
+            session = Session(self, next(self._ids), worker)
+            # Reserved before the model is built, so concurrent opens count it
+            self._sessions[session.session_id] = session
+            worker.sessions.add(session.session_id)
+        try:
+            view = worker.request('create', session.session_id, dict(self.model_defaults, **model_kwargs))
+        except Exception:
+            self._forget(session)
+            raise
+        session.last_used = time.monotonic() # Idle from now, not from before a possibly slow build
+        with self._lock:
+            self.counts['opened'] += 1
+        return session, view
+
+    def evict_idle(self, now=None):
+        """Closes every session unused for idle_timeout seconds. Returns how many were closed."""
+        if self.idle_timeout is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [session for session in self._sessions.values() if now - session.last_used > self.idle_timeout]
+        evicted = 0
+        for session in idle:
+            if self._close_session(session, 'evicted'):
+                evicted += 1
+        return evicted
+
+    def close(self):
+        """Closes every session and stops the workers. Safe to call more than once."""
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join(timeout=5)
+            self._reaper = None
+        with self._lock:
+            for session in self._sessions.values():
+                session.closed = True
+            self._sessions = {}
+        for worker in self._workers:
+            worker.close()
+        self._workers = []
+
+    def _close_session(self, session, reason='closed'):
+        """
+        Frees a session's model. Returns False if it was already closed.
+
+        :param reason: Key of `counts` the session is counted under ('closed' or 'evicted')
+        """
+        if not self._forget(session, reason):
+            return False
+        try:
+            session.worker.request('close', session.session_id)
+        except RuntimeError:
+            pass # The worker has gone, and the model with it
+        return True
+
+    def _forget(self, session, reason=None):
+        with self._lock:
+            if session.closed or self._sessions.pop(session.session_id, None) is None:
+                return False
+            session.closed = True
+            session.worker.sessions.discard(session.session_id)
+            if reason is not None:
+                self.counts[reason] += 1
+            return True
+
+    def _reap(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.evict_idle()
+            except Exception:
+                traceback.print_exc() # Keep reaping: one failed close must not leak every later idle session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    """Steps several sessions concurrently, one server thread each, and reports the throughput."""
+    parser = argparse.ArgumentParser(description="Throughput of concurrent sessions in a session pool")
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (0: in this process)")
+    parser.add_argument('--steps', type=int, default=200, help="Steps per session")
+    parser.add_argument('--mode', default='OVERWHELM', choices=[mode.name for mode in SwarmMode])
+    parser.add_argument('--missiles', type=int, default=25)
+    parser.add_argument('--launch-interval', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    with SessionPool(workers=args.workers, max_sessions=args.sessions, num_missiles=args.missiles,
+                     launch_interval=args.launch_interval, culling=True) as pool:
+        sessions = [pool.open_session(swarm_mode=SwarmMode[args.mode], seed=seed)[0] for seed in range(args.sessions)]
+        steps = [0] * len(sessions)
+
+        def drive(index):
+            for _ in range(args.steps):
+                view = sessions[index].step()
+                steps[index] = view['step']
+                if not view['running']:
+                    break
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=drive, args=(index,)) for index in range(len(sessions))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"{len(sessions)} sessions on {pool.num_workers} worker(s): {sum(steps)} steps in {elapsed:.2f} s "
+              f"({sum(steps) / elapsed:.0f} steps/s)")
+
+
+if __name__ == '__main__':
+    main()
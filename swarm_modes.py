@@ -22,3 +22,58 @@ class RecceState(Enum):
     INITIAL_LOITER = 1      # Attacker is waiting for scout confirmation
     CONFIRMED_ATTACK = 2    # Attacker has received confirmation and is proceeding to attack
 
+
+class EstimateSource(Enum):
+    """Where the target estimate a missile is steering by came from."""
+    LAUNCH = 1      # The pre-launch estimate every missile starts with
+    TRU = 2         # Published by a target reporting unit
+    FUSED = 3       # Averaged with estimates broadcast by other missiles
+    SCOUT = 4       # Fused from scout broadcasts (RECCE)
+    SEEKER = 5      # The missile's own sensor
+    GUESS = 6       # No estimate at all: straight ahead
+
+
+
+# Tunable constants of each mode's tactic (see guidance_strategies.py), overridden per run with
+# NavalModel(tactic_params={...}) and searched by optimize_tactics.py. Distances are in cells.
+TACTIC_PARAMS = {
+    SwarmMode.OVERWHELM: {
+        'loiter_buffer': 5.0,           # How far ahead of the swarm's average distance a missile loiters
+        'final_assault_distance': 10.0, # Distance to the target inside which it goes in at full speed
+        'loiter_speed_factor': 0.2,     # Fraction of base speed while loitering
+    },
+    SwarmMode.WAVE: {
+        'loiter_buffer': 5.0,
+        'final_assault_distance': 10.0,
+        'wave_stagger_increment': 15.0, # Extra final assault distance per wave
+        'loiter_speed_factor': 0.2,
+    },
+    SwarmMode.RECCE: {
+        'scout_ratio': 0.2,             # Share of the missiles launched as scouts (at least 2)
+        'scout_lateral_offset': 0.3,    # Largest random sideways deviation of a scout's heading
+    },
+    SwarmMode.SPLIT_AXIS: {
+        'terminal_distance': 40.0,      # Distance inside which missiles turn straight for the target
+        'approach_offset': 50.0,        # Distance of the approach points from the target
+        'cohesion_buffer': 10.0,        # Band around the swarm's average distance left at base speed
+    },
+    SwarmMode.DECOY: {
+        'diverge_distance': 80.0,       # Distance at which decoys break away
+        'self_destruct_distance': 10.0, # Distance at which a decoy that got too close self-destructs
+    },
+}
+
+
+def resolve_tactic_params(swarm_mode, overrides=None):
+    """
+    The tactic constants of a mode, with any overrides applied.
+
+    :param overrides: Dict of parameter name -> value; names must be parameters of the mode
+    :returns: New dict (empty for modes without tunable constants)
+    """
+    params = dict(TACTIC_PARAMS.get(swarm_mode, {}))
+    unknown = set(overrides or {}) - set(params)
+    if unknown:
+        raise ValueError(f"Unknown tactic parameters for {swarm_mode.name}: {', '.join(sorted(unknown))}")
+    params.update(overrides or {})
+    return params
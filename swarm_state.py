@@ -0,0 +1,130 @@
+"""
+Array-backed storage for the scalar state of missiles.
+
+With NavalModel(compact_state=True), every missile's numeric fields (position,
+direction, speeds, fuel, flags) live in one row of preallocated NumPy columns
+instead of as individual Python objects on the agent. The agents keep their
+normal attribute interface: the fields become properties that read and write
+the missile's row, so guidance code is unchanged.
+"""
+import numpy as np
+
+
+class SwarmState:
+    """
+    Column storage for missile state, one row per launched missile.
+
+    Rows are handed out in launch order and never reused, so a row stays valid
+    (and readable, e.g. for RL rewards) after its missile has been retired.
+    """
+    # Field name -> (dtype, row width). Width 1 fields are scalars.
+    COLUMNS = {
+        'float_pos': (np.float64, 2),
+        'direction': (np.float64, 2),
+        'speed': (np.float64, 1),
+        'base_speed': (np.float64, 1),
+        'min_speed': (np.float64, 1),
+        'max_speed': (np.float64, 1),
+        'comms_range': (np.float64, 1),
+        'fuel': (np.float32, 1), # Burns dt per step, so fractional with dt != 1
+        'wave_id': (np.int16, 1),
+        'alive': (np.bool_, 1),
+        'exploded': (np.bool_, 1),
+    }
+
+    def __init__(self, capacity):
+        """
+        :param capacity: Number of rows to preallocate (normally the model's num_missiles)
+        """
+        self.capacity = max(1, capacity)
+        self.count = 0
+        for name, (dtype, width) in self.COLUMNS.items():
+            shape = (self.capacity, width) if width > 1 else (self.capacity,)
+            setattr(self, name, np.zeros(shape, dtype=dtype))
+
+    def allocate(self):
+        """Returns the index of a fresh row, growing the columns if capacity is exhausted."""
+        if self.count == self.capacity:
+            self._grow(self.capacity * 2)
+        row = self.count
+        self.count += 1
+        return row
+
+    def _grow(self, new_capacity):
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.capacity = new_capacity
+
+    @classmethod
+    def bytes_per_missile(cls):
+        """Bytes of column storage used by one row."""
+        return sum(np.dtype(dtype).itemsize * width for dtype, width in cls.COLUMNS.values())
+
+
+def _scalar_property(name):
+    def getter(self):
+        return getattr(self._swarm_state, name)[self._row].item()
+
+    def setter(self, value):
+        getattr(self._swarm_state, name)[self._row] = value
+
+    return property(getter, setter)
+
+
+def _float_pos_property():
+    # Returns a view of the row so that in-place updates such as
+    # `missile.float_pos[0] += dx` write straight through to the column.
+    def getter(self):
+        return self._swarm_state.float_pos[self._row]
+
+    def setter(self, value):
+        self._swarm_state.float_pos[self._row] = value
+
+    return property(getter, setter)
+
+
+def _direction_property():
+    # Directions are always replaced as a whole, so a plain tuple is returned.
+    def getter(self):
+        return tuple(self._swarm_state.direction[self._row].tolist())
+
+    def setter(self, value):
+        self._swarm_state.direction[self._row] = value
+
+    return property(getter, setter)
+
+
+_array_backed_classes = {}
+
+
+def array_backed(missile_class):
+    """
+    Returns a subclass of missile_class whose numeric fields are stored in the
+    model's SwarmState (model.swarm_state) rather than on the instance.
+    The subclass is created once per missile class and cached.
+    """
+    if missile_class in _array_backed_classes:
+        return _array_backed_classes[missile_class]
+
+    def _register(self, model):
+        # Runs before any field is assigned, so the row exists when the properties are first set
+        self._swarm_state = model.swarm_state
+        self._row = model.swarm_state.allocate()
+        missile_class._register(self, model)
+
+    namespace = {
+        '__slots__': ('_swarm_state', '_row'),
+        '_register': _register,
+        'float_pos': _float_pos_property(),
+        'direction': _direction_property(),
+    }
+    for name, (_, width) in SwarmState.COLUMNS.items():
+        if width == 1:
+            namespace[name] = _scalar_property(name)
+
+    subclass = type(f"ArrayBacked{missile_class.__name__}", (missile_class,), namespace)
+    _array_backed_classes[missile_class] = subclass
+    return subclass
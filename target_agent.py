@@ -1,4 +1,3 @@
-import random
 from mesa import Agent
 
 
@@ -9,24 +8,56 @@ class TargetAgent(Agent):
         self.speed = speed
 
         self.direction = 1
-        self.steps_remaining_in_phase = random.randint(5, 20)
+        # Own stream, so that the manoeuvres for a seed are the same whatever the missiles do
+        self.manoeuvre_random = model.random_stream('target manoeuvres')
+        self.next_pos = None # Synchronous update mode: the move computed in step(), applied in advance()
+        # (start, end) float positions of the last move and the step it was made in, for swept hit checks
+        self.sweep = None
+        self.sweep_step = None
+        self.steps_remaining_in_phase = self.manoeuvre_random.randint(5, 20)
+        self.defence = None # TargetDefence, when the target is defended (see defence.py)
 
     def step(self):
         print(f"[Step {self.model.steps}] Target {self.unique_id} - Starting step. Pos: {self.pos}")
 
         if self.steps_remaining_in_phase <= 0:
             self.direction *= -1
-            self.steps_remaining_in_phase = random.randint(5, 20)
+            self.steps_remaining_in_phase = self.manoeuvre_random.randint(5, 20)
 
-        self.float_y += self.direction * self.speed
+        start_y = self.float_y
+        self.float_y += self.direction * self.speed * self.model.dt
         self.float_y = max(0, min(self.model.grid.height - 1, self.float_y))
+        self.sweep = ((self.pos[0], start_y), (self.pos[0], self.float_y))
+        self.sweep_step = self.model.steps
 
         new_y = int(round(self.float_y))
         new_pos = (self.pos[0], new_y)
 
+        if self.model.synchronous:
+            self.next_pos = new_pos
+        else:
+            self._move_to(new_pos)
+
+        self.steps_remaining_in_phase -= self.model.dt # Phases last a number of time units
+        print(f"[Step {self.model.steps}] Target {self.unique_id} - End step. Pos: {self.pos}")
+
+    def advance(self):
+        """Synchronous update mode: applies the move computed in step()."""
+        if self.next_pos is not None:
+            self._move_to(self.next_pos)
+            self.next_pos = None
+
+    def motion_this_step(self):
+        """
+        (start, end) float position of the target over the current step. If the target has
+        not been stepped yet this step, it is treated as stationary where it is.
+        """
+        if self.sweep_step == self.model.steps:
+            return self.sweep
+        here = (self.pos[0], self.float_y)
+        return here, here
+
+    def _move_to(self, new_pos):
         if new_pos != self.pos:
             self.model.grid.move_agent(self, new_pos)
             self.pos = new_pos
-
-        self.steps_remaining_in_phase -= 1
-        print(f"[Step {self.model.steps}] Target {self.unique_id} - End step. Pos: {self.pos}")
@@ -0,0 +1,19 @@
+from base_agent import MissileAgent
+from headless import quiet_output
+from model import NavalModel
+from swarm_modes import SwarmMode
+
+
+def test_delta_broadcast_tables_fill_under_degraded_comms():
+    """Delayed deliveries go into the neighbour tables, as direct ones do."""
+    with quiet_output():
+        model = NavalModel(swarm_mode=SwarmMode.OVERWHELM, seed=1, broadcast_deltas={},
+                           comms_degradation={'latency': 1})
+        largest = 0
+        for _ in range(300):
+            model.step()
+            for agent in model.agents:
+                if isinstance(agent, MissileAgent) and agent.neighbour_table:
+                    largest = max(largest, len(agent.neighbour_table))
+    assert largest >= 3
+    assert model.comms_engine.counts['delivered'] > 0
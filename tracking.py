@@ -0,0 +1,179 @@
+"""
+Target tracking for the TargetReportingUnit.
+
+TrackManager keeps constant-velocity Kalman filter tracks, with every track's
+state and covariance stored in stacked NumPy arrays so that prediction and
+measurement updates run for all tracks at once. Between sweeps nothing is
+computed: a track is published as a TrackEstimate (filtered position and
+velocity at the time of the last update) and consumers extrapolate it, e.g.
+with intercept_points to aim missiles where the target will be.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# A track as published by a tracking TRU: filtered position and velocity at `time`.
+# Being a namedtuple it is immutable and picklable, like the plain point estimates.
+TrackEstimate = namedtuple('TrackEstimate', ['position', 'velocity', 'time'])
+
+# Measurement matrix: the sensor sees position only
+_H = np.array([[1.0, 0.0, 0.0, 0.0],
+               [0.0, 1.0, 0.0, 0.0]])
+
+
+class TrackManager:
+    """
+    Constant-velocity Kalman tracks over state (x, y, vx, vy). Measurements are associated
+    with the nearest track within a Mahalanobis gate; unmatched measurements start new tracks
+    and tracks that go unconfirmed for max_coast time units are dropped.
+    """
+
+    def __init__(self, measurement_std, process_noise=0.05, initial_speed_std=1.0, gate=13.8, max_coast=30.0):
+        """
+        :param measurement_std: Standard deviation of the position measurement noise (per axis)
+        :param process_noise: Spectral density of the white-noise acceleration the model allows for
+            (covers the target's manoeuvres)
+        :param initial_speed_std: Prior standard deviation of a new track's velocity
+        :param gate: Squared Mahalanobis distance within which a measurement may update a track
+            (13.8 is the 99.9% point for 2 degrees of freedom)
+        :param max_coast: Time without a measurement after which a track is dropped
+        """
+        self.measurement_noise = np.eye(2) * measurement_std ** 2
+        self.process_noise = process_noise
+        self.initial_speed_std = initial_speed_std
+        self.gate = gate
+        self.max_coast = max_coast
+
+        self.states = np.zeros((0, 4))
+        self.covariances = np.zeros((0, 4, 4))
+        self.times = np.zeros(0) # Time each track's state refers to
+        self.last_updates = np.zeros(0) # Time of each track's last measurement
+
+    def __len__(self):
+        return len(self.states)
+
+    def predict(self, time):
+        """Moves every track's state and covariance forward to `time`."""
+        if not len(self):
+            return
+        dt = time - self.times
+        transitions = np.tile(np.eye(4), (len(self), 1, 1))
+        transitions[:, 0, 2] = dt
+        transitions[:, 1, 3] = dt
+
+        # Discrete white-noise acceleration, per axis [[dt^3/3, dt^2/2], [dt^2/2, dt]]
+        q = self.process_noise
+        noise = np.zeros((len(self), 4, 4))
+        for position, velocity in ((0, 2), (1, 3)):
+            noise[:, position, position] = q * dt ** 3 / 3
+            noise[:, position, velocity] = noise[:, velocity, position] = q * dt ** 2 / 2
+            noise[:, velocity, velocity] = q * dt
+
+        self.states = np.einsum('kij,kj->ki', transitions, self.states)
+        self.covariances = transitions @ self.covariances @ transitions.transpose(0, 2, 1) + noise
+        self.times = np.full(len(self), float(time))
+
+    def update(self, time, measurements):
+        """
+        Predicts all tracks to `time`, then folds in the measured positions.
+
+        :param measurements: Sequence of (x, y) positions measured at `time` (may be empty)
+        """
+        self.predict(time)
+        measurements = np.asarray(measurements, dtype=float).reshape(-1, 2)
+
+        unmatched = list(range(len(measurements)))
+        if len(self) and len(measurements):
+            innovations = measurements[None, :, :] - self.states[:, None, :2] # (tracks, measurements, 2)
+            innovation_covariances = _H @ self.covariances @ _H.T + self.measurement_noise # (tracks, 2, 2)
+            inverses = np.linalg.inv(innovation_covariances)
+            distances = np.einsum('kmi,kij,kmj->km', innovations, inverses, innovations)
+
+            # Greedy nearest-neighbour association, closest pairs first
+            tracks, rows = [], []
+            for track, row in zip(*np.unravel_index(np.argsort(distances, axis=None), distances.shape)):
+                if distances[track, row] > self.gate:
+                    break
+                if track in tracks or row in rows:
+                    continue
+                tracks.append(track)
+                rows.append(row)
+
+            if tracks:
+                tracks = np.array(tracks)
+                innovation = innovations[tracks, rows]
+                gains = self.covariances[tracks] @ _H.T @ inverses[tracks] # (matched, 4, 2)
+                self.states[tracks] += np.einsum('kij,kj->ki', gains, innovation)
+                self.covariances[tracks] = (np.eye(4) - gains @ _H) @ self.covariances[tracks]
+                self.last_updates[tracks] = time
+                unmatched = [row for row in unmatched if row not in rows]
+
+        for row in unmatched:
+            self._start_track(time, measurements[row])
+
+        alive = time - self.last_updates <= self.max_coast
+        if not alive.all():
+            self.states, self.covariances = self.states[alive], self.covariances[alive]
+            self.times, self.last_updates = self.times[alive], self.last_updates[alive]
+
+    def _start_track(self, time, position):
+        covariance = np.zeros((4, 4))
+        covariance[:2, :2] = self.measurement_noise
+        covariance[2, 2] = covariance[3, 3] = self.initial_speed_std ** 2
+        self.states = np.vstack([self.states, [position[0], position[1], 0.0, 0.0]])
+        self.covariances = np.concatenate([self.covariances, covariance[None]])
+        self.times = np.append(self.times, float(time))
+        self.last_updates = np.append(self.last_updates, float(time))
+
+    def estimates(self):
+        """Every track as a TrackEstimate, most recently measured first."""
+        order = np.argsort(-self.last_updates, kind='stable')
+        return [
+            TrackEstimate((float(self.states[k, 0]), float(self.states[k, 1])),
+                          (float(self.states[k, 2]), float(self.states[k, 3])), float(self.times[k]))
+            for k in order
+        ]
+
+
+def intercept_points(track, time, pursuer_positions, pursuer_speeds, bounds=None, max_lead=None):
+    """
+    Where each pursuer should aim to meet the target of `track` flying straight at its speed,
+    assuming the target keeps its velocity. Pursuers too slow to catch it aim at its
+    extrapolated position.
+
+    :param track: TrackEstimate
+    :param time: Current time (the track is extrapolated from its own time)
+    :param pursuer_positions: (N, 2) array-like of positions
+    :param pursuer_speeds: (N,) array-like of speeds
+    :param bounds: Optional (width, height); aim points are clipped to the arena, which the target cannot leave
+    :param max_lead: Optional cap on how far ahead (in time) the target is extrapolated, for targets
+        that do not hold their velocity for long
+    :returns: (N, 2) array of aim points
+    """
+    velocity = np.asarray(track.velocity)
+    position = np.asarray(track.position) + velocity * (time - track.time)
+    offsets = position - np.asarray(pursuer_positions, dtype=float) # (N, 2)
+    speeds = np.asarray(pursuer_speeds, dtype=float)
+
+    # |offset + velocity * t| = speed * t  ->  a t^2 + b t + c = 0
+    a = velocity @ velocity - speeds ** 2
+    b = 2 * offsets @ velocity
+    c = np.einsum('ij,ij->i', offsets, offsets)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        root = np.sqrt(b ** 2 - 4 * a * c)
+        candidates = np.stack([(-b - root) / (2 * a), (-b + root) / (2 * a)])
+        # a == 0: equal speeds, the equation is linear
+        linear = np.where(b < 0, -c / b, np.nan)
+    candidates = np.where(np.abs(a) < 1e-12, linear, candidates)
+    candidates = np.where(candidates > 0, candidates, np.inf)
+    times = candidates.min(axis=0)
+    times = np.where(np.isfinite(times), times, 0.0) # Cannot intercept: aim at the target itself
+    if max_lead is not None:
+        times = np.minimum(times, max_lead)
+
+    points = position + velocity * times[:, None]
+    if bounds is not None:
+        width, height = bounds
+        points[:, 0] = np.clip(points[:, 0], 0, width - 1)
+        points[:, 1] = np.clip(points[:, 1], 0, height - 1)
+    return points